@@ -1,10 +1,20 @@
+import copy
+from collections import OrderedDict
+
 from django.contrib.postgres.fields import ArrayField
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Exists, OuterRef
+from django.db.models.constants import LOOKUP_SEP
 from django.utils.module_loading import import_string
 from django_filters import OrderingFilter
 from rest_framework.fields import DateTimeField
 from rest_framework_filters import (
     FilterSet, RelatedFilter, IsoDateTimeFilter, BaseCSVFilter, AutoFilter,
     BooleanFilter)
+from rest_framework_filters.filterset import related
+
+from django_documents_tools.deletion import filter_is_deleted
+from django_documents_tools.utils import memoize_factory
 
 
 UID_LOOKUPS = ('exact', 'gt', 'gte', 'lt', 'lte', 'in', 'isnull')
@@ -25,7 +35,84 @@ class ArrayFilter(BaseCSVFilter, AutoFilter):
         super().__init__(*args, **kwargs)
 
 
-class BaseChangeFilter(FilterSet):
+def _get_exists(model, related_filter, related_queryset):
+    """ Correlated `EXISTS` for a single relation, None for the others """
+
+    try:
+        field = model._meta.get_field(related_filter.field_name)  # noqa: protected-access
+    except FieldDoesNotExist:
+        return None
+
+    if field.concrete and (field.many_to_one or field.one_to_one):
+        to_field_name = getattr(
+            related_filter.field, 'to_field_name', None) or 'pk'
+        return Exists(related_queryset.filter(
+            **{to_field_name: OuterRef(field.attname)}))
+    if field.one_to_many or field.one_to_one:
+        remote_field = field.field
+        outer_ref = OuterRef(remote_field.target_field.attname)
+        return Exists(related_queryset.filter(
+            **{remote_field.name: outer_ref}))
+    return None
+
+
+class ExistsRelatedFilterMixin:
+    """ Applies related filtersets as correlated `EXISTS` semijoins
+
+        Related filtersets get the mixin as well, so nested relations are
+        not compiled into `IN (SELECT ...)` over whole tables either.
+        Many to many relations are still filtered by `IN`.
+    """
+
+    def get_related_filtersets(self):
+        related_filtersets = OrderedDict()
+        for related_name in self.related_filters:
+            if related_name not in self.filters:
+                continue
+
+            related_filter = self.filters[related_name]
+            filterset_class = get_exists_filterset(related_filter.filterset)
+            related_filtersets[related_name] = filterset_class(
+                data=self.data,
+                queryset=related_filter.get_queryset(self.request),
+                relationship=related(self, related_name),
+                request=self.request,
+                prefix=self.form_prefix)
+        return related_filtersets
+
+    def filter_related_filtersets(self, queryset):
+        for related_name, related_filterset in self.related_filtersets.items():
+            prefix = f'{related(self, related_name)}{LOOKUP_SEP}'
+            if not any(value.startswith(prefix) for value in self.data):
+                continue
+
+            related_filter = self.filters[related_name]
+            exists = _get_exists(
+                queryset.model, related_filter, related_filterset.qs)
+            if exists is not None:
+                queryset = queryset.filter(exists)
+                continue
+
+            to_field_name = getattr(
+                related_filter.field, 'to_field_name', 'pk') or 'pk'
+            queryset = queryset.filter(**{
+                f'{related_filter.field_name}__in': (
+                    related_filterset.qs.values(to_field_name))})
+            if self.related_filters[related_name].distinct:
+                queryset = queryset.distinct()
+        return queryset
+
+
+@memoize_factory
+def get_exists_filterset(filterset_class):
+    if issubclass(filterset_class, ExistsRelatedFilterMixin):
+        return filterset_class
+    return type(
+        filterset_class.__name__,
+        (ExistsRelatedFilterMixin, filterset_class), {})
+
+
+class BaseChangeFilter(ExistsRelatedFilterMixin, FilterSet):
     updated = AutoFilter(lookups=DATE_LOOKUPS)
     document_date = AutoFilter(lookups=DATE_LOOKUPS)
     document_name = AutoFilter(lookups=STRING_LOOKUPS)
@@ -44,13 +131,8 @@ class BaseChangeFilter(FilterSet):
 
     @staticmethod
     def filter_is_deleted(queryset, name, value):
-        if value is True:
-            return queryset.filter(deleted__isnull=False)
-
-        if value is False:
-            return queryset.filter(deleted__isnull=True)
-
-        return queryset
+        return filter_is_deleted(
+            queryset, value, queryset.model._documented_model_field)  # noqa: protected-access
 
     class Meta:
         model = None
@@ -60,7 +142,7 @@ class BaseChangeFilter(FilterSet):
             ArrayField: {'filter_class': ArrayFilter}}
 
 
-class BaseSnapshotFilter(FilterSet):
+class BaseSnapshotFilter(ExistsRelatedFilterMixin, FilterSet):
     updated = AutoFilter(lookups=DATE_LOOKUPS)
     history_date = AutoFilter(lookups=DATE_LOOKUPS)
     is_deleted = BooleanFilter(
@@ -75,13 +157,9 @@ class BaseSnapshotFilter(FilterSet):
 
     @staticmethod
     def filter_is_deleted(queryset, name, value):
-        if value is True:
-            return queryset.filter(deleted__isnull=False)
-
-        if value is False:
-            return queryset.filter(deleted__isnull=True)
-
-        return queryset
+        change_model = queryset.model.changes.field.model
+        return filter_is_deleted(
+            queryset, value, change_model._documented_model_field)  # noqa: protected-access
 
     class Meta:
         model = None
@@ -91,7 +169,7 @@ class BaseSnapshotFilter(FilterSet):
             ArrayField: {'filter_class': ArrayFilter}}
 
 
-class DocumentedModelFilterBase(FilterSet):
+class DocumentedModelFilterBase(ExistsRelatedFilterMixin, FilterSet):
     class Meta:
         model = None
         fields = {}
@@ -100,7 +178,7 @@ class DocumentedModelFilterBase(FilterSet):
             ArrayField: {'filter_class': ArrayFilter}}
 
 
-class BaseChangeAttachmentFilter(FilterSet):
+class BaseChangeAttachmentFilter(ExistsRelatedFilterMixin, FilterSet):
     updated = AutoFilter(lookups=DATE_LOOKUPS)
     created = AutoFilter(lookups=DATE_LOOKUPS)
     deleted = AutoFilter(lookups=DATE_LOOKUPS)
@@ -135,7 +213,11 @@ class BaseChangeAttachmentFilter(FilterSet):
 def get_change_filter(model, orig_viewset):
     if model._filterset:  # noqa: protected-access
         return import_string(model._filterset)  # noqa: protected-access
+    return _create_change_filter(model, orig_viewset)
 
+
+@memoize_factory
+def _create_change_filter(model, orig_viewset):
     documented_model = orig_viewset.serializer_class.Meta.model
     documented_field = model._documented_model_field  # noqa: protected-access
     documented_filter = RelatedFilter(
@@ -155,7 +237,11 @@ def get_change_filter(model, orig_viewset):
 def get_snapshot_filter(model, orig_viewset):
     if model._filterset:  # noqa: protected-access
         return import_string(model._filterset)  # noqa: protected-access
+    return _create_snapshot_filter(model, orig_viewset)
+
 
+@memoize_factory
+def _create_snapshot_filter(model, orig_viewset):
     documented_model = orig_viewset.serializer_class.Meta.model
     pk_field_name = model._meta.pk.name  # noqa: protected-access
     documented_field = documented_model._meta.model_name  # noqa: protected-access
@@ -176,7 +262,11 @@ def get_snapshot_filter(model, orig_viewset):
 def get_change_attachment_filter(model, change_filter):
     if model._filterset:  # noqa: protected-access
         return import_string(model._filterset)  # noqa: protected-access
+    return _create_change_attachment_filter(model, change_filter)
 
+
+@memoize_factory
+def _create_change_attachment_filter(model, change_filter):
     meta = type('Meta', (BaseChangeAttachmentFilter.Meta,), {'model': model})
     pk_field_name = model._meta.pk.name  # noqa: protected-access
     change_model = change_filter.Meta.model
@@ -188,3 +278,29 @@ def get_change_attachment_filter(model, change_filter):
     }
     name = f'{model._meta.object_name}Filter'  # noqa: protected-access
     return type(name, (BaseChangeAttachmentFilter, ), attrs)
+
+
+@memoize_factory
+def get_as_of_filter(snapshot_model, documented_filter):
+    """ Filterset of the documented model applied to its snapshots """
+
+    documented_model = documented_filter._meta.model  # noqa: protected-access
+    documented_pk = documented_model._meta.pk.name  # noqa: protected-access
+    documented_field = documented_model._meta.model_name  # noqa: protected-access
+    snapshot_fields = {
+        field.name for field in snapshot_model._meta.get_fields()}  # noqa: protected-access
+
+    attrs = {}
+    for name, base_filter in documented_filter.base_filters.items():
+        field_name, *lookups = base_filter.field_name.split('__')
+        if field_name == documented_pk:
+            field_name = documented_field
+        elif field_name not in snapshot_fields:
+            continue
+        as_of_filter = copy.deepcopy(base_filter)
+        as_of_filter.field_name = '__'.join((field_name, *lookups))
+        attrs[name] = as_of_filter
+
+    attrs['Meta'] = type('Meta', (), {'model': snapshot_model, 'fields': []})
+    name = f'{snapshot_model._meta.object_name}AsOfFilter'  # noqa: protected-access
+    return type(name, (ExistsRelatedFilterMixin, FilterSet), attrs)
@@ -0,0 +1,432 @@
+import csv
+import hashlib
+import json
+
+from django.core.exceptions import (
+    FieldDoesNotExist, ValidationError as DjangoValidationError)
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import DateField, Subquery, Value
+from django.db.models.query import ModelIterable
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+
+from .filters import get_as_of_filter
+from ..manager import _get_next_day_start
+from ..routing import (
+    get_read_db, get_write_db, pin_to_primary, request_scope)
+from ..settings import tools_settings
+
+
+class _Echo:
+    @staticmethod
+    def write(value):
+        return value
+
+
+def _get_export_fields(serializer):
+    """ Returns (name, column) of concrete model fields of the serializer """
+
+    opts = serializer.Meta.model._meta  # noqa: protected-access
+    fields = []
+    for name, serializer_field in serializer.fields.items():
+        source = serializer_field.source
+        if serializer_field.write_only or source == '*' or '.' in source:
+            continue
+        field_name = opts.pk.name if source == 'pk' else source
+        try:
+            field = opts.get_field(field_name)
+        except FieldDoesNotExist:
+            continue
+        if field.concrete and not field.many_to_many:
+            fields.append((name, field.attname))
+    return fields
+
+
+class ExportMixin:
+    """ Streams the filtered queryset as NDJSON or CSV
+
+        Rows are rendered from `values()` read by a server side cursor,
+        so memory stays flat whatever the result size is.
+    """
+
+    export_format_query_param = 'export_format'
+    export_formats = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    def get_export_queryset(self, columns):
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.prefetch_related(None)
+        queryset = queryset.order_by(*self.ordering, 'pk')
+        return queryset.values_list(*columns).iterator(
+            chunk_size=tools_settings.EXPORT_CHUNK_SIZE)
+
+    @staticmethod
+    def render_ndjson(names, rows):
+        encoder = DjangoJSONEncoder()
+        for row in rows:
+            yield encoder.encode(dict(zip(names, row))) + '\n'
+
+    @staticmethod
+    def render_csv(names, rows):
+        encoder = DjangoJSONEncoder()
+        writer = csv.writer(_Echo())
+
+        def to_csv(value):
+            if value is None:
+                return ''
+            if isinstance(value, (list, dict)):
+                return json.dumps(value, cls=DjangoJSONEncoder)
+            if isinstance(value, (str, int, float, bool)):
+                return value
+            return encoder.default(value)
+
+        yield writer.writerow(names)
+        for row in rows:
+            yield writer.writerow([to_csv(value) for value in row])
+
+    @action(detail=False, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        export_format = request.query_params.get(
+            self.export_format_query_param, 'ndjson')
+        if export_format not in self.export_formats:
+            raise ValidationError({
+                self.export_format_query_param: (
+                    f'Unknown format `{export_format}`.')})
+
+        fields = _get_export_fields(self.get_serializer())
+        names = [name for name, _ in fields]
+        rows = self.get_export_queryset([column for _, column in fields])
+        render = getattr(self, f'render_{export_format}')
+        response = StreamingHttpResponse(
+            render(names, rows),
+            content_type=self.export_formats[export_format])
+        model_name = self.get_serializer_class().Meta.model._meta.model_name  # noqa: protected-access
+        response['Content-Disposition'] = (
+            f'attachment; filename="{model_name}.{export_format}"')
+        return response
+
+
+class ConditionalGetMixin:
+    """ Answers list and detail GET with 304 when nothing has changed
+
+        Weak ETag of a list is calculated from the page rows, which are read
+        anyway, so no extra query is run: their `max(updated)` and pks, the
+        next page cursor and the count of the paginator. Detail ETag is
+        `updated` of the requested row. Unchanged responses are not
+        serialized at all. `Last-Modified` has a one second resolution, so
+        it is honoured only once the second of the last modification has
+        passed.
+    """
+
+    last_modified_field = 'updated'
+
+    def get_list_version(self, rows):
+        """ Returns (last modified, version key) of the page rows """
+
+        if not rows:
+            return None, None
+        last_modified = max(
+            getattr(row, self.last_modified_field) for row in rows)
+        pks = ','.join(str(row.pk) for row in rows)
+        version = f'{last_modified.isoformat()}:{pks}'
+        if self.paginator is not None:
+            version = (
+                f'{version}:{self.paginator.get_next_link()}:'
+                f'{getattr(self.paginator, "count", None)}')
+        return last_modified, version
+
+    def get_object_version(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        last_modified = queryset.values_list(
+            self.last_modified_field, flat=True).first()
+        if last_modified is None:
+            return None, None
+        return last_modified, last_modified.isoformat()
+
+    @staticmethod
+    def get_etag(request, version):
+        key = f'{request.get_full_path()}:{version}'
+        return 'W/' + quote_etag(hashlib.md5(key.encode()).hexdigest())
+
+    @staticmethod
+    def get_last_modified_timestamp(last_modified):
+        """ Whole seconds timestamp, None while the second is not over """
+
+        timestamp = int(last_modified.timestamp())
+        if timestamp >= int(timezone.now().timestamp()):
+            return None
+        return timestamp
+
+    def get_conditional_response(self, request, version, view, *args,
+                                 **kwargs):
+        last_modified, version = version
+        if last_modified is None:
+            return view(request, *args, **kwargs)
+
+        etag = self.get_etag(request, version)
+        timestamp = self.get_last_modified_timestamp(last_modified)
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp)  # noqa: protected-access
+        if response is None:
+            response = view(request, *args, **kwargs)
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = list(queryset) if page is None else page
+
+        def render(*_args, **_kwargs):
+            serializer = self.get_serializer(rows, many=True)
+            if page is None:
+                return Response(serializer.data)
+            return self.get_paginated_response(serializer.data)
+
+        return self.get_conditional_response(
+            request, self.get_list_version(rows), render, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            request, self.get_object_version(), super().retrieve,
+            *args, **kwargs)
+
+
+class ReadReplicaMixin:
+    """ Safe requests read history from `read_db` of the model
+
+        With `sticky_after_write` reads following a write go to the primary
+        for the rest of the request and, by a short living cookie, for the
+        next requests of the same client.
+    """
+
+    sticky_cookie_name = 'documents_tools_primary'
+
+    def dispatch(self, request, *args, **kwargs):
+        with request_scope():
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        if request.COOKIES.get(self.sticky_cookie_name):
+            pin_to_primary()
+        super().initial(request, *args, **kwargs)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            return queryset.using(get_read_db(queryset.model))
+        return queryset.using(get_write_db(queryset.model))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        model = self.get_serializer_class().Meta.model
+        if request.method not in SAFE_METHODS and (
+                model._sticky_after_write):  # noqa: protected-access
+            response.set_cookie(
+                self.sticky_cookie_name, '1',
+                max_age=tools_settings.READ_REPLICA_STICKY_SECONDS)
+        return response
+
+
+class TimelineQuerySerializer(serializers.Serializer):  # noqa: abstract-method
+    date_from = serializers.DateTimeField(required=False)
+    date_to = serializers.DateTimeField(required=False)
+
+
+class TimelineMixin:
+    """ Diff encoded history of one documented object
+
+        Returns the state at `date_from` followed by only the changed
+        fields of every later snapshot up to `date_to`.
+    """
+
+    def get_timeline_documented_pk(self, documented_field):
+        model = self.get_serializer_class().Meta.model
+        try:
+            return model._meta.get_field(  # noqa: protected-access
+                documented_field).target_field.to_python(
+                    self.request.query_params[documented_field])
+        except (KeyError, DjangoValidationError):
+            raise ValidationError({documented_field: 'Valid id is required.'})
+
+    def get_timeline_queryset(
+            self, documented_field, documented_pk, date_from, date_to):
+        # Permission and tenant scoping of the viewset applies to timeline
+        queryset = self.get_queryset().prefetch_related(None).filter(
+            **{documented_field: documented_pk}, deleted__isnull=True)
+        if date_from:
+            initial_queryset = queryset
+            if queryset.model.keyframe_interval:
+                # Delta snapshots are folded from the nearest keyframe
+                initial_queryset = queryset.filter(is_keyframe=True)
+            initial_date = initial_queryset.filter(
+                history_date__lte=date_from).order_by(
+                    '-history_date').values('history_date')[:1]
+            queryset = queryset.filter(history_date__gte=Coalesce(
+                Subquery(initial_date), Value(date_from)))
+        if date_to:
+            queryset = queryset.filter(history_date__lte=date_to)
+        return queryset.order_by('history_date')
+
+    @staticmethod
+    def get_timeline(rows, names, date_from):
+        """ Initial state and changes of (history_date, fields, values) """
+
+        initial, timeline, state = None, [], {}
+        for history_date, document_fields, *values in rows:
+            changes = {
+                name: value for name, value in zip(names, values)
+                if name in document_fields and (
+                    name not in state or state[name] != value)}
+            state.update(changes)
+            if initial is None or (date_from and history_date <= date_from):
+                initial = {'history_date': history_date, 'state': dict(state)}
+            elif changes:
+                timeline.append(
+                    {'history_date': history_date, 'changes': changes})
+        return {'initial': initial, 'timeline': timeline}
+
+    @action(detail=False, methods=['get'])
+    def timeline(self, request, *args, **kwargs):
+        model = self.get_serializer_class().Meta.model
+        change_model = model.changes.field.model
+        documented_field = change_model._documented_model_field  # noqa: protected-access
+        query_serializer = TimelineQuerySerializer(data=request.query_params)
+        query_serializer.is_valid(raise_exception=True)
+        date_from = query_serializer.validated_data.get('date_from')
+
+        names = change_model._all_documented_fields  # noqa: protected-access
+        rows = self.get_timeline_queryset(
+            documented_field, self.get_timeline_documented_pk(
+                documented_field),
+            date_from, query_serializer.validated_data.get('date_to'),
+        ).values_list(
+            'history_date', 'document_fields',
+            *(model._meta.get_field(name).attname for name in names))  # noqa: protected-access
+        return Response(self.get_timeline(rows, names, date_from))
+
+
+class _DocumentedIterable(ModelIterable):
+    """ Documented instances of the latest snapshots at `as_of_date`
+
+        States of delta snapshots are folded by one query for all rows.
+    """
+
+    def __iter__(self):
+        snapshots = list(super().__iter__())
+        states = {}
+        deltas = [snapshot for snapshot in snapshots if snapshot.is_delta]
+        if deltas:
+            model = self.queryset.model
+            attname = f'{model.changes.field.model._documented_model_field}_id'  # noqa: protected-access
+            states = model.objects.using(self.queryset.db).as_of_many(
+                [getattr(snapshot, attname) for snapshot in deltas],
+                deltas[0].as_of_date)
+            states = {
+                snapshot.pk: states.get(getattr(snapshot, attname), {})
+                for snapshot in deltas}
+        for snapshot in snapshots:
+            yield snapshot.get_documented_instance(states.get(snapshot.pk))
+
+
+class AsOfMixin:
+    """ Serves a documented viewset from snapshots at `?as_of=<date>`
+
+        The latest non-deleted snapshot of every object is selected by one
+        `DISTINCT ON` subquery and the viewset filterset is applied to the
+        historical values. Columns of delta snapshots hold only their own
+        changes, so filtering of them is refused.
+    """
+
+    snapshot_model = None
+    as_of = None
+
+    @staticmethod
+    def get_as_of(request):
+        query_param = tools_settings.AS_OF_QUERY_PARAM
+        value = request.query_params.get(query_param) if query_param else None
+        if value is None:
+            return None
+        if request.method not in SAFE_METHODS:
+            raise ValidationError({
+                query_param: 'Historical state is read only.'})
+        try:
+            return serializers.DateField().to_internal_value(value)
+        except ValidationError as exc:
+            raise ValidationError({query_param: exc.detail})
+
+    def get_documented_field(self):
+        change_model = self.snapshot_model.changes.field.model
+        return change_model._documented_model_field  # noqa: protected-access
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.as_of = self.get_as_of(request)
+        if self.as_of is None:
+            return
+
+        if self.filterset_class is not None:
+            self.check_as_of_filters(request)
+            self.filterset_class = get_as_of_filter(
+                self.snapshot_model, self.filterset_class)
+        self.lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        self.lookup_field = (
+            f'{self.get_documented_field()}__{self.lookup_field}')
+
+    def check_as_of_filters(self, request):
+        if not self.snapshot_model.keyframe_interval:
+            return
+        filters = set(self.filterset_class.base_filters) & set(
+            request.query_params)
+        if filters:
+            raise ValidationError({
+                tools_settings.AS_OF_QUERY_PARAM: (
+                    'Filtering of delta snapshots is not supported: '
+                    f'{", ".join(sorted(filters))}.')})
+
+    def get_as_of_queryset(self, as_of):
+        """ Snapshots at `as_of` of the objects the viewset queryset sees """
+
+        documented_field = self.get_documented_field()
+        using = get_read_db(self.snapshot_model)
+        documented = super().get_queryset().values('pk')
+        if using:
+            documented = documented.using(using)
+        latest = self.snapshot_model.objects.using(using).filter(
+            **{f'{documented_field}__in': documented},
+            deleted__isnull=True,
+            history_date__lt=_get_next_day_start(as_of),
+        ).order_by(documented_field, '-history_date').distinct(
+            documented_field).values('pk')
+
+        snapshot_fields = {
+            field.name for field in self.snapshot_model._meta.get_fields()}  # noqa: protected-access
+        select_related_fields = [
+            name for name in getattr(self, 'select_related_fields', ())
+            if name.split('__')[0] in snapshot_fields]
+        queryset = self.snapshot_model.objects.using(using).filter(
+            pk__in=latest).select_related(*select_related_fields).annotate(
+                as_of_date=Value(as_of, output_field=DateField()))
+        queryset._iterable_class = _DocumentedIterable  # noqa: protected-access
+        return queryset
+
+    def get_queryset(self):
+        if self.as_of is None:
+            return super().get_queryset()
+        return self.get_as_of_queryset(self.as_of)
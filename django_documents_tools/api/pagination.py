@@ -0,0 +1,188 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.template import loader
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from ..settings import tools_settings
+
+
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATED = 'estimated'
+
+
+def get_estimated_count(queryset):
+    """ Row count estimated by the query planner """
+
+    sql, params = queryset.order_by().values('pk').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(BasePagination):
+    """ Keyset pagination over `(ordering field, pk)`
+
+        Pages are selected by the last seen key instead of an offset and
+        total count is not calculated, so every page costs the same
+        whatever its depth is.
+
+        Total count is opt-in by `PAGINATION_COUNT` setting: `exact` runs
+        `COUNT(*)`, `estimated` takes the planner estimate and counts exactly
+        only below `ESTIMATED_COUNT_THRESHOLD` rows.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    ordering_field = None
+    count_strategy = None
+    estimated_count_threshold = None
+    template = 'rest_framework/pagination/previous_and_next.html'
+
+    def __init__(self):
+        self.count = None
+        self.count_is_estimated = False
+        self.base_url = None
+        self.page_size_value = None
+        self.ordering = None
+        self.next_key = None
+
+    def get_ordering_field(self, view):
+        if self.ordering_field:
+            return self.ordering_field
+        return view.ordering[0]
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True, cutoff=self.max_page_size)
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_count_strategy(self):
+        return self.count_strategy or tools_settings.PAGINATION_COUNT
+
+    def get_estimated_count_threshold(self):
+        if self.estimated_count_threshold is not None:
+            return self.estimated_count_threshold
+        return tools_settings.ESTIMATED_COUNT_THRESHOLD
+
+    def get_count(self, queryset):
+        """ Returns (count, is estimated) or (None, False) """
+
+        count_strategy = self.get_count_strategy()
+        if count_strategy == COUNT_ESTIMATED:
+            count = get_estimated_count(queryset)
+            if count >= self.get_estimated_count_threshold():
+                return count, True
+        elif count_strategy != COUNT_EXACT:
+            return None, False
+        return queryset.order_by().count(), False
+
+    @staticmethod
+    def encode_cursor(value, obj_pk):
+        cursor = json.dumps([str(value), str(obj_pk)])
+        return b64encode(cursor.encode('ascii')).decode('ascii')
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        field_name = self.ordering.lstrip('-')
+        try:
+            value, obj_pk = json.loads(b64decode(encoded.encode('ascii')))
+            value = model._meta.get_field(field_name).to_python(value)  # noqa: protected-access
+            obj_pk = model._meta.pk.to_python(obj_pk)  # noqa: protected-access
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return value, obj_pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size_value = self.get_page_size(request)
+        if not self.page_size_value:
+            return None
+
+        if self.template is not None:
+            self.display_page_controls = True
+        self.base_url = request.build_absolute_uri()
+        self.count, self.count_is_estimated = self.get_count(queryset)
+        self.ordering = self.get_ordering_field(view)
+        field_name = self.ordering.lstrip('-')
+        is_reversed = self.ordering.startswith('-')
+        pk_ordering = '-pk' if is_reversed else 'pk'
+        queryset = queryset.order_by(self.ordering, pk_ordering)
+
+        cursor = self.decode_cursor(request, queryset.model)
+        if cursor:
+            value, obj_pk = cursor
+            lookup = 'lt' if is_reversed else 'gt'
+            queryset = queryset.filter(**{
+                f'{field_name}__{lookup}e': value}).filter(
+                    Q(**{f'{field_name}__{lookup}': value})
+                    | Q(**{field_name: value, f'pk__{lookup}': obj_pk}))
+
+        results = list(queryset[:self.page_size_value + 1])
+        page = results[:self.page_size_value]
+        self.next_key = None
+        if len(results) > self.page_size_value:
+            last = page[-1]
+            self.next_key = (getattr(last, field_name), last.pk)
+        return page
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        return replace_query_param(
+            self.base_url, self.cursor_query_param,
+            self.encode_cursor(*self.next_key))
+
+    def get_html_context(self):
+        return {'previous_url': None, 'next_url': self.get_next_link()}
+
+    def to_html(self):
+        template = loader.get_template(self.template)
+        return template.render(self.get_html_context())
+
+    def get_paginated_response(self, data):
+        response = OrderedDict([('next', self.get_next_link())])
+        if self.count is not None:
+            response['count'] = self.count
+            response['count_is_estimated'] = self.count_is_estimated
+        response['results'] = data
+        return Response(response)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'count': {
+                    'type': 'integer',
+                },
+                'count_is_estimated': {
+                    'type': 'boolean',
+                },
+                'results': schema,
+            },
+        }
@@ -1,16 +1,73 @@
 from rest_framework.routers import DefaultRouter
 
 from .viewsets import (
-    get_change_viewset, get_snapshot_viewset, get_change_attachment_viewset)
+    get_change_viewset, get_snapshot_viewset, get_change_attachment_viewset,
+    get_change_model, get_base_viewset, get_as_of_viewset, BaseChangeViewSet,
+    BaseSnapshotViewSet, BaseChangeAttachmentViewSet)
+from ..settings import tools_settings
 
 
 def _get_viewset_name(viewset):
     return viewset.serializer_class.Meta.model._meta.model_name  # noqa: protected-access
 
 
+class LazyView:
+    """ View building the real viewset class on first dispatch
+
+        `cls` is resolved on access as well, so schema generators
+        get the real viewset.
+    """
+
+    csrf_exempt = True
+
+    def __init__(self, get_viewset, actions, initkwargs):
+        self._get_viewset = get_viewset
+        self._view = None
+        self.actions = actions
+        self.initkwargs = initkwargs
+
+    def get_view(self):
+        if self._view is None:
+            self._view = self._get_viewset().as_view(
+                self.actions, **self.initkwargs)
+        return self._view
+
+    @property
+    def cls(self):
+        return self.get_view().cls
+
+    def __call__(self, request, *args, **kwargs):
+        view = self.get_view()
+        return view(request, *args, **kwargs)
+
+
+def get_lazy_viewset(model, base_viewset, get_viewset):
+    """ Placeholder with the routes of `base_viewset` """
+
+    def as_view(cls, actions=None, **initkwargs):
+        return LazyView(get_viewset, actions, initkwargs)
+
+    attrs = {
+        'as_view': classmethod(as_view),
+        'get_viewset': staticmethod(get_viewset),
+        '__doc__': base_viewset.__doc__}
+    name = f'Lazy{model._meta.object_name}ViewSet'  # noqa: protected-access
+    return type(name, (base_viewset, ), attrs)
+
+
 class DocumentedRouter(DefaultRouter):
 
+    def __init__(self, *args, lazy=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if lazy is None:
+            lazy = tools_settings.LAZY_DOCUMENTED_VIEWSETS
+        self.lazy = lazy
+
     def register_viewsets(self, orig_viewset):
+        if self.lazy:
+            self.register_lazy_viewsets(orig_viewset)
+            return
+
         change_viewset = get_change_viewset(orig_viewset)
         if change_viewset:
             name = _get_viewset_name(change_viewset)
@@ -29,7 +86,40 @@ class DocumentedRouter(DefaultRouter):
                 super().register(
                     f'{name}-list', change_attachment_viewset, name)
 
+    def register_lazy_viewsets(self, orig_viewset):
+        change_model = get_change_model(orig_viewset)
+        if change_model is None:
+            return
+
+        def get_change():
+            return get_change_viewset(orig_viewset)
+
+        def get_snapshot():
+            return get_snapshot_viewset(get_change(), orig_viewset)
+
+        def get_change_attachment():
+            return get_change_attachment_viewset(get_change())
+
+        snapshot_model = change_model.snapshot.field.related_model
+        change_attachment_model = change_model.attachment.field.related_model
+        lazy_viewsets = (
+            (change_model, get_change, tools_settings.BASE_CHANGE_VIEWSET,
+             BaseChangeViewSet),
+            (snapshot_model, get_snapshot,
+             tools_settings.BASE_SNAPSHOT_VIEWSET, BaseSnapshotViewSet),
+            (change_attachment_model, get_change_attachment,
+             tools_settings.BASE_CHANGE_ATTACHMENT_VIEWSET,
+             BaseChangeAttachmentViewSet))
+        for model, get_viewset, default_base, original in lazy_viewsets:
+            base_viewset = get_base_viewset(model, default_base, original)
+            name = model._meta.model_name  # noqa: protected-access
+            super().register(
+                f'{name}-list',
+                get_lazy_viewset(model, base_viewset, get_viewset), name)
+
     def register(self, prefix, viewset, basename=None):
         if getattr(viewset, 'allow_changes', True):
             self.register_viewsets(viewset)
+            if getattr(viewset, 'allow_as_of', False):
+                viewset = get_as_of_viewset(viewset)
         super().register(prefix, viewset, basename)
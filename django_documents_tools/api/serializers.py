@@ -1,9 +1,13 @@
+import functools
+
 from rest_framework import serializers
+from django.core.exceptions import FieldDoesNotExist
 from django.db import models
 from django.utils.module_loading import import_string
 
 from django_documents_tools.utils import (
-    check_subclass, validate_change_attrs, LimitedChoicesValidator)
+    check_subclass, validate_change_attrs, LimitedChoicesValidator,
+    memoize_factory)
 from ..settings import tools_settings
 
 
@@ -63,7 +67,58 @@ def clone_serializer_field(field, **kwargs):
     return type(field)(*field._args, **{**field._kwargs, **kwargs})  # noqa: protected-access
 
 
-def get_change_serializer_class(model, serializer_class, allowed_fields=None):  # noqa: to-many-locals
+def _get_nested_relations(serializer_class, model):
+    """ Yields (name, serializer, model field, many) of nested model
+        serializers backed by a relation of the model """
+
+    fields = getattr(serializer_class.Meta, 'fields', ())
+    for name, field in serializer_class._declared_fields.items():  # noqa: protected-access
+        if fields != serializers.ALL_FIELDS and name not in fields:
+            continue
+        nested_many = isinstance(field, serializers.ListSerializer)
+        if nested_many:
+            field = field.child
+        if not isinstance(field, serializers.ModelSerializer):
+            continue
+        source = field.source or name
+        if source == '*' or '.' in source:
+            continue
+        try:
+            model_field = model._meta.get_field(source)  # noqa: protected-access
+        except FieldDoesNotExist:
+            continue
+        if model_field.is_relation:
+            yield source, field, model_field, nested_many
+
+
+def _get_related_fields(serializer_class, model, prefix='', many=False):
+    select_related, prefetch_related = [], []
+    nested_relations = _get_nested_relations(serializer_class, model)
+    for source, field, model_field, nested_many in nested_relations:
+        lookup = f'{prefix}{source}'
+        is_many = (
+            many or nested_many
+            or model_field.many_to_many or model_field.one_to_many)
+        if is_many:
+            prefetch_related.append(lookup)
+        else:
+            select_related.append(lookup)
+        nested_select, nested_prefetch = _get_related_fields(
+            type(field), model_field.related_model, f'{lookup}__', is_many)
+        select_related.extend(nested_select)
+        prefetch_related.extend(nested_prefetch)
+    return tuple(select_related), tuple(prefetch_related)
+
+
+@functools.lru_cache(maxsize=None)
+def get_serializer_related_fields(serializer_class):
+    """ Returns `select_related` and `prefetch_related` lookups required
+        by nested model serializers """
+
+    return _get_related_fields(serializer_class, serializer_class.Meta.model)
+
+
+def get_change_serializer_class(model, serializer_class, allowed_fields=None):
     """ Generating target model based change serializer
 
         1. Creating target model fk serializer field
@@ -78,6 +133,15 @@ def get_change_serializer_class(model, serializer_class, allowed_fields=None):
             tools_settings.BASE_CHANGE_SERIALIZER)
     check_subclass(base_change_serializer, BaseChangeSerializer)
 
+    if allowed_fields is not None:
+        allowed_fields = tuple(allowed_fields)
+    return _create_change_serializer_class(
+        model, serializer_class, base_change_serializer, allowed_fields)
+
+
+@memoize_factory
+def _create_change_serializer_class(  # noqa: to-many-locals
+        model, serializer_class, base_change_serializer, allowed_fields):
     opts = model._meta  # noqa: protected-access
     change_attachment_model = model.attachment.field.related_model
     documented_field = model._documented_model_field  # noqa: protected-access
@@ -129,7 +193,11 @@ def get_documented_model_serializer(model):
     base = import_string(
         tools_settings.BASE_DOCUMENTED_MODEL_LINK_SERIALIZER)
     check_subclass(base, BaseDocumentedModelLinkSerializer)
+    return _create_documented_model_serializer(model, base)
 
+
+@memoize_factory
+def _create_documented_model_serializer(model, base):
     attrs = {
         'Meta': type(
             'Meta', (base.Meta,),
@@ -145,7 +213,13 @@ def get_snapshot_serializer(model, change_serializer):
         base_snapshot_serializer = import_string(
             tools_settings.BASE_SNAPSHOT_SERIALIZER)
     check_subclass(base_snapshot_serializer, BaseSnapshotSerializer)
+    return _create_snapshot_serializer(
+        model, change_serializer, base_snapshot_serializer)
+
 
+@memoize_factory
+def _create_snapshot_serializer(
+        model, change_serializer, base_snapshot_serializer):
     change_model = change_serializer.Meta.model
     documented_model_field = change_model._documented_model_field  # noqa: protected-access
     documented_model = getattr(
@@ -167,17 +241,17 @@ def get_snapshot_serializer(model, change_serializer):
 def get_snapshot_link_serializer(model):
     base = import_string(tools_settings.BASE_SNAPSHOT_LINK_SERIALIZER)
     check_subclass(base, BaseSnapshotLinkSerializer)
-
-    meta_opts = {'model': model, 'fields': base.Meta.fields}
-    meta = type('Meta', (base.Meta,), meta_opts)
-    name = f'{model._meta.object_name}LinkSerializer'  # noqa: protected-access
-    return type(name, (base,), {'Meta': meta})
+    return _create_link_serializer(model, base)
 
 
 def get_change_attachment_link_serializer(model):
     base = import_string(tools_settings.BASE_CHANGE_ATTACHMENT_LINK_SERIALIZER)
     check_subclass(base, BaseChangeAttachmentLinkSerializer)
+    return _create_link_serializer(model, base)
 
+
+@memoize_factory
+def _create_link_serializer(model, base):
     meta_opts = {'model': model, 'fields': base.Meta.fields}
     meta = type('Meta', (base.Meta,), meta_opts)
     name = f'{model._meta.object_name}LinkSerializer'  # noqa: protected-access
@@ -193,7 +267,13 @@ def get_change_attachment_serializer(model):
             tools_settings.BASE_CHANGE_ATTACHMENT_SERIALIZER)
     check_subclass(
         base_change_attachment_serializer, BaseChangeAttachmentSerializer)
+    return _create_change_attachment_serializer(
+        model, base_change_attachment_serializer)
+
 
+@memoize_factory
+def _create_change_attachment_serializer(
+        model, base_change_attachment_serializer):
     fields = base_change_attachment_serializer.Meta.fields
     meta_opts = {'model': model, 'fields': fields}
     meta = type('Meta', (base_change_attachment_serializer.Meta,), meta_opts)
@@ -1,12 +1,16 @@
 from rest_framework.viewsets import ModelViewSet
 from django.utils.module_loading import import_string
 
-from django_documents_tools.utils import check_subclass
+from django_documents_tools.utils import check_subclass, memoize_factory
+from .mixins import (
+    AsOfMixin, ExportMixin, ConditionalGetMixin, ReadReplicaMixin,
+    TimelineMixin)
+from .pagination import KeysetPagination
 from .filters import (
     get_change_filter, get_snapshot_filter, get_change_attachment_filter)
 from .serializers import (
     get_change_serializer_class, get_snapshot_serializer,
-    get_change_attachment_serializer)
+    get_change_attachment_serializer, get_serializer_related_fields)
 from ..settings import tools_settings
 
 
@@ -18,22 +22,42 @@ class BaseDocumentedViewSet(ModelViewSet):
     serializer_class = None
     filterset_class = None
     select_related_fields = ()
+    prefetch_related_fields = ()
+
+    def get_related_fields(self):
+        select_related, prefetch_related = get_serializer_related_fields(
+            self.serializer_class)
+        select_related = (*self.select_related_fields, *select_related)
+        prefetch_related = (*self.prefetch_related_fields, *prefetch_related)
+        return (
+            tuple(dict.fromkeys(select_related)),
+            tuple(dict.fromkeys(prefetch_related)))
 
     def get_queryset(self):
         queryset = self.serializer_class.Meta.model.objects.all()
-        if self.select_related_fields:
-            queryset = queryset.select_related(*self.select_related_fields)
+        select_related_fields, prefetch_related_fields = (
+            self.get_related_fields())
+        if select_related_fields:
+            queryset = queryset.select_related(*select_related_fields)
+        if prefetch_related_fields:
+            queryset = queryset.prefetch_related(*prefetch_related_fields)
         return queryset
 
 
-class BaseChangeViewSet(BaseDocumentedViewSet):
+class BaseChangeViewSet(
+        ConditionalGetMixin, ExportMixin, ReadReplicaMixin,
+        BaseDocumentedViewSet):
     allow_history = True
 
+    pagination_class = KeysetPagination
     ordering = ('document_date', )
     search_fields = ('document_name', )
 
 
-class BaseSnapshotViewSet(BaseDocumentedViewSet):
+class BaseSnapshotViewSet(
+        ConditionalGetMixin, ExportMixin, TimelineMixin, ReadReplicaMixin,
+        BaseDocumentedViewSet):
+    pagination_class = KeysetPagination
     ordering = ('history_date',)
     search_fields = ('changes__document_name',)
 
@@ -43,7 +67,17 @@ class BaseChangeAttachmentViewSet(BaseDocumentedViewSet):
     select_related_fields = ('change',)
 
 
-def get_change_viewset(documented_viewset):
+def get_base_viewset(model, default_path, original):
+    if model._base_viewset:  # noqa: protected-access
+        base_viewset = import_string(model._base_viewset)  # noqa: protected-access
+    else:
+        base_viewset = import_string(default_path)
+
+    check_subclass(base_viewset, original)
+    return base_viewset
+
+
+def get_change_model(documented_viewset):
     if not getattr(documented_viewset, '_allowed_changes', True):
         return None
     documented_serializer = documented_viewset.serializer_class
@@ -51,14 +85,16 @@ def get_change_viewset(documented_viewset):
     document_manager = getattr(documented_model, 'changes', None)
     if document_manager is None:
         return None
-    model = document_manager.model
+    return document_manager.model
 
-    if model._base_viewset:  # noqa: protected-access
-        base_change_viewset = import_string(model._base_viewset)  # noqa: protected-access
-    else:
-        base_change_viewset = import_string(tools_settings.BASE_CHANGE_VIEWSET)
 
-    check_subclass(base_change_viewset, BaseChangeViewSet)
+def get_change_viewset(documented_viewset):
+    model = get_change_model(documented_viewset)
+    if model is None:
+        return None
+
+    base_change_viewset = get_base_viewset(
+        model, tools_settings.BASE_CHANGE_VIEWSET, BaseChangeViewSet)
 
     document_serializer = get_change_serializer_class(
         model, documented_viewset.serializer_class)
@@ -68,7 +104,15 @@ def get_change_viewset(documented_viewset):
     select_related_fields = (
         model._documented_model_field, # noqa: protected-access
         *documented_viewset.select_related_fields)
+    return _create_change_viewset(
+        model, base_change_viewset, document_serializer, document_filter,
+        select_related_fields)
+
 
+@memoize_factory
+def _create_change_viewset(
+        model, base_change_viewset, document_serializer, document_filter,
+        select_related_fields):
     attrs = {'serializer_class': document_serializer,
              'filterset_class': document_filter,
              'select_related_fields': select_related_fields,
@@ -82,21 +126,25 @@ def get_snapshot_viewset(change_viewset, documented_viewset):
     change_model = change_serializer.Meta.model
     snapshot_model = change_model._meta.get_field('snapshot').related_model  # noqa: protected-access
 
-    if snapshot_model._base_viewset:  # noqa: protected-access
-        base_snapshot_viewset = import_string(snapshot_model._base_viewset)  # noqa: protected-access
-    else:
-        base_snapshot_viewset = import_string(
-            tools_settings.BASE_SNAPSHOT_VIEWSET)
-
-    check_subclass(base_snapshot_viewset, BaseSnapshotViewSet)
+    base_snapshot_viewset = get_base_viewset(
+        snapshot_model, tools_settings.BASE_SNAPSHOT_VIEWSET,
+        BaseSnapshotViewSet)
 
     snapshot_serializer = get_snapshot_serializer(
         snapshot_model, change_serializer)
     snapshot_filter = get_snapshot_filter(snapshot_model, documented_viewset)
+    return _create_snapshot_viewset(
+        snapshot_model, base_snapshot_viewset, snapshot_serializer,
+        snapshot_filter, change_viewset.select_related_fields)
 
+
+@memoize_factory
+def _create_snapshot_viewset(
+        snapshot_model, base_snapshot_viewset, snapshot_serializer,
+        snapshot_filter, select_related_fields):
     attrs = {'serializer_class': snapshot_serializer,
              'filterset_class': snapshot_filter,
-             'select_related_fields': change_viewset.select_related_fields,
+             'select_related_fields': select_related_fields,
              '__doc__': base_snapshot_viewset.__doc__}
 
     name = f'{snapshot_model._meta.object_name}ViewSet'  # noqa: protected-access
@@ -112,17 +160,21 @@ def get_change_attachment_viewset(change_viewset):
     change_attachment_serializer = get_change_attachment_serializer(
         change_attachment_model)
 
-    if change_attachment_model._base_viewset:  # noqa: protected-access
-        base_change_attachment_viewset = import_string(
-            change_attachment_model._base_viewset)  # noqa: protected-access
-    else:
-        base_change_attachment_viewset = import_string(
-            tools_settings.BASE_CHANGE_ATTACHMENT_VIEWSET)
-
-    check_subclass(base_change_attachment_viewset, BaseChangeAttachmentViewSet)
+    base_change_attachment_viewset = get_base_viewset(
+        change_attachment_model, tools_settings.BASE_CHANGE_ATTACHMENT_VIEWSET,
+        BaseChangeAttachmentViewSet)
 
     change_attachment_filter = get_change_attachment_filter(
         change_attachment_model, change_filter)
+    return _create_change_attachment_viewset(
+        change_attachment_model, base_change_attachment_viewset,
+        change_attachment_serializer, change_attachment_filter)
+
+
+@memoize_factory
+def _create_change_attachment_viewset(
+        change_attachment_model, base_change_attachment_viewset,
+        change_attachment_serializer, change_attachment_filter):
     attrs = {
         'serializer_class': change_attachment_serializer,
         'filterset_class': change_attachment_filter,
@@ -131,3 +183,19 @@ def get_change_attachment_viewset(change_viewset):
 
     name = f'{change_attachment_model._meta.object_name}ViewSet'  # noqa: protected-access
     return type(name, (base_change_attachment_viewset,), attrs)
+
+
+def get_as_of_viewset(documented_viewset):
+    change_model = get_change_model(documented_viewset)
+    if change_model is None or not tools_settings.AS_OF_QUERY_PARAM:
+        return documented_viewset
+    snapshot_model = change_model._meta.get_field('snapshot').related_model  # noqa: protected-access
+    return _create_as_of_viewset(documented_viewset, snapshot_model)
+
+
+@memoize_factory
+def _create_as_of_viewset(documented_viewset, snapshot_model):
+    attrs = {'snapshot_model': snapshot_model,
+             '__doc__': documented_viewset.__doc__}
+    name = documented_viewset.__name__
+    return type(name, (AsOfMixin, documented_viewset), attrs)
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class DjangoDocumentsToolsConfig(AppConfig):
@@ -6,4 +7,4 @@ class DjangoDocumentsToolsConfig(AppConfig):
 
     def ready(self):
         from .import signals  # noqa: import-outside-toplevel
-        assert signals
+        post_migrate.connect(signals.process_migrate, sender=self)
@@ -0,0 +1,148 @@
+import time
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .models import BaseSnapshot
+from .settings import tools_settings
+
+
+def get_archived_models():
+    """ Change and snapshot models with archive tables, changes first """
+
+    models = [
+        model for model in apps.get_models()
+        if getattr(model, '_archive_model', None)]
+    return sorted(
+        models, key=lambda model: issubclass(model, BaseSnapshot))
+
+
+def _get_documented_field(model):
+    if issubclass(model, BaseSnapshot):
+        model = model.changes.field.model
+    return model._documented_model_field  # noqa: protected-access
+
+
+def _get_columns(model, quote):
+    return ', '.join(
+        quote(field.column) for field in model._meta.concrete_fields)  # noqa: protected-access
+
+
+def _get_unreferenced_condition(model, quote):
+    """ Snapshots still linked to live changes have to stay in place """
+
+    if not issubclass(model, BaseSnapshot):
+        return ''
+
+    change_model = model.changes.field.model
+    change_table = quote(change_model._meta.db_table)  # noqa: protected-access
+    snapshot_column = quote(change_model._meta.get_field('snapshot').column)  # noqa: protected-access
+    pk_column = quote(model._meta.pk.column)  # noqa: protected-access
+    return (
+        f'AND NOT EXISTS (SELECT 1 FROM {change_table} c '
+        f'WHERE c.{snapshot_column} = s.{pk_column}) ')
+
+
+def _get_replication_lag(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT COALESCE(MAX(pg_wal_lsn_diff('
+            'pg_current_wal_lsn(), replay_lsn)), 0) FROM pg_stat_replication')
+        return cursor.fetchone()[0]
+
+
+def _throttle(connection, delay, max_replication_lag):
+    if delay:
+        time.sleep(delay)
+    if max_replication_lag is None:
+        return
+    while _get_replication_lag(connection) > max_replication_lag:
+        time.sleep(max(delay, 1))
+
+
+def _get_move_sql(quote, source_table, target_table, columns, condition,
+                  pk_column, archived):
+    target_columns, values = columns, columns
+    if archived:
+        target_columns = f'{columns}, {quote("archived")}'
+        values = f'{columns}, now()'
+    return (
+        f'WITH moved AS ('
+        f'DELETE FROM {quote(source_table)} WHERE {pk_column} IN ('
+        f'SELECT s.{pk_column} FROM {quote(source_table)} s '
+        f'WHERE {condition}'
+        f'LIMIT %s FOR UPDATE SKIP LOCKED) '
+        f'RETURNING {columns}) '
+        f'INSERT INTO {quote(target_table)} ({target_columns}) '
+        f'SELECT {values} FROM moved')
+
+
+def _move_rows(connection, source_table, target_table, columns, condition,
+               params, batch_size, delay, max_replication_lag, pk_column,
+               archived=False):
+    """ Moves rows matching `condition` in batches, returns their number """
+
+    sql = _get_move_sql(
+        connection.ops.quote_name, source_table, target_table, columns,
+        condition, pk_column, archived)
+    moved = 0
+    while True:
+        with connection.cursor() as cursor:
+            cursor.execute(sql, (*params, batch_size))
+            rowcount = cursor.rowcount
+        moved += rowcount
+        if rowcount < batch_size:
+            return moved
+        _throttle(connection, delay, max_replication_lag)
+
+
+def archive_deleted_history(
+        model, before, batch_size=None, delay=None, max_replication_lag=None,
+        using=DEFAULT_DB_ALIAS):
+    """ Moves rows soft deleted before `before` into the archive table
+
+        Every batch is a single `DELETE ... RETURNING` / `INSERT` statement
+        committed on its own, batches are separated by `delay` seconds and
+        wait while replicas lag behind more than `max_replication_lag`
+        bytes of WAL.
+    """
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    archive_model = model._archive_model  # noqa: protected-access
+    pk_column = quote(model._meta.pk.column)  # noqa: protected-access
+    condition = (
+        f's.{quote("deleted")} < %s '
+        f'{_get_unreferenced_condition(model, quote)}')
+    return _move_rows(
+        connection, model._meta.db_table, archive_model._meta.db_table,  # noqa: protected-access
+        _get_columns(model, quote), condition, (before,),
+        batch_size or tools_settings.ARCHIVE_BATCH_SIZE,
+        tools_settings.ARCHIVE_BATCH_DELAY if delay is None else delay,
+        max_replication_lag, pk_column, archived=True)
+
+
+def restore_archived_history(
+        model, documented_pks=None, batch_size=None, delay=None,
+        using=DEFAULT_DB_ALIAS):
+    """ Moves archived rows back, all or of the given documented objects
+
+        Snapshots have to be restored before their changes.
+    """
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    archive_model = model._archive_model  # noqa: protected-access
+    pk_column = quote(model._meta.pk.column)  # noqa: protected-access
+    condition, params = 'TRUE ', ()
+    if documented_pks is not None:
+        field = model._meta.get_field(_get_documented_field(model))  # noqa: protected-access
+        # Command line ids are strings, a `text[]` does not compare to uuid
+        condition = f's.{quote(field.column)} = ANY(%s) '
+        params = ([field.target_field.to_python(pk) for pk in documented_pks],)
+    return _move_rows(
+        connection, archive_model._meta.db_table, model._meta.db_table,  # noqa: protected-access
+        _get_columns(model, quote), condition, params,
+        batch_size or tools_settings.ARCHIVE_BATCH_SIZE,
+        tools_settings.ARCHIVE_BATCH_DELAY if delay is None else delay,
+        None, pk_column)
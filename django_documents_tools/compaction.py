@@ -0,0 +1,127 @@
+from datetime import date, timedelta
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .manager import setattrs
+from .settings import tools_settings
+
+
+EPOCH = date(1970, 1, 1)
+
+
+def _get_unit_size(retention, age):
+    """ The coarsest unit size of the tiers older than `age` """
+
+    unit_sizes = [
+        unit_size for older_than_days, unit_size in retention
+        if age > older_than_days]
+    return max(unit_sizes, default=None)
+
+
+def _get_groups(snapshots, retention, today):
+    groups = {}
+    for snapshot in snapshots:
+        history_date = snapshot.history_date.date()
+        unit_size = _get_unit_size(retention, (today - history_date).days)
+        if unit_size is None:
+            continue
+        bucket = (history_date - EPOCH).days // unit_size
+        groups.setdefault((unit_size, bucket), []).append(snapshot)
+    return [group for group in groups.values() if len(group) > 1]
+
+
+def _get_merged_state(survivor, removed):
+    """ State the survivor has to store, None if it is already complete """
+
+    if not survivor.is_delta:
+        return None
+    if any(snapshot.is_keyframe for snapshot in removed):
+        survivor.is_keyframe = True
+        return survivor.state
+
+    state = {}
+    for snapshot in (*removed, survivor):
+        state.update(snapshot.own_state)
+    return state
+
+
+def _merge(snapshot_model, group, using):
+    *removed, survivor = sorted(group, key=lambda item: item.history_date)
+    state = _get_merged_state(survivor, removed)
+    if state is not None:
+        setattrs(survivor, **state)
+        survivor.document_fields = list(state)
+    survivor.save(using=using)
+
+    removed_pks = [snapshot.pk for snapshot in removed]
+    change_model = snapshot_model.changes.field.model
+    change_model.objects.using(using).filter(
+        snapshot__in=removed_pks).update(
+            snapshot=survivor,
+            updated=Greatest(F('updated'), survivor.updated))
+    snapshot_model.objects.using(using).filter(pk__in=removed_pks).delete()
+    return len(removed_pks)
+
+
+def compact_snapshots(documented_model, retention=None, today=None,
+                      batch_size=None, using=DEFAULT_DB_ALIAS):
+    """ Merges old snapshots into coarser buckets
+
+        `retention` is a sequence of `(older_than_days, unit_size_in_days)`
+        tiers, `retention` snapshot option by default. The latest snapshot
+        of every bucket survives, changes of the merged snapshots are
+        linked to it. Every documented object is compacted in its own
+        transaction. Returns the number of deleted snapshots.
+    """
+
+    change_model = documented_model.changes.model
+    snapshot_model = change_model.snapshot.field.related_model
+    retention = retention or snapshot_model._retention  # noqa: protected-access
+    if not retention:
+        return 0
+
+    today = today or timezone.now().date()
+    batch_size = batch_size or tools_settings.COMPACTION_BATCH_SIZE
+    documented_field = snapshot_model._meta.get_field(  # noqa: protected-access
+        documented_model._meta.model_name)  # noqa: protected-access
+    min_age = min(older_than_days for older_than_days, _ in retention)
+    snapshots_qs = snapshot_model.objects.using(using).filter(
+        deleted__isnull=True,
+        history_date__date__lt=today - timedelta(days=min_age))
+    documented_pks = snapshots_qs.order_by(
+        documented_field.attname).values_list(
+            documented_field.attname, flat=True).distinct()
+
+    removed = 0
+    batch = []
+    for documented_pk in documented_pks.iterator(chunk_size=batch_size):
+        batch.append(documented_pk)
+        if len(batch) == batch_size:
+            removed += _compact_batch(
+                snapshots_qs, documented_field, batch, retention, today, using)
+            batch = []
+    if batch:
+        removed += _compact_batch(
+            snapshots_qs, documented_field, batch, retention, today, using)
+    return removed
+
+
+def _compact_batch(
+        snapshots_qs, documented_field, documented_pks, retention, today,
+        using):
+    snapshots_by_object = {}
+    snapshots = snapshots_qs.filter(**{
+        f'{documented_field.attname}__in': documented_pks})
+    for snapshot in snapshots.order_by('history_date'):
+        snapshots_by_object.setdefault(
+            getattr(snapshot, documented_field.attname), []).append(snapshot)
+
+    removed = 0
+    for object_snapshots in snapshots_by_object.values():
+        with transaction.atomic(using=using):
+            for group in _get_groups(object_snapshots, retention, today):
+                removed += _merge(snapshots_qs.model, group, using)
+    return removed
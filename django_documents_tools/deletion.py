@@ -0,0 +1,85 @@
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .settings import tools_settings
+
+
+def is_history_deletion_deferred():
+    """ History of deleted objects is marked after the object is saved """
+
+    return bool(
+        tools_settings.DELETE_CASCADE_DEFERRED
+        or tools_settings.DELETE_CASCADE_ASYNC)
+
+
+def filter_live_history(queryset, documented_field):
+    """ History not deleted, the one of objects being cascaded included """
+
+    queryset = queryset.filter(deleted__isnull=True)
+    if is_history_deletion_deferred():
+        queryset = queryset.filter(
+            **{f'{documented_field}__deleted__isnull': True})
+    return queryset
+
+
+def filter_is_deleted(queryset, value, documented_field):
+    """ Deleted history includes the one of deleted objects being cascaded """
+
+    deleted = Q(deleted__isnull=False)
+    if is_history_deletion_deferred():
+        deleted |= Q(**{f'{documented_field}__deleted__isnull': False})
+
+    if value is True:
+        return queryset.filter(deleted)
+
+    if value is False:
+        return queryset.exclude(deleted)
+
+    return queryset
+
+
+def soft_delete_history(documented_model, documented_pk, deletion_time,
+                        batch_size=None, using=DEFAULT_DB_ALIAS):
+    """ Marks snapshots and changes of the deleted object in bounded chunks
+
+        Every chunk is updated in its own transaction, so row locks are held
+        for a single chunk only. Returns the number of updated rows.
+    """
+
+    change_model = documented_model.changes.model
+    snapshot_model = change_model.snapshot.field.related_model
+    documented_field = change_model._documented_model_field  # noqa: protected-access
+    batch_size = batch_size or tools_settings.DELETE_CASCADE_BATCH_SIZE
+
+    updated = 0
+    for model in (snapshot_model, change_model):
+        history_qs = model.objects.using(using).filter(
+            deleted__isnull=True, **{documented_field: documented_pk})
+        while True:
+            with transaction.atomic(using=using):
+                pks = list(history_qs.values_list('pk', flat=True)[
+                    :batch_size])
+                if not pks:
+                    break
+                updated += history_qs.filter(pk__in=pks).update(
+                    deleted=deletion_time, updated=deletion_time)
+    return updated
+
+
+def schedule_history_deletion(instance, deletion_time, using):
+    """ Runs the chunked cascade once the deletion is committed """
+
+    def cascade():
+        if tools_settings.DELETE_CASCADE_ASYNC:
+            # Looked up by path, tasks import this module
+            soft_delete_documented_history = import_string(
+                'django_documents_tools.tasks.soft_delete_documented_history')
+            soft_delete_documented_history.delay(
+                instance._meta.label, str(instance.pk),  # noqa: protected-access
+                deletion_time.isoformat(), using)
+        else:
+            soft_delete_history(
+                type(instance), instance.pk, deletion_time, using=using)
+
+    transaction.on_commit(cascade, using=using)
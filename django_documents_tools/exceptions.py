@@ -12,3 +12,7 @@ class ChangesAreNotCreatedYetError(Exception):
 
 class BusinessEntityCreationIsNotAllowedError(Exception):
     pass
+
+
+class TableIsReferencedError(Exception):
+    pass
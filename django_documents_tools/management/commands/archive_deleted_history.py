@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from django_documents_tools.archive import (
+    archive_deleted_history, get_archived_models, restore_archived_history)
+
+
+def _get_before(options):
+    if options['before']:
+        before = parse_datetime(options['before'])
+        if before is None:
+            raise CommandError('--before has to be an ISO datetime')
+        return before
+    if options['older_than_days'] is not None:
+        return timezone.now() - timedelta(days=options['older_than_days'])
+    raise CommandError('Either --before or --older-than-days is required')
+
+
+class Command(BaseCommand):
+    help = 'Moves soft deleted changes and snapshots into archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--before', help='Archive rows deleted before this ISO datetime')
+        parser.add_argument(
+            '--older-than-days', type=int,
+            help='Archive rows deleted more than this number of days ago')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument(
+            '--delay', type=float, help='Seconds to sleep between batches')
+        parser.add_argument(
+            '--max-replication-lag', type=int,
+            help='Wait while replicas lag behind more WAL bytes than this')
+        parser.add_argument(
+            '--restore', action='store_true',
+            help='Move archived rows back instead')
+        parser.add_argument(
+            '--documented-id', action='append', dest='documented_ids',
+            help='Restore history of the given documented objects only')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            self._restore(options)
+        else:
+            self._archive(options)
+
+    def _archive(self, options):
+        before = _get_before(options)
+        for model in get_archived_models():
+            moved = archive_deleted_history(
+                model, before, batch_size=options['batch_size'],
+                delay=options['delay'],
+                max_replication_lag=options['max_replication_lag'],
+                using=options['database'])
+            self.stdout.write(
+                f'Archived {moved} rows of {model._meta.label}')  # noqa: protected-access
+
+    def _restore(self, options):
+        for model in reversed(get_archived_models()):
+            moved = restore_archived_history(
+                model, documented_pks=options['documented_ids'],
+                batch_size=options['batch_size'], delay=options['delay'],
+                using=options['database'])
+            self.stdout.write(
+                f'Restored {moved} rows of {model._meta.label}')  # noqa: protected-access
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from django_documents_tools.state_docs import (
+    backfill_state_docs, get_state_doc_models)
+
+
+class Command(BaseCommand):
+    help = 'Fills state_doc of snapshots created before it was enabled'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        for model in get_state_doc_models():
+            updated = backfill_state_docs(
+                model, batch_size=options['batch_size'],
+                using=options['database'])
+            self.stdout.write(
+                f'Updated {updated} snapshots of {model._meta.label}')  # noqa: protected-access
@@ -0,0 +1,24 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+from django_documents_tools.partitioning import create_partitions
+
+
+class Command(BaseCommand):
+    help = 'Creates future partitions of partitioned change/snapshot tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=3,
+            help='Number of periods to create after the current one')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        for model in apps.get_models():
+            if not getattr(model, '_partitioning', None):
+                continue
+            created = create_partitions(
+                model, ahead=options['ahead'], using=options['database'])
+            for name in created:
+                self.stdout.write(f'Created partition {name}')
@@ -0,0 +1,60 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db.migrations import Migration
+from django.db.migrations.autodetector import MigrationAutodetector
+from django.db.migrations.loader import MigrationLoader
+from django.db.migrations.writer import MigrationWriter
+
+from django_documents_tools.partitioning import PartitionTable
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates a migration partitioning the tables of change/snapshot '
+        'models declared with `partitioning` option')
+
+    def add_arguments(self, parser):
+        parser.add_argument('app_label')
+        parser.add_argument('--name', default='partition_tables')
+
+    @staticmethod
+    def get_partitioned_models(loader, app_label):
+        partitioned = {
+            operation.model_name.lower()
+            for (migration_app, _), migration in loader.disk_migrations.items()
+            if migration_app == app_label
+            for operation in migration.operations
+            if isinstance(operation, PartitionTable)}
+        return [
+            model for model in apps.get_app_config(app_label).get_models()
+            if getattr(model, '_partitioning', None)
+            and model._meta.model_name not in partitioned]  # noqa: protected-access
+
+    def handle(self, *args, **options):
+        app_label = options['app_label']
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+        leaf_nodes = loader.graph.leaf_nodes(app_label)
+        if not leaf_nodes:
+            raise CommandError(
+                f'App `{app_label}` has to have its tables created by a '
+                f'migration first')
+
+        models = self.get_partitioned_models(loader, app_label)
+        if not models:
+            self.stdout.write('No changes detected')
+            return
+
+        number = MigrationAutodetector.parse_number(leaf_nodes[0][1]) or 0
+        migration = Migration(
+            f'{number + 1:04d}_{options["name"]}', app_label)
+        migration.dependencies = leaf_nodes
+        migration.operations = [
+            PartitionTable(
+                model._meta.model_name,  # noqa: protected-access
+                model._partitioning['field'])  # noqa: protected-access
+            for model in models]
+
+        writer = MigrationWriter(migration)
+        with open(writer.path, 'w', encoding='utf-8') as migration_file:
+            migration_file.write(writer.as_string())
+        self.stdout.write(f'Created {writer.path}')
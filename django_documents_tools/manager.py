@@ -1,16 +1,25 @@
 from __future__ import unicode_literals
 
+import asyncio
 import logging
-from datetime import timedelta, datetime
+from datetime import time, timedelta, datetime
 from itertools import chain
 
-from django.db import models
-from django.db.models import Q
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connections, models
+from django.db.models import F, Min, OuterRef, Q, Subquery
+from django.db.models.fields.related_descriptors import (
+    ReverseManyToOneDescriptor)
+from django.db.models.functions import Greatest
 from django.utils import timezone
 
+from .deletion import filter_live_history, is_history_deletion_deferred
 from .exceptions import (
     ObservableInstanceRequiredError,
     SnapshotDuplicateExistsError, ChangesAreNotCreatedYetError)
+from .routing import get_read_db, get_write_db
+from .settings import tools_settings
 from .signals import change_applied
 
 LOGGER = logging.getLogger(__name__)
@@ -50,7 +59,117 @@ def _get_first_and_last_date_borders(query_set, field_name):
     return first_date, last_date
 
 
-def _update_snapshot_via_previous(prev_snapshot, snapshot):
+class ChangeRecord:
+    """ Change row read by the snapshot engine, values by field name
+
+        Related objects are kept as their pk.
+    """
+
+    __slots__ = ('change_pk', 'document_date', 'document_fields', 'values')
+
+    def __init__(self, change_pk, document_date, document_fields, values):
+        self.change_pk = change_pk
+        self.document_date = document_date
+        self.document_fields = document_fields
+        self.values = values
+
+    def get_documented_fields(self):
+        return [
+            field for field in self.document_fields if field in self.values]
+
+    def get_snapshot_changes(self):
+        return {
+            field: self.values[field]
+            for field in self.get_documented_fields()}
+
+
+def get_change_records(changes_qs):
+    """ Yields changes of the queryset as `ChangeRecord`
+
+        Distinct `document_fields` are read first, rows are then read
+        with only the columns referenced by the changes.
+    """
+
+    change_model = changes_qs.model
+    opts = change_model._meta  # noqa: protected-access
+    documented_fields = set(change_model._all_documented_fields)  # noqa: protected-access
+    referenced = sorted({
+        field for document_fields in changes_qs.order_by().values_list(
+            'document_fields', flat=True).distinct()
+        for field in document_fields or () if field in documented_fields})
+
+    attnames = [opts.get_field(name).attname for name in referenced]
+    rows = changes_qs.values_list(
+        'pk', 'document_date', 'document_fields', *attnames)
+    for change_pk, document_date, document_fields, *values in rows.iterator():
+        yield ChangeRecord(
+            change_pk, document_date, document_fields or (),
+            dict(zip(referenced, values)))
+
+
+def _get_attname_state(model, state):
+    opts = model._meta  # noqa: protected-access
+    return {
+        opts.get_field(name).attname: value for name, value in state.items()}
+
+
+def get_last_changes(previous, changes):
+    """ Per field date and change of the latest change touching it """
+
+    last_changes = dict(previous or {})
+    for change in changes:
+        for field_name in change.get_documented_fields():
+            last_changes[field_name] = {
+                'date': change.document_date.isoformat(),
+                'change': str(change.change_pk)}
+    return last_changes
+
+
+def _update_last_changes_via_previous(prev_snapshot, snapshot, begin_border):
+    """ Own entries of the snapshot are the ones dated in its bucket
+
+        Changes of previous snapshots are dated before `begin_border`, so
+        changes of the snapshot are not read again.
+    """
+
+    last_changes = dict(prev_snapshot.last_changes or {})
+    last_changes.update({
+        field_name: last_change
+        for field_name, last_change in (snapshot.last_changes or {}).items()
+        if datetime.fromisoformat(last_change['date']).date() >= begin_border})
+    if last_changes == snapshot.last_changes:
+        return False
+    snapshot.last_changes = last_changes
+    return True
+
+
+def _update_state_doc_via_previous(prev_snapshot, snapshot):
+    if snapshot.is_delta:
+        state_doc = {
+            **prev_snapshot.state_doc,
+            **snapshot.get_state_doc(snapshot.own_state)}
+    else:
+        state_doc = snapshot.get_state_doc(snapshot.state)
+    if state_doc == snapshot.state_doc:
+        return False
+    snapshot.state_doc = state_doc
+    return True
+
+
+def _update_snapshot_via_previous(prev_snapshot, snapshot, begin_border):
+    last_changes_changed = (
+        snapshot._last_changes  # noqa: protected-access
+        and _update_last_changes_via_previous(
+            prev_snapshot, snapshot, begin_border))
+    if snapshot.is_delta:
+        # Delta snapshots store only their own changes
+        state_doc_changed = (
+            snapshot._state_doc  # noqa: protected-access
+            and _update_state_doc_via_previous(prev_snapshot, snapshot))
+        if last_changes_changed or state_doc_changed:
+            snapshot.save(using=snapshot._state.db)  # noqa: protected-access
+        return
+
     d_fields = snapshot.document_fields_from_changes
     prev_d_fields = prev_snapshot.document_fields_from_changes
     prev_d_fields = prev_d_fields | set(prev_snapshot.document_fields)
@@ -63,7 +182,334 @@ def _update_snapshot_via_previous(prev_snapshot, snapshot):
     if changed:
         updated_fields = set(snapshot.document_fields) | set(changed)
         snapshot.document_fields = list(updated_fields)
-        snapshot.save()
+    state_doc_changed = (
+        snapshot._state_doc  # noqa: protected-access
+        and _update_state_doc_via_previous(prev_snapshot, snapshot))
+    if changed or last_changes_changed or state_doc_changed:
+        snapshot.save(using=snapshot._state.db)  # noqa: protected-access
+
+
+class HistoryQuerySet(models.QuerySet):
+    """ Reads from `_read_db` of the model and writes to its `_write_db` """
+
+    @property
+    def db(self):
+        if self._db:
+            return self._db
+        if self._for_write:
+            alias = get_write_db(self.model)
+        else:
+            alias = get_read_db(self.model)
+        return alias or super().db
+
+    def primary(self):
+        """ Reads which are followed by writes, e.g. recalculation """
+
+        clone = self._chain()
+        clone._for_write = True  # noqa: protected-access
+        return clone
+
+
+def _get_next_day_start(date):
+    if isinstance(date, datetime):
+        raise TypeError('You need to provide a date instance')
+    next_day_start = datetime.combine(date + timedelta(days=1), time.min)
+    if settings.USE_TZ:
+        return timezone.make_aware(next_day_start)
+    return next_day_start
+
+
+def _fold_state(state, snapshot):
+    """ State after `snapshot`, deltas update the previous one """
+
+    if snapshot.is_delta:
+        return {**state, **snapshot.own_state}
+    return snapshot.own_state
+
+
+class SnapshotQuerySet(HistoryQuerySet):
+    """ Point in time reads of snapshots, sync and async
+
+        States are folded from the nearest keyframe read by one query with
+        related fields selected, so async iteration does not touch the
+        database per snapshot. With `state_doc` the `*_docs` methods read
+        whole states by `values_list` without model instances.
+    """
+
+    def _get_documented_field(self):
+        return self.model.changes.field.model._documented_model_field  # noqa: protected-access
+
+    def _get_snapshots(self, date):
+        snapshots = filter_live_history(self, self._get_documented_field())
+        if date is not None:
+            snapshots = snapshots.filter(
+                history_date__lt=_get_next_day_start(date))
+        return snapshots
+
+    def _get_start_date(self, snapshots, keyframes=True):
+        """ Date of the latest complete snapshot of the outer object """
+
+        documented_field = self._get_documented_field()
+        snapshots = snapshots.filter(
+            **{documented_field: OuterRef(documented_field)})
+        if keyframes and self.model.keyframe_interval:
+            snapshots = snapshots.filter(is_keyframe=True)
+        return Subquery(snapshots.order_by('-history_date').values(
+            'history_date')[:1])
+
+    def _select_related(self, snapshots):
+        documented_field = self._get_documented_field()
+        return snapshots.select_related(*(
+            field.name for field in self.model._meta.concrete_fields  # noqa: protected-access
+            if field.is_relation and field.name != documented_field))
+
+    def _get_as_of_queryset(self, pks, date):
+        documented_field = self._get_documented_field()
+        snapshots = self._get_snapshots(date).filter(
+            **{f'{documented_field}__in': pks})
+        snapshots = snapshots.filter(
+            history_date__gte=self._get_start_date(snapshots))
+        return self._select_related(
+            snapshots.order_by(documented_field, 'history_date'))
+
+    def _get_as_of_docs_queryset(self, pks, date):
+        documented_field = self._get_documented_field()
+        return self._get_snapshots(date).filter(
+            **{f'{documented_field}__in': pks}).order_by(
+                documented_field, '-history_date').distinct(
+                    documented_field).values_list(
+                        f'{documented_field}_id', 'state_doc')
+
+    def as_of_many(self, pks, date):
+        """ States of the documented objects at the end of `date` by pk """
+
+        attname = f'{self._get_documented_field()}_id'
+        states = {}
+        for snapshot in self._get_as_of_queryset(pks, date):
+            states.setdefault(
+                getattr(snapshot, attname), {}).update(snapshot.own_state)
+        return states
+
+    async def aas_of_many(self, pks, date):
+        attname = f'{self._get_documented_field()}_id'
+        states = {}
+        async for snapshot in self._get_as_of_queryset(pks, date):
+            states.setdefault(
+                getattr(snapshot, attname), {}).update(snapshot.own_state)
+        return states
+
+    def _get_states_docs(self, states):
+        return {
+            obj_pk: self.model.get_state_doc(state)
+            for obj_pk, state in states.items()}
+
+    def as_of_docs(self, pks, date):
+        """ `as_of_many` of `state_doc` models as JSON documents
+
+            Documents of the latest snapshots are read without folding
+            deltas; objects whose document is empty, e.g. not backfilled
+            yet, are folded.
+        """
+
+        docs = dict(self._get_as_of_docs_queryset(pks, date))
+        missing = [obj_pk for obj_pk, doc in docs.items() if not doc]
+        if missing:
+            docs.update(self._get_states_docs(self.as_of_many(missing, date)))
+        return docs
+
+    async def aas_of_docs(self, pks, date):
+        docs = {
+            obj_pk: state_doc async for obj_pk, state_doc in
+            self._get_as_of_docs_queryset(pks, date)}
+        missing = [obj_pk for obj_pk, doc in docs.items() if not doc]
+        if missing:
+            docs.update(self._get_states_docs(
+                await self.aas_of_many(missing, date)))
+        return docs
+
+    def _get_diff_queryset(self, pks, date_from, date_to):
+        documented_field = self._get_documented_field()
+        snapshots = self._get_snapshots(date_to).filter(
+            **{f'{documented_field}__in': pks})
+        start_date = self._get_start_date(self._get_snapshots(date_from))
+        if self.model.keyframe_interval:
+            # Deltas in between are folded, they carry only changed fields
+            snapshots = snapshots.filter(
+                Q(history_date__gte=start_date)
+                | Q(history_date__gte=_get_next_day_start(date_from)))
+        else:
+            end_date = self._get_start_date(snapshots)
+            snapshots = snapshots.filter(
+                Q(history_date=start_date) | Q(history_date=end_date))
+        return self._select_related(
+            snapshots.order_by(documented_field, 'history_date'))
+
+    def _get_diff_docs_queryset(self, pks, date_from, date_to):
+        documented_field = self._get_documented_field()
+        snapshots = self._get_snapshots(date_to).filter(
+            **{f'{documented_field}__in': pks})
+        start_date = self._get_start_date(
+            self._get_snapshots(date_from), keyframes=False)
+        end_date = self._get_start_date(snapshots, keyframes=False)
+        return snapshots.filter(
+            Q(history_date=start_date) | Q(history_date=end_date)).order_by(
+                documented_field, 'history_date').values_list(
+                    f'{documented_field}_id', 'history_date', 'state_doc')
+
+    @staticmethod
+    def _fold_diff_doc(folded, obj_pk, history_date, state_doc, border):
+        old, new, _ = folded.get(obj_pk, ({}, {}, set()))
+        if history_date < border:
+            old = state_doc
+        new = state_doc
+        folded[obj_pk] = (old, new, set(old) | set(new))
+
+    @staticmethod
+    def _fold_diff(folded, obj_pk, snapshot, border):
+        old, new, touched = folded.get(obj_pk, ({}, {}, set()))
+        new = _fold_state(new, snapshot)
+        if snapshot.history_date < border:
+            old = new
+        else:
+            touched = touched | set(snapshot.document_fields)
+        folded[obj_pk] = (old, new, touched)
+
+    @staticmethod
+    def _get_diff(folded):
+        diff = {}
+        for obj_pk, (old, new, touched) in folded.items():
+            changes = {
+                field: (old.get(field), new.get(field)) for field in touched
+                if old.get(field) != new.get(field)}
+            if changes:
+                diff[obj_pk] = changes
+        return diff
+
+    def _get_diff_docs(self, diff):
+        diff_docs = {}
+        for obj_pk, changes in diff.items():
+            old = self.model.get_state_doc({
+                field: values[0] for field, values in changes.items()})
+            new = self.model.get_state_doc({
+                field: values[1] for field, values in changes.items()})
+            diff_docs[obj_pk] = {
+                field: (old[field], new[field]) for field in changes}
+        return diff_docs
+
+    def diff(self, pks, date_from, date_to):
+        """ `{pk: {field: (old, new)}}` between the ends of two dates
+
+            Only the bounding snapshots, plus deltas in between, are read
+            by one query; fields out of `document_fields` of later
+            snapshots are not compared. Unchanged objects are omitted.
+        """
+
+        border = _get_next_day_start(date_from)
+        attname = f'{self._get_documented_field()}_id'
+        folded = {}
+        for snapshot in self._get_diff_queryset(pks, date_from, date_to):
+            self._fold_diff(
+                folded, getattr(snapshot, attname), snapshot, border)
+        return self._get_diff(folded)
+
+    async def adiff(self, pks, date_from, date_to):
+        border = _get_next_day_start(date_from)
+        attname = f'{self._get_documented_field()}_id'
+        folded = {}
+        async for snapshot in self._get_diff_queryset(
+                pks, date_from, date_to):
+            self._fold_diff(
+                folded, getattr(snapshot, attname), snapshot, border)
+        return self._get_diff(folded)
+
+    def diff_docs(self, pks, date_from, date_to):
+        """ `diff` of `state_doc` models compared by JSON documents
+
+            Only the documents of the bounding snapshots are read; objects
+            with an empty document are folded.
+        """
+
+        border = _get_next_day_start(date_from)
+        folded, missing = {}, set()
+        for obj_pk, history_date, state_doc in (
+                self._get_diff_docs_queryset(pks, date_from, date_to)):
+            if not state_doc:
+                missing.add(obj_pk)
+            self._fold_diff_doc(
+                folded, obj_pk, history_date, state_doc, border)
+        diff = self._get_diff({
+            obj_pk: item for obj_pk, item in folded.items()
+            if obj_pk not in missing})
+        if missing:
+            diff.update(self._get_diff_docs(
+                self.diff(missing, date_from, date_to)))
+        return diff
+
+    async def adiff_docs(self, pks, date_from, date_to):
+        border = _get_next_day_start(date_from)
+        folded, missing = {}, set()
+        async for obj_pk, history_date, state_doc in (
+                self._get_diff_docs_queryset(pks, date_from, date_to)):
+            if not state_doc:
+                missing.add(obj_pk)
+            self._fold_diff_doc(
+                folded, obj_pk, history_date, state_doc, border)
+        diff = self._get_diff({
+            obj_pk: item for obj_pk, item in folded.items()
+            if obj_pk not in missing})
+        if missing:
+            diff.update(self._get_diff_docs(
+                await self.adiff(missing, date_from, date_to)))
+        return diff
+
+    def _get_history_queryset(self, date_from, date_to):
+        snapshots = self._get_snapshots(date_to)
+        if date_from is not None:
+            start_date = self._get_start_date(self._get_snapshots(date_from))
+            snapshots = snapshots.filter(
+                Q(history_date__gte=start_date)
+                | Q(history_date__gte=_get_next_day_start(date_from)))
+        return self._select_related(snapshots.order_by('history_date'))
+
+    @staticmethod
+    def _fold_history(state, snapshot, border, pending):
+        """ Folds the snapshot, returns the new state and states to yield
+
+            States before `border` are folded only, the last of them is
+            yielded along with the first one after.
+        """
+
+        state = _fold_state(state, snapshot)
+        item = (snapshot.history_date, state)
+        if border is not None and snapshot.history_date < border:
+            return state, item, []
+        return state, None, [*([pending] if pending else []), item]
+
+    def history(self, date_from=None, date_to=None):
+        """ Yields `(history_date, state)` of a single object in order
+
+            The first state is the one at the end of `date_from`.
+        """
+
+        border = date_from and _get_next_day_start(date_from)
+        state, pending = {}, None
+        for snapshot in self._get_history_queryset(date_from, date_to):
+            state, pending, items = self._fold_history(
+                state, snapshot, border, pending)
+            yield from items
+        if pending:
+            yield pending
+
+    async def ahistory(self, date_from=None, date_to=None):
+        border = date_from and _get_next_day_start(date_from)
+        state, pending = {}, None
+        async for snapshot in self._get_history_queryset(date_from, date_to):
+            state, pending, items = self._fold_history(
+                state, snapshot, border, pending)
+            for item in items:
+                yield item
+        if pending:
+            yield pending
 
 
 class ChangeDescriptor:
@@ -96,21 +542,27 @@ class SnapshotCalculator:
         self._changes_qs = changes_qs
         self._change_model = changes_qs.model
         self._rel_to_documented_obj = rel_to_documented_obj
+        self._using = snapshots_qs.db
+        self._previous_snapshot = None
 
     def _update_changes(self, snapshot, changes):
-        for change in changes:
-            change.snapshot = snapshot
-            self._change_model.objects.filter(
-                pk=change.pk).update(snapshot=snapshot)
+        # Relinked changes are bumped to the snapshot, so list versions
+        # change, while a change edited meanwhile stays ahead of it
+        self._change_model.objects.using(self._using).filter(
+            pk__in=[change.change_pk for change in changes]).exclude(
+                snapshot=snapshot).update(
+                    snapshot=snapshot,
+                    updated=Greatest(F('updated'), snapshot.updated))
 
     def _calculate_snapshot(self, changes, snapshot_state):
-        snapshot_state = snapshot_state.copy()
         snapshot = self._snapshots_qs.first()
         if snapshot and not changes:
             snapshot.deleted = timezone.now()
-            snapshot.save()
+            snapshot.save(using=self._using)
             return snapshot
 
+        snapshot_state = _get_attname_state(
+            self._snapshots_qs.model, snapshot_state)
         snapshot_state.update(self._rel_to_documented_obj)
         if snapshot:
             snapshot_state['deleted'] = None
@@ -121,27 +573,68 @@ class SnapshotCalculator:
         return snapshot
 
     def _get_initial_snapshot_state(self):
-        query_set = (self._snapshots_qs.model.objects.filter(
+        query_set = (self._snapshots_qs.model.objects.using(
+            self._using).filter(
             history_date__lt=self.history_date,
             deleted__isnull=True,
             **self._rel_to_documented_obj)
             .order_by('history_date'))
         snapshot = query_set.last()
+        self._previous_snapshot = snapshot
         if snapshot:
-            return snapshot.state
+            return snapshot.get_state(raw=True)
         return {}
 
+    def _is_keyframe_required(self, keyframe_interval):
+        snapshots_qs = self._snapshots_qs.model.objects.using(
+            self._using).filter(
+                history_date__lt=self.history_date,
+                deleted__isnull=True,
+                **self._rel_to_documented_obj)
+        keyframe_date = snapshots_qs.filter(is_keyframe=True).order_by(
+            '-history_date').values_list('history_date', flat=True).first()
+        if keyframe_date is None:
+            return True
+        deltas_count = snapshots_qs.filter(
+            history_date__gt=keyframe_date).count()
+        return deltas_count + 1 >= keyframe_interval
+
+    def _set_keyframe(self, snapshot, changed_fields):
+        if snapshot._state.adding:  # noqa: protected-access
+            snapshot.is_keyframe = self._is_keyframe_required(
+                snapshot.keyframe_interval)
+        if snapshot.is_keyframe:
+            return
+
+        for field_name in snapshot.document_fields:
+            if field_name not in changed_fields:
+                setattr(snapshot, field_name, None)
+        snapshot.document_fields = [
+            field_name for field_name in snapshot.document_fields
+            if field_name in changed_fields]
+
     def calculate_snapshot(self):
         changes = []
+        changed_fields = set()
         snapshot_state = self._get_initial_snapshot_state()
         changes_qs = self._changes_qs.filter(deleted__isnull=True)
-        for change in changes_qs:
-            snapshot_state.update(change.get_snapshot_changes())
+        for change in get_change_records(changes_qs):
+            snapshot_changes = change.get_snapshot_changes()
+            snapshot_state.update(snapshot_changes)
+            changed_fields.update(snapshot_changes)
             changes.append(change)
 
         snapshot = self._calculate_snapshot(changes, snapshot_state)
         snapshot.document_fields = list(snapshot_state.keys())
-        snapshot.save()
+        if snapshot.keyframe_interval:
+            self._set_keyframe(snapshot, changed_fields)
+        if snapshot._last_changes:  # noqa: protected-access
+            snapshot.last_changes = get_last_changes(
+                getattr(self._previous_snapshot, 'last_changes', None),
+                changes)
+        if snapshot._state_doc:  # noqa: protected-access
+            snapshot.state_doc = snapshot.get_state_doc(snapshot_state)
+        snapshot.save(using=self._using)
         self._update_changes(snapshot, changes)
         return snapshot
 
@@ -160,45 +653,88 @@ class SnapshotsSlicer:
         self._allowed_latest_date = allowed_latest_date
         self._changes_order_field = changes_order_field
         self._snapshots_order_field = snapshots_order_field
-        self._snapshots = []
+        # Only the last calculated snapshot is needed by the next bucket
+        self._latest_snapshot = None
+        self._compacted_borders = set()
+
+    def _get_compacted_ranges(self):
+        """ Returns `{first change date: end border}` of compacted snapshots
+
+            A snapshot merged by compaction keeps the changes of the removed
+            ones, so its bucket starts at the earliest of them. Changes
+            edited after the snapshot are not linked yet and do not count.
+        """
+
+        live_changes = Q(
+            changes__deleted__isnull=True,
+            changes__document_is_draft=False,
+            changes__updated__lte=F('updated'))
+        snapshots_qs = self._initial_snapshots_qs.filter(
+            deleted__isnull=True).annotate(
+                first_change_date=Min(
+                    'changes__document_date', filter=live_changes)).filter(
+                        first_change_date__lt=F('history_date'))
+        unit_size = timedelta(days=self._unit_size_in_days)
+        return {
+            first_change_date.date(): history_date.date() + unit_size
+            for history_date, first_change_date in snapshots_qs.values_list(
+                'history_date', 'first_change_date')}
 
     def _get_date_borders(self, first_doc_date, last_doc_date):
         begin_border = first_doc_date
         allowed_latest_date = self._allowed_latest_date or last_doc_date
         if first_doc_date != allowed_latest_date:
             end_border = begin_border + timedelta(days=self._unit_size_in_days)
+            compacted_ranges = self._get_compacted_ranges()
         else:
             end_border = begin_border
+            compacted_ranges = {}
 
         all_doc_dates = self._get_all_date_borders(
             begin_border, allowed_latest_date)
         while begin_border <= allowed_latest_date:
-            for doc_date in all_doc_dates:
-                if begin_border <= doc_date.date() <= end_border:
-                    yield begin_border, end_border
-                    break
+            compacted_end = next((
+                end for begin, end in compacted_ranges.items()
+                if begin_border <= begin < end_border), None)
+            if compacted_end:
+                # The whole compacted range is a single bucket, otherwise
+                # the merged snapshots would be calculated again
+                end_border = compacted_end
+                self._compacted_borders.add((begin_border, end_border))
+                yield begin_border, end_border
+            else:
+                for doc_date in all_doc_dates:
+                    if begin_border <= doc_date.date() <= end_border:
+                        yield begin_border, end_border
+                        break
             begin_border = end_border
             end_border = begin_border + timedelta(days=self._unit_size_in_days)
 
     def _get_all_date_borders(self, begin_border, end_border):
         changes_qs = self._initial_changes_qs.order_by(
             self._changes_order_field)
+        # Plain ranges instead of `__date` let the planner prune partitions
+        next_day = end_border + timedelta(days=1)
         changes_qs = changes_qs.filter(
-            document_is_draft=False, document_date__date__gte=begin_border,
-            document_date__date__lte=end_border)
+            document_is_draft=False, document_date__gte=begin_border,
+            document_date__lt=next_day)
         snapshots_qs = self._initial_snapshots_qs.order_by(
             self._snapshots_order_field)
         snapshots_qs = snapshots_qs.filter(
-            history_date__date__gte=begin_border,
-            history_date__date__lte=end_border)
+            history_date__gte=begin_border, history_date__lt=next_day)
         snap_dates = snapshots_qs.values_list('history_date', flat=True)
         changes_dates = changes_qs.values_list('document_date', flat=True)
         return set(chain(snap_dates, changes_dates))
 
     def _get_snapshots_qs(self, begin_border, end_border):
+        if (begin_border, end_border) in self._compacted_borders:
+            return self._initial_snapshots_qs.filter(
+                deleted__isnull=True,
+                history_date__gte=begin_border, history_date__lt=end_border)
         if begin_border == end_border:
             return self._initial_snapshots_qs.filter(
-                history_date__date=begin_border)
+                history_date__gte=begin_border,
+                history_date__lt=begin_border + timedelta(days=1))
         else:
             return self._initial_snapshots_qs.filter(
                 history_date__gte=begin_border, history_date__lt=end_border)
@@ -206,7 +742,9 @@ class SnapshotsSlicer:
     def _get_changes_qs(self, begin_border, end_border):
         query_set = self._initial_changes_qs.filter(document_is_draft=False)
         if begin_border == end_border:
-            query_set = query_set.filter(document_date__date=begin_border)
+            query_set = query_set.filter(
+                document_date__gte=begin_border,
+                document_date__lt=begin_border + timedelta(days=1))
         else:
             query_set = query_set.filter(
                 document_date__gte=begin_border, document_date__lt=end_border)
@@ -266,25 +804,24 @@ class SnapshotsSlicer:
                     rel_to_documented_obj=self._rel_to_documented_obj)
                 snapshot = snapshot_calculator.calculate_snapshot()
                 if snapshot and not snapshot.deleted:
-                    self._snapshots.append(snapshot)
+                    self._latest_snapshot = snapshot
             else:
                 snapshot = snapshots_qs.filter(deleted__isnull=True).first()
-                if snapshot and self._snapshots:
-                    prev_snap = self._snapshots[-1]
+                prev_snap = self._latest_snapshot
+                if snapshot and prev_snap:
                     if prev_snap.updated > snapshot.updated:
-                        _update_snapshot_via_previous(prev_snap, snapshot)
+                        _update_snapshot_via_previous(
+                            prev_snap, snapshot, begin_border)
                 if snapshot:
-                    self._snapshots.append(snapshot)
+                    self._latest_snapshot = snapshot
 
     @property
     def latest_snapshot(self):
         self._calculate_snapshots()
-        if self._snapshots:
-            return self._snapshots[-1]
-        return None
+        return self._latest_snapshot
 
 
-class ChangeManager(models.Manager):
+class ChangeManager(models.Manager.from_queryset(HistoryQuerySet)):
 
     def __init__(self, model, instance=None):
         super().__init__()
@@ -294,20 +831,31 @@ class ChangeManager(models.Manager):
     def _get_lookup(self):
         return {self.model._documented_model_field: self.instance.pk} # noqa protected-access
 
-    def apply_to_object(self, date=None):
+    def apply_to_object(self, date=None, using=None):
         if not self.instance:
             raise ObservableInstanceRequiredError()
         if isinstance(date, datetime):
             raise TypeError('You need to provide a date instance')
+        if self.instance.deleted and is_history_deletion_deferred():
+            # History is being cascaded, it is not recalculated meanwhile
+            return self.instance
 
         snapshot_model = self.instance.snapshots.model
         unit_size_in_days = snapshot_model.unit_size_in_days
-        changes_qs = self.get_queryset()
+        # Recalculation reads what it writes, so it stays on the primary:
+        # the given database, `write_db` or the database of the instance.
+        # Getting `write_db` pins further reads with `sticky_after_write`
+        changes_qs = self.get_queryset().primary()
+        write_db = get_write_db(self.model)
+        using = using or write_db or self.instance._state.db  # noqa: protected-access
+        if using:
+            changes_qs = changes_qs.using(using)
         if changes_qs.count() == 0:
             raise ChangesAreNotCreatedYetError(
                 'There were not changes to calculate snapshots')
 
-        snapshots_qs = snapshot_model.objects.filter(**self._get_lookup())
+        snapshots_qs = snapshot_model.objects.using(changes_qs.db).filter(
+            **self._get_lookup())
         rel_to_documented_obj = {
             f'{self.model._documented_model_field}_id': self.instance.pk} # noqa: protected-access
         snapshots_slicer = SnapshotsSlicer(
@@ -327,6 +875,9 @@ class ChangeManager(models.Manager):
 
         return self.instance
 
+    async def aapply_to_object(self, date=None, using=None):
+        return await sync_to_async(self.apply_to_object)(date, using)
+
     def get_queryset(self):
         queryset = super().get_queryset()
         if self.instance:
@@ -334,26 +885,41 @@ class ChangeManager(models.Manager):
         return queryset
 
 
-class SnapshotDescriptor:
-    def __init__(self, model):
-        self.model = model
+class SnapshotDescriptor(ReverseManyToOneDescriptor):
+    """ Related manager of the snapshots of a documented object, the
+        snapshot model manager when accessed on the documented model, so
+        `Book.snapshots.diff(...)` reads every object """
 
-    def __get__(self, instance, owner):
+    def __get__(self, instance, cls=None):
         if instance is None:
-            return SnapshotManager(self.model)
-        return SnapshotManager(self.model, instance)
-
-
-class SnapshotManager(models.Manager):
-    def __init__(self, model, instance=None):
-        super().__init__()
-        self.model = model
-        self.instance = instance
-
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        if self.instance:
-            lookup = {f'change__{self.model._documented_model_field}':  # noqa protected-access
-                          self.instance.pk}
-            return queryset.filter(**lookup)
-        return queryset
+            return self.rel.related_model._default_manager  # noqa: protected-access
+        return super().__get__(instance, cls)
+
+
+def _recalculate(instances, date, using):
+    try:
+        for instance in instances:
+            try:
+                instance.changes.apply_to_object(date, using=using)
+            except ChangesAreNotCreatedYetError:
+                continue
+            instance.save(using=using, apply_documents=False)
+    finally:
+        # Worker threads are not request threads, nobody else closes them
+        connections.close_all()
+
+
+async def arecalculate(instances, date=None, using=None, concurrency=None):
+    """ Applies changes to and saves documented objects in parallel
+
+        Objects are split between at most `concurrency` worker threads,
+        every worker uses its own database connection.
+    """
+
+    instances = list(instances)
+    concurrency = concurrency or tools_settings.ASYNC_CONCURRENCY
+    recalculate = sync_to_async(_recalculate, thread_sensitive=False)
+    await asyncio.gather(*(
+        recalculate(instances[index::concurrency], date, using)
+        for index in range(min(concurrency, len(instances)))))
+    return instances
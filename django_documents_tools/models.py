@@ -1,4 +1,5 @@
 import copy
+import json
 import logging
 import importlib
 from typing import List
@@ -6,13 +7,22 @@ from typing import List
 from django.apps import apps
 from django.utils import timezone
 from django.db import models
+from django.db.models import F
 from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.backends.utils import names_digest
+from django.db.models.fields.json import KT
+from django.db.models.fields.related import lazy_related_operation
 from django.db.models.signals import class_prepared, post_save
 from django.utils.translation import gettext, gettext_lazy as _
 from model_utils import FieldTracker
 
+from .deletion import is_history_deletion_deferred, schedule_history_deletion
 from .fields import FIELDS_PROCESSORS
-from .manager import ChangeDescriptor, SnapshotDescriptor
+from .partitioning import get_partitioning
+from .manager import (
+    ChangeDescriptor, HistoryQuerySet, SnapshotDescriptor, SnapshotQuerySet)
 from .exceptions import ChangesAreNotCreatedYetError
 from .utils import (
     get_change_attachment_file_path, LimitedChoicesValidator,
@@ -47,18 +57,27 @@ class BaseDocumented(Dated):
 
     def save(self, force_insert=False, force_update=False, using=None,  # noqa: arguments-differ
              update_fields=None, apply_documents=True):
+        # History is kept in the database of the documented object
+        using = using or self._state.db  # noqa: protected-access
+        if self.deleted and is_history_deletion_deferred():
+            super().save(force_insert, force_update, using, update_fields)
+            schedule_history_deletion(
+                self, timezone.now(), self._state.db)  # noqa: protected-access
+            return
+
         if self.deleted:
             deletion_time = timezone.now()
-            self.snapshots.filter(
+            self.snapshots.using(using).filter(
                 deleted__isnull=True).update(
                 deleted=deletion_time, updated=deletion_time)
-            self.changes.filter(
+            self.changes.using(using).filter(
                 deleted__isnull=True).update(
                 deleted=deletion_time, updated=deletion_time)
 
         if apply_documents:
             try:
-                self.changes.apply_to_object(timezone.now().date())
+                self.changes.apply_to_object(
+                    timezone.now().date(), using=using)
             except ChangesAreNotCreatedYetError:
                 LOGGER.info('Changes are not created yet')
 
@@ -76,8 +95,14 @@ class BaseChange(Dated):
     _all_documented_fields: List[str] = None
     _documented_model_field: str = None
     _snapshot_model_field: str = None
+    _archive_model = None
+    _read_db: str = None
+    _write_db: str = None
+    _sticky_after_write = False
     tracker: FieldTracker = None
 
+    objects = models.Manager.from_queryset(HistoryQuerySet)()
+
     snapshot = None
     attachment = None
     document_name = models.CharField(_('Название изменения'), max_length=255)
@@ -120,7 +145,7 @@ class BaseChange(Dated):
             self._documented_model_field).remote_field.model
         kwargs = self.get_changes()
         new_documented = documented_model(**kwargs)
-        new_documented.save(apply_documents=False)
+        new_documented.save(using=self._state.db, apply_documents=False)  # noqa: protected-access
         return new_documented
 
     def save(self, *args, **kwargs):  # noqa: pylint==arguments-differ
@@ -156,6 +181,15 @@ class BaseSnapshot(Dated):
         'document_fields')
 
     changes = None
+    keyframe_interval = None
+    is_keyframe = True
+    _last_changes = False
+    _state_doc = False
+    _archive_model = None
+    _read_db: str = None
+    _write_db: str = None
+    _sticky_after_write = False
+    objects = models.Manager.from_queryset(SnapshotQuerySet)()
     document_fields = ArrayField(
         models.CharField(_('Заполненные атрибуты'), max_length=255),
         default=list)
@@ -168,8 +202,57 @@ class BaseSnapshot(Dated):
     def __str__(self):
         return f'{self.pk} - {self.history_date}'
 
+    @property
+    def is_delta(self):
+        return bool(self.keyframe_interval) and not self.is_keyframe
+
     @property
     def state(self):
+        return self.get_state()
+
+    def get_state(self, raw=False):
+        """ State folded from the nearest keyframe
+
+            With `raw` related objects are returned as their pk.
+        """
+
+        if not self.is_delta:
+            return self.get_own_state(raw)
+
+        state = {}
+        for snapshot in self.get_delta_chain():
+            state.update(snapshot.get_own_state(raw))
+        return state
+
+    def get_delta_chain(self):
+        """ Snapshots from the nearest keyframe up to this one """
+
+        documented_field = self.changes.model._documented_model_field  # noqa: protected-access
+        snapshots = type(self).objects.using(self._state.db).filter(  # noqa: protected-access
+            **{f'{documented_field}_id': getattr(
+                self, f'{documented_field}_id')},
+            history_date__lt=self.history_date, deleted__isnull=True)
+        keyframe_date = snapshots.filter(is_keyframe=True).order_by(
+            '-history_date').values_list('history_date', flat=True).first()
+        if keyframe_date:
+            snapshots = snapshots.filter(history_date__gte=keyframe_date)
+        return [*snapshots.order_by('history_date'), self]
+
+    @staticmethod
+    def get_state_doc(state):
+        """ JSON document of the state, related objects by their pk """
+
+        return json.loads(DjangoJSONEncoder().encode({
+            name: value.pk if isinstance(value, models.Model) else value
+            for name, value in state.items()}))
+
+    @property
+    def own_state(self):
+        """ Documented fields stored in the snapshot row itself """
+
+        return self.get_own_state()
+
+    def get_own_state(self, raw=False):
         state = {}
         excluded_fields = (
             f'{self.changes.model._documented_model_field}_id',  # noqa: protected-access
@@ -179,7 +262,8 @@ class BaseSnapshot(Dated):
             if (field_name not in excluded_fields
                     and not field_name.startswith('_')
                     and field_name in self.document_fields):
-                state[field_name] = getattr(self, field_name)
+                state[field_name] = getattr(
+                    self, field.attname if raw else field_name)
         return state
 
     @property
@@ -191,6 +275,50 @@ class BaseSnapshot(Dated):
 
         return result
 
+    def get_documented_instance(self, state=None):
+        """ Documented object in the state of the snapshot
+
+            Folded `state` of a delta snapshot may be given to save the
+            delta chain query.
+
+            Fields absent on the snapshot and its own service fields
+            (`created`, `updated`, ...) are None, current values are not
+            mixed into the historical state.
+        """
+
+        documented_field = self._meta.get_field(
+            self.changes.model._documented_model_field)  # noqa: protected-access
+        documented_model = documented_field.related_model
+        snapshot_fields = {
+            field.name: field for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.name not in self.EXCLUDED_STATE_FIELDS}
+
+        field_names, values, related_fields = [], [], []
+        for field in documented_model._meta.concrete_fields:  # noqa: protected-access
+            field_names.append(field.attname)
+            snapshot_field = snapshot_fields.get(field.name)
+            if field.primary_key:
+                values.append(getattr(self, documented_field.attname))
+            elif snapshot_field:
+                values.append(getattr(self, snapshot_field.attname))
+                if field.is_relation and snapshot_field.is_cached(self):
+                    related_fields.append((field, snapshot_field))
+            else:
+                values.append(None)
+
+        instance = documented_model.from_db(
+            self._state.db, field_names, values)
+        for field, snapshot_field in related_fields:
+            field.set_cached_value(
+                instance, snapshot_field.get_cached_value(self))
+        if self.is_delta:
+            if state is None:
+                state = self.state
+            for name, value in state.items():
+                setattr(instance, name, value)
+        return instance
+
 
 class Changes:
 
@@ -215,6 +343,8 @@ class Changes:
         'base_serializer': None,
         'filterset': None,
         'manager_name': 'changes',
+        'partitioning': None,
+        'archive': False,
         'model_name': None,
         'table_name': None,
         'verbose_name': None,
@@ -229,7 +359,14 @@ class Changes:
         'base_viewset': None,
         'filterset': None,
         'unit_size_in_days': None,
+        'keyframe_interval': None,
+        'retention': None,
+        'add_field_backfill': None,
+        'last_changes': False,
+        'state_doc': False,
         'manager_name': 'snapshots',
+        'partitioning': None,
+        'archive': False,
         'model_name': None,
         'table_name': None,
         'verbose_name': None,
@@ -253,12 +390,20 @@ class Changes:
             change_opts=None,
             snapshot_opts=None,
             change_attachment_opts=None,
+            read_db=None,
+            write_db=None,
+            sticky_after_write=False,
     ):
         self.fields_processors = fields_processors or FIELDS_PROCESSORS
         self.inherit = inherit
         self.app = app
         self.excluded_fields = excluded_fields or []
         self.included_fields = included_fields or []
+        self.routing = {
+            '_read_db': read_db,
+            '_write_db': write_db,
+            '_sticky_after_write': sticky_after_write,
+        }
 
         self.change_opts = {
             **self.DEFAULT_CHANGE_OPTS, **(change_opts or {})}
@@ -274,6 +419,13 @@ class Changes:
             raise ValueError(
                 'You have to provide a valid value for unit_size_in_days')
 
+        keyframe_interval = self.snapshot_opts.get('keyframe_interval')
+        if keyframe_interval is not None and (
+                not isinstance(keyframe_interval, int)
+                or keyframe_interval < 1):
+            raise ValueError(
+                'You have to provide a valid value for keyframe_interval')
+
         if not bool(self.excluded_fields) ^ bool(self.included_fields):
             raise ValueError(
                 'You have to provide either `excluded_fields` or '
@@ -308,8 +460,10 @@ class Changes:
             'manager_name']
 
         setattr(module, self.snapshot_model.__name__, self.snapshot_model)
-        descriptor = SnapshotDescriptor(self.snapshot_model)
-        setattr(sender, self.snapshot_opts['manager_name'], descriptor)
+        # Set once the reverse accessor of the foreign key is, which
+        # happens when the documented model is registered
+        lazy_related_operation(
+            self.set_snapshot_descriptor, self.snapshot_model, sender)
         sender._meta.snapshot_manager_attribute = self.snapshot_opts[  # noqa: protected-access
             'manager_name']
 
@@ -317,6 +471,14 @@ class Changes:
             module, self.change_attachment_model.__name__,
             self.change_attachment_model)
 
+        for source_model, opts in ((self.change_model, self.change_opts),
+                                   (self.snapshot_model, self.snapshot_opts)):
+            if opts['archive']:
+                archive_model = self.create_archive_model(
+                    source_model, inherited)
+                source_model._archive_model = archive_model  # noqa: protected-access
+                setattr(module, archive_model.__name__, archive_model)
+
         post_save.connect(apply_change_receiver, sender=self.change_model)
 
     def create_change_model(self, model, inherited):
@@ -330,6 +492,9 @@ class Changes:
             '_base_viewset': self.change_opts['base_viewset'],
             '_filterset': self.change_opts['filterset'],
             '_base_serializer': self.change_opts['base_serializer'],
+            '_partitioning': get_partitioning(
+                self.change_opts, 'document_date'),
+            **self.routing,
         }
         opts = model._meta   # noqa protected-access
 
@@ -354,9 +519,11 @@ class Changes:
                 'deleted', primary_field_name, *documented_fields)}
         attachment_title = (
             self.change_attachment_model._meta.verbose_name.title())  # noqa: protected-access
+        # Partitioned tables can not be referenced by a single column key
         attrs['snapshot'] = models.ForeignKey(
             self.snapshot_model, on_delete=models.DO_NOTHING,
             related_name='changes', null=True, blank=True,
+            db_constraint=not self.snapshot_model._partitioning,  # noqa: protected-access
             verbose_name=self.snapshot_model._meta.verbose_name.title())  # noqa: protected-access
         attrs['attachment'] = models.OneToOneField(
             self.change_attachment_model, on_delete=models.SET_NULL,
@@ -365,9 +532,13 @@ class Changes:
         attrs['document_fields'] = ArrayField(
             models.CharField(_('Атрибуты'), max_length=255), default=list,
             validators=[LimitedChoicesValidator(sorted(documented_fields))])
+        # Keyset pages are index range scans over `(document_date, pk)`
         base_meta = {
             'ordering': ('-document_date',),
-            'get_latest_by': 'document_date'}
+            'get_latest_by': 'document_date',
+            'indexes': [models.Index(
+                F('document_date'), F('pk'),
+                name=f'{opts.model_name[:20]}_chg_dp')]}
         attrs.update(Meta=type("Meta", (), self.get_meta_options(
             model, base_meta, self.change_opts)))
         if self.change_opts['table_name'] is not None:
@@ -409,6 +580,15 @@ class Changes:
 
         return type(name, self.change_attachment_opts['bases'], attrs)
 
+    def set_snapshot_descriptor(self, snapshot_model, documented_model):
+        field = snapshot_model._meta.get_field(  # noqa: protected-access
+            documented_model._meta.model_name)  # noqa: protected-access
+        descriptor = SnapshotDescriptor(field.remote_field)
+        setattr(documented_model, field.remote_field.get_accessor_name(),
+                descriptor)
+        setattr(
+            documented_model, self.snapshot_opts['manager_name'], descriptor)
+
     def create_snapshot_model(self, model, inherited):
         """
         Create an documented object snapshot model
@@ -416,9 +596,18 @@ class Changes:
         attrs = {
             '__module__': self.get_module(model, inherited),
             'unit_size_in_days': self.snapshot_opts['unit_size_in_days'],
+            'keyframe_interval': self.snapshot_opts['keyframe_interval'],
             '_base_viewset': self.snapshot_opts['base_viewset'],
             '_base_serializer': self.snapshot_opts['base_serializer'],
             '_filterset': self.snapshot_opts['filterset'],
+            '_add_field_backfill': self.snapshot_opts[
+                'add_field_backfill'] or {},
+            '_retention': tuple(self.snapshot_opts['retention'] or ()),
+            '_last_changes': bool(self.snapshot_opts['last_changes']),
+            '_state_doc': self.snapshot_opts['state_doc'],
+            '_partitioning': get_partitioning(
+                self.snapshot_opts, 'history_date'),
+            **self.routing,
         }
 
         src_fields = self.get_fields(model)
@@ -428,14 +617,32 @@ class Changes:
             '{app_label}.change_{model_name}': (*documented_fields,),
             '{app_label}.add_{model_name}': (*documented_fields,)}
         attrs.update(fields)
+        if self.snapshot_opts['keyframe_interval']:
+            attrs['is_keyframe'] = models.BooleanField(
+                _('Ключевой снапшот'), default=True)
         opts = model._meta   # noqa protected-access
+        indexes = []
+        if self.snapshot_opts['last_changes']:
+            attrs['last_changes'] = models.JSONField(
+                _('Последние изменения атрибутов'), default=dict, blank=True)
+            indexes = self.get_last_changes_indexes(
+                opts.model_name, self.snapshot_opts['last_changes'])
+        if self.snapshot_opts['state_doc']:
+            attrs['state_doc'] = models.JSONField(
+                _('Состояние объекта'), default=dict, blank=True)
+            indexes.append(GinIndex(
+                fields=['state_doc'], name=f'{opts.model_name[:20]}_snap_sd'))
         attrs[opts.model_name] = models.ForeignKey(
             model, on_delete=models.DO_NOTHING,
             related_name='snapshots', null=True, blank=True,
             verbose_name=self.cls._meta.verbose_name.title())  # noqa: protected-access
+        indexes.append(models.Index(
+            F('history_date'), F('pk'),
+            name=f'{opts.model_name[:20]}_snap_hp'))
         base_meta = {
             'ordering': ('-history_date',),
-            'get_latest_by': 'history_date'}
+            'get_latest_by': 'history_date',
+            'indexes': indexes}
         attrs.update(Meta=type('Meta', (), self.get_meta_options(
             model, base_meta, self.snapshot_opts)))
         if self.snapshot_opts['table_name'] is not None:
@@ -446,6 +653,56 @@ class Changes:
             else '%sSnapshot' % model._meta.object_name)  # noqa: protected-access
         return type(str(name), self.snapshot_opts['bases'], attrs)
 
+    @staticmethod
+    def get_last_changes_indexes(model_name, last_changes):
+        """
+        GIN index of the last changes map and btree indexes of the change
+        dates of the listed fields.
+        """
+
+        indexes = [GinIndex(
+            fields=['last_changes'], name=f'{model_name[:20]}_snap_lc')]
+        if last_changes is True:
+            return indexes
+        for field_name in last_changes:
+            digest = names_digest(model_name, field_name, length=8)
+            indexes.append(models.Index(
+                KT(f'last_changes__{field_name}__date'),
+                name=f'{model_name[:12]}_lc_{digest}'))
+        return indexes
+
+    def create_archive_model(self, source_model, inherited):
+        """
+        Create a mirror table for archived rows of the source model
+        without indexes and database constraints.
+        """
+
+        source_opts = source_model._meta  # noqa: protected-access
+        attrs = {'__module__': self.get_module(source_model, inherited)}
+        for field in source_opts.concrete_fields:
+            if field.is_relation:
+                attrs[field.name] = models.ForeignKey(
+                    field.remote_field.model, on_delete=models.DO_NOTHING,
+                    to_field=field.remote_field.field_name, related_name='+',
+                    db_constraint=False, db_index=False, null=field.null,
+                    blank=field.blank, db_column=field.db_column,
+                    verbose_name=field.verbose_name)
+                continue
+            field = copy.copy(field)
+            if not field.primary_key:
+                field.db_index = False
+                field._unique = False  # noqa: protected-access
+            attrs[field.name] = field
+        attrs['archived'] = models.DateTimeField(
+            _('archived'), default=timezone.now, db_index=True)
+
+        meta_opts = {'db_table': f'{source_opts.db_table}_archive'}
+        if self.app:
+            meta_opts['app_label'] = self.app
+        attrs['Meta'] = type('Meta', (), meta_opts)
+        name = f'{source_opts.object_name}Archive'
+        return type(name, (models.Model,), attrs)
+
     def get_module(self, model, inherited):
         module = self.module
         app_module = '%s.models' % model._meta.app_label  # noqa: protected-access
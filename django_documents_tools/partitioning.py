@@ -0,0 +1,283 @@
+from datetime import date, timedelta
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.operations.base import Operation
+from django.utils import timezone
+
+from .exceptions import TableIsReferencedError
+
+
+INTERVALS = {
+    'day': '%Y%m%d',
+    'month': '%Y%m',
+    'year': '%Y',
+}
+
+
+def get_partitioning(opts, default_field):
+    """ Normalized `partitioning` option of the generated model """
+
+    partitioning = opts.get('partitioning')
+    if not partitioning:
+        return None
+
+    partitioning = {
+        'field': default_field, 'interval': 'month', **partitioning}
+    if partitioning['interval'] not in INTERVALS:
+        raise ValueError(
+            f'Partitioning interval has to be one of {", ".join(INTERVALS)}')
+    return partitioning
+
+
+def get_period_start(value, interval):
+    if interval == 'year':
+        return date(value.year, 1, 1)
+    if interval == 'month':
+        return date(value.year, value.month, 1)
+    return date(value.year, value.month, value.day)
+
+
+def get_next_period_start(start, interval):
+    if interval == 'year':
+        return date(start.year + 1, 1, 1)
+    if interval == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def get_partition_name(table, start, interval):
+    return f'{table}_p{start.strftime(INTERVALS[interval])}'
+
+
+def get_default_partition_name(table):
+    return f'{table}_default'
+
+
+def _get_referencing_constraints(schema_editor, table):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT conrelid::regclass::text, conname FROM pg_constraint '
+            "WHERE contype = 'f' AND conparentid = 0 "
+            'AND confrelid = to_regclass(%s) AND conrelid <> confrelid',
+            (table,))
+        return cursor.fetchall()
+
+
+def _create_constraints(schema_editor, model, partitioned):
+    """ Creates unique, foreign key and Meta indexes of the new table
+
+        Unique fields of a partitioned table get plain indexes, since
+        Postgres requires the partition column in unique constraints.
+    """
+
+    for field in model._meta.local_fields:  # noqa: protected-access
+        if field.primary_key:
+            continue
+        if field.unique and partitioned:
+            schema_editor.execute(schema_editor._create_index_sql(  # noqa: protected-access
+                model, fields=[field]))
+        elif field.unique:
+            schema_editor.execute(schema_editor._create_unique_sql(  # noqa: protected-access
+                model, [field]))
+        if field.remote_field and field.db_constraint:
+            schema_editor.execute(schema_editor._create_fk_sql(  # noqa: protected-access
+                model, field, '_fk_%(to_table)s_%(to_column)s'))
+    for sql in schema_editor._model_indexes_sql(model):  # noqa: protected-access
+        schema_editor.execute(sql)
+
+
+def _recreate_table(schema_editor, model, partition_column=None):
+    """ Recreates the table of `model` copying its rows
+
+        The new table is partitioned by range of `partition_column` with a
+        default partition, or a plain one when the column is not given.
+        Foreign keys of other tables can not be moved to the new table,
+        so such tables are refused.
+    """
+
+    opts = model._meta  # noqa: protected-access
+    quote = schema_editor.quote_name
+    table = opts.db_table
+    old_table = f'{table}_old'
+
+    referencing = _get_referencing_constraints(schema_editor, table)
+    if referencing:
+        raise TableIsReferencedError(
+            f'Drop foreign keys referencing {table} before recreating it: '
+            + ', '.join(f'{name} on {other}' for other, name in referencing))
+
+    pk_columns = [opts.pk.column]
+    partition_by = ''
+    if partition_column:
+        pk_columns.append(partition_column)
+        partition_by = f' PARTITION BY RANGE ({quote(partition_column)})'
+
+    schema_editor.execute(
+        f'ALTER TABLE {quote(table)} RENAME TO {quote(old_table)}')
+    schema_editor.execute(
+        f'CREATE TABLE {quote(table)} '
+        f'(LIKE {quote(old_table)} INCLUDING DEFAULTS INCLUDING IDENTITY)'
+        f'{partition_by}')
+    schema_editor.execute(
+        f'ALTER TABLE {quote(table)} ADD PRIMARY KEY '
+        f'({", ".join(quote(column) for column in pk_columns)})')
+    if partition_column:
+        schema_editor.execute(
+            f'CREATE TABLE {quote(get_default_partition_name(table))} '
+            f'PARTITION OF {quote(table)} DEFAULT')
+    schema_editor.execute(
+        f'INSERT INTO {quote(table)} SELECT * FROM {quote(old_table)}')
+    # Partitions of a partitioned table are dropped along with it
+    schema_editor.execute(f'DROP TABLE {quote(old_table)}')
+
+    _create_constraints(schema_editor, model, bool(partition_column))
+    if opts.pk.get_internal_type() in ('AutoField', 'BigAutoField'):
+        pk_column = quote(opts.pk.column)
+        schema_editor.execute(
+            f'SELECT setval(pg_get_serial_sequence(%s, %s), '
+            f'COALESCE(MAX({pk_column}), 1)) FROM {quote(table)}',
+            (table, opts.pk.column))
+
+
+def partition_table(schema_editor, model, field_name):
+    """ Recreates the table of `model` partitioned by range of `field_name`
+
+        Rows are moved into the default partition, indexes and foreign keys
+        are created on the partitioned table so every partition gets them.
+        Primary key is extended by the partition column as Postgres requires
+        and unique fields get plain indexes.
+    """
+
+    column = model._meta.get_field(field_name).column  # noqa: protected-access
+    _recreate_table(schema_editor, model, column)
+
+
+def unpartition_table(schema_editor, model):
+    """ Recreates the partitioned table of `model` as a plain one
+
+        Rows of all partitions are moved to the new table, the primary key
+        and unique constraints of the model are restored.
+    """
+
+    _recreate_table(schema_editor, model)
+
+
+class PartitionTable(Operation):
+    """ Migration operation converting a created table into partitioned one
+
+        Unapplying it moves the rows back into a plain table.
+    """
+
+    reversible = True
+
+    def __init__(self, model_name, field_name):
+        self.model_name = model_name
+        self.field_name = field_name
+
+    def deconstruct(self):
+        return (
+            self.__class__.__name__, [self.model_name, self.field_name], {})
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def database_forwards(self, app_label, schema_editor, from_state,
+                          to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            partition_table(schema_editor, model, self.field_name)
+
+    def database_backwards(self, app_label, schema_editor, from_state,
+                           to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            unpartition_table(schema_editor, model)
+
+    def describe(self):
+        return (
+            f'Partition {self.model_name} table by range of {self.field_name}')
+
+    @property
+    def migration_name_fragment(self):
+        return f'partition_{self.model_name.lower()}'
+
+
+def is_partitioned(connection, table):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT 1 FROM pg_partitioned_table '
+            'WHERE partrelid = to_regclass(%s)', (table,))
+        return cursor.fetchone() is not None
+
+
+def _create_partition(cursor, quote, table, column, name, start, end):
+    """ Creates the partition moving its rows out of the default one """
+
+    default_table = get_default_partition_name(table)
+    cursor.execute(
+        f'CREATE TABLE {quote(name)} '
+        f'(LIKE {quote(table)} INCLUDING DEFAULTS)')
+    cursor.execute(
+        f'WITH moved AS (DELETE FROM {quote(default_table)} '
+        f'WHERE {quote(column)} >= %s AND {quote(column)} < %s RETURNING *) '
+        f'INSERT INTO {quote(name)} SELECT * FROM moved', (start, end))
+    cursor.execute(
+        f'ALTER TABLE {quote(table)} ATTACH PARTITION {quote(name)} '
+        f'FOR VALUES FROM (%s) TO (%s)', (start, end))
+
+
+def _create_missing_partitions(
+        connection, table, column, interval, start, end):
+    """ Every partition is committed on its own, so the lock of the parent
+        table and the moved rows are held for a single partition only """
+
+    quote = connection.ops.quote_name
+    created = []
+    while start <= end:
+        next_start = get_next_period_start(start, interval)
+        name = get_partition_name(table, start, interval)
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT to_regclass(%s)', (name,))
+                if cursor.fetchone()[0] is None:
+                    _create_partition(
+                        cursor, quote, table, column, name, start,
+                        next_start)
+                    created.append(name)
+        start = next_start
+    return created
+
+
+def create_partitions(model, ahead=3, today=None, using=DEFAULT_DB_ALIAS):
+    """ Creates missing partitions up to `ahead` periods after today
+
+        Partitions are created from the oldest row of the default partition,
+        so rows written before partitioning are moved to their ranges.
+        Returns the names of the created partitions.
+    """
+
+    partitioning = model._partitioning  # noqa: protected-access
+    connection = connections[using]
+    table = model._meta.db_table  # noqa: protected-access
+    if not partitioning or not is_partitioned(connection, table):
+        return []
+
+    quote = connection.ops.quote_name
+    interval = partitioning['interval']
+    column = model._meta.get_field(partitioning['field']).column  # noqa: protected-access
+    today = today or timezone.now().date()
+
+    start = get_period_start(today, interval)
+    end = start
+    for _ in range(ahead):
+        end = get_next_period_start(end, interval)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT MIN({quote(column)}) '
+            f'FROM {quote(get_default_partition_name(table))}')
+        oldest = cursor.fetchone()[0]
+    if oldest is not None:
+        start = min(start, get_period_start(oldest, interval))
+    return _create_missing_partitions(
+        connection, table, column, interval, start, end)
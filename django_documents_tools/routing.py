@@ -0,0 +1,71 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+
+
+_PINNED_TO_PRIMARY = ContextVar('pinned_to_primary', default=False)
+_IN_REQUEST_SCOPE = ContextVar('in_request_scope', default=False)
+
+
+def pin_to_primary():
+    """ Sends further history reads of the current context to the primary """
+
+    _PINNED_TO_PRIMARY.set(True)
+
+
+def unpin_from_primary():
+    _PINNED_TO_PRIMARY.set(False)
+
+
+@contextmanager
+def use_primary():
+    token = _PINNED_TO_PRIMARY.set(True)
+    try:
+        yield
+    finally:
+        _PINNED_TO_PRIMARY.reset(token)
+
+
+@contextmanager
+def request_scope():
+    """ Reads of the block start unpinned, pins of writes last to its end """
+
+    scope_token = _IN_REQUEST_SCOPE.set(True)
+    pin_token = _PINNED_TO_PRIMARY.set(False)
+    try:
+        yield
+    finally:
+        _PINNED_TO_PRIMARY.reset(pin_token)
+        _IN_REQUEST_SCOPE.reset(scope_token)
+
+
+def _pin_after_write(using):
+    """ Pins reads until the end of the request or the write's transaction
+
+        Outside a request the write is visible to replicas once committed,
+        so a thread is not pinned forever by its first write.
+    """
+
+    if _PINNED_TO_PRIMARY.get():
+        return
+    token = _PINNED_TO_PRIMARY.set(True)
+    if not _IN_REQUEST_SCOPE.get():
+        transaction.on_commit(
+            lambda: _PINNED_TO_PRIMARY.reset(token), using=using)
+
+
+def get_read_db(model):
+    """ Alias history reads of `model` go to, None for default routing """
+
+    read_db = getattr(model, '_read_db', None)
+    if read_db is None or _PINNED_TO_PRIMARY.get():
+        return getattr(model, '_write_db', None)
+    return read_db
+
+
+def get_write_db(model):
+    write_db = getattr(model, '_write_db', None)
+    if getattr(model, '_sticky_after_write', False):
+        _pin_after_write(write_db)
+    return write_db
@@ -50,7 +50,23 @@ class ToolsSettings(ChainMap): # noqa: too-many-ancestors
             BASE_CHANGE_ATTACHMENT_LINK_SERIALIZER),
         'BASE_DOCUMENTED_MODEL_LINK_SERIALIZER': (
             BASE_DOCUMENTED_MODEL_LINK_SERIALIZER),
-        'CREATE_BUSINESS_ENTITY_AFTER_CHANGE_CREATED': False
+        'CREATE_BUSINESS_ENTITY_AFTER_CHANGE_CREATED': False,
+        'ADD_FIELD_BACKFILL_BATCH_SIZE': 1000,
+        'STATE_DOC_BACKFILL_BATCH_SIZE': 1000,
+        'LIGHTWEIGHT_CHANGE_VALIDATION': False,
+        'LAZY_DOCUMENTED_VIEWSETS': False,
+        'EXPORT_CHUNK_SIZE': 2000,
+        'AS_OF_QUERY_PARAM': 'as_of',
+        'PAGINATION_COUNT': None,
+        'ESTIMATED_COUNT_THRESHOLD': 10000,
+        'COMPACTION_BATCH_SIZE': 100,
+        'ARCHIVE_BATCH_SIZE': 1000,
+        'ARCHIVE_BATCH_DELAY': 0,
+        'DELETE_CASCADE_DEFERRED': False,
+        'DELETE_CASCADE_BATCH_SIZE': 1000,
+        'DELETE_CASCADE_ASYNC': False,
+        'READ_REPLICA_STICKY_SECONDS': 5,
+        'ASYNC_CONCURRENCY': 8,
     }
 
     def __init__(self):
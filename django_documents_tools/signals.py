@@ -1,10 +1,20 @@
+import json
 from typing import List, Tuple, Union
 
 from django.apps import apps
-from django.db import migrations
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, connections, DEFAULT_DB_ALIAS
 from django.db.migrations.state import StateApps
-from django.db.models.signals import post_migrate
-from django.dispatch import receiver, Signal
+from django.dispatch import Signal
+from django.utils.module_loading import import_string
+
+from .settings import tools_settings
+
+
+BACKFILL_CURRENT = 'current'
+BACKFILL_DEFAULT = 'default'
+BACKFILL_SKIP = 'skip'
 
 
 def _rename_field(model, old_name, new_name):
@@ -23,40 +33,215 @@ def _remove_field(model, name):
         change.save(update_fields=['document_fields'])
 
 
-def _process_operation(fake_apps, app, operation):
+def _has_state_doc(snapshot_model):
+    try:
+        snapshot_model._meta.get_field('state_doc')  # noqa: protected-access
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def _rename_state_doc_key(snapshot_model, old_name, new_name, using):
+    if not _has_state_doc(snapshot_model):
+        return
+    connection = connections[using]
+    table = connection.ops.quote_name(snapshot_model._meta.db_table)  # noqa: protected-access
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET state_doc = (state_doc - %s) '
+            f'|| jsonb_build_object(%s, state_doc -> %s) '
+            f'WHERE state_doc ? %s', [old_name, new_name, old_name, old_name])
+
+
+def _remove_state_doc_key(snapshot_model, name, using):
+    if not _has_state_doc(snapshot_model):
+        return
+    connection = connections[using]
+    table = connection.ops.quote_name(snapshot_model._meta.db_table)  # noqa: protected-access
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET state_doc = state_doc - %s '
+            f'WHERE state_doc ? %s', [name, name])
+
+
+def _iter_documented_key_ranges(cursor, table, column, batch_size):
+    """ Yields (first, last) documented object keys by keyset batches """
+
+    last_key = None
+    while True:
+        where = f'{column} IS NOT NULL'
+        params = [batch_size]
+        if last_key is not None:
+            where = f'{where} AND {column} > %s'
+            params = [last_key, batch_size]
+        cursor.execute(
+            f'SELECT DISTINCT {column} FROM {table} '
+            f'WHERE {where} ORDER BY {column} LIMIT %s', params)
+        keys = [row[0] for row in cursor.fetchall()]
+        if not keys:
+            return
+        yield keys[0], keys[-1]
+        last_key = keys[-1]
+
+
+def _get_fk_column(documented_model, snapshot_model, quote):
+    return quote(snapshot_model._meta.get_field(  # noqa: protected-access
+        documented_model._meta.model_name).column)  # noqa: protected-access
+
+
+def _get_current_backfill(
+        documented_model, snapshot_model, src_field, dst_field, quote):
+    """ Copies the documented object value into its latest snapshot """
+
+    snapshot_opts = snapshot_model._meta  # noqa: protected-access
+    documented_opts = documented_model._meta  # noqa: protected-access
+    table = quote(snapshot_opts.db_table)
+    fk_column = _get_fk_column(documented_model, snapshot_model, quote)
+    params = [src_field.name]
+    query = (
+        f'UPDATE {table} AS s SET {quote(dst_field.column)} = '
+        f'd.{quote(src_field.column)}, '
+        f'document_fields = array_append(s.document_fields, %s) '
+        f'FROM {quote(documented_opts.db_table)} AS d '
+        f'WHERE d.{quote(documented_opts.pk.column)} = s.{fk_column} '
+        f'AND s.{fk_column} BETWEEN %s AND %s '
+        f'AND s.deleted IS NULL '
+        f'AND NOT (%s = ANY(s.document_fields)) '
+        f'AND s.history_date = ('
+        f'SELECT max(l.history_date) FROM {table} AS l '
+        f'WHERE l.{fk_column} = s.{fk_column} AND l.deleted IS NULL)')
+    return query, params
+
+
+def _get_default_backfill(
+        documented_model, snapshot_model, src_field, dst_field, quote,
+        connection):
+    """ Puts the field default into every live snapshot """
+
+    table = quote(snapshot_model._meta.db_table)  # noqa: protected-access
+    fk_column = _get_fk_column(documented_model, snapshot_model, quote)
+    default = src_field.get_default()
+    params = [
+        dst_field.get_db_prep_save(default, connection), src_field.name]
+    state_doc = ''
+    if _has_state_doc(snapshot_model):
+        # Encoded as `get_state_doc` of snapshots does
+        state_doc = (
+            ', state_doc = s.state_doc || jsonb_build_object(%s, %s::jsonb)')
+        params += [
+            src_field.name, json.dumps(default, cls=DjangoJSONEncoder)]
+    query = (
+        f'UPDATE {table} AS s '
+        f'SET {quote(dst_field.column)} = %s, '
+        f'document_fields = array_append(s.document_fields, %s)'
+        f'{state_doc} '
+        f'WHERE s.{fk_column} BETWEEN %s AND %s '
+        f'AND s.deleted IS NULL '
+        f'AND NOT (%s = ANY(s.document_fields))')
+    return query, params
+
+
+def _add_field(documented_model, snapshot_model, name, strategy, using):
+    """ Backfills a new documented field on the existing snapshots
+
+        `current` copies the documented object value into its latest
+        snapshot, `default` puts the field default into every snapshot.
+    """
+
+    try:
+        src_field = documented_model._meta.get_field(name)  # noqa: protected-access
+        dst_field = snapshot_model._meta.get_field(name)  # noqa: protected-access
+    except FieldDoesNotExist:
+        return
+
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    if strategy == BACKFILL_CURRENT:
+        query, params = _get_current_backfill(
+            documented_model, snapshot_model, src_field, dst_field, quote)
+    elif strategy == BACKFILL_DEFAULT:
+        query, params = _get_default_backfill(
+            documented_model, snapshot_model, src_field, dst_field, quote,
+            connection)
+    else:
+        return
+
+    with connection.cursor() as cursor:
+        key_ranges = _iter_documented_key_ranges(
+            cursor, quote(snapshot_model._meta.db_table),  # noqa: protected-access
+            _get_fk_column(documented_model, snapshot_model, quote),
+            tools_settings.ADD_FIELD_BACKFILL_BATCH_SIZE)
+        for first_key, last_key in key_ranges:
+            cursor.execute(query, [*params, first_key, last_key, name])
+
+
+def _sync_state_docs(snapshot_model, strategy, using):
+    """ Encodes copied values by `get_state_doc` as calculated snapshots do """
+
+    if strategy != BACKFILL_CURRENT or not snapshot_model._state_doc:  # noqa: protected-access
+        return
+    # `state_docs` imports the models, which import the signals
+    backfill_state_docs = import_string(
+        'django_documents_tools.state_docs.backfill_state_docs')
+    backfill_state_docs(snapshot_model, using=using)
+
+
+def _process_operation(fake_apps, app, operation, using=DEFAULT_DB_ALIAS):
     is_rename = isinstance(operation, migrations.RenameField)
     is_remove = isinstance(operation, migrations.RemoveField)
-    action = is_remove or is_rename
+    is_add = isinstance(operation, migrations.AddField)
+    action = is_remove or is_rename or is_add
     if not action:
         return
 
     try:
-        model = apps.get_model(app, operation.model_name)
+        documented_model = apps.get_model(app, operation.model_name)
     except LookupError:
-        model = None
-    model = getattr(getattr(model, 'changes', None), 'model', None)
+        documented_model = None
+    model = getattr(getattr(documented_model, 'changes', None), 'model', None)
     if not model:
         return
+
+    if is_add:
+        if operation.name not in model._all_documented_fields:  # noqa: protected-access
+            return
+        snapshot_model = model.snapshot.field.related_model
+        strategy = snapshot_model._add_field_backfill.get(  # noqa: protected-access
+            operation.name, BACKFILL_CURRENT)
+        _add_field(
+            fake_apps.get_model(app, operation.model_name),
+            fake_apps.get_model(app, snapshot_model._meta.model_name),  # noqa: protected-access
+            operation.name, strategy, using)
+        _sync_state_docs(snapshot_model, strategy, using)
+        return
+
+    snapshot_model = fake_apps.get_model(
+        app, model.snapshot.field.related_model._meta.model_name)  # noqa: protected-access
     model = fake_apps.get_model(app, model._meta.model_name)  # noqa: protected-access
     if not model:
         return
 
     if is_rename:
         _rename_field(model, operation.old_name, operation.new_name)
+        _rename_state_doc_key(
+            snapshot_model, operation.old_name, operation.new_name, using)
     if is_remove:
         _remove_field(model, operation.name)
+        _remove_state_doc_key(snapshot_model, operation.name, using)
 
 
-@receiver(post_migrate)
 def process_migrate(
         apps: Union[StateApps, Tuple]=(), # noqa: redefined-outer-name
         plan: Union[List[Tuple[migrations.Migration, bool]], Tuple] = (),
-        **kwargs):
+        using=DEFAULT_DB_ALIAS, **kwargs):
+    """ Connected for this app only: the same plan is sent to every app """
+
     for migration, is_reverse in plan:
         if is_reverse:
             continue
         for operation in migration.operations:
-            _process_operation(apps, migration.app_label, operation)
+            _process_operation(
+                apps, migration.app_label, operation, using=using)
 
 
 # providing_args=['documented_instance', 'change', 'updated_fields']
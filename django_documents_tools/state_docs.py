@@ -0,0 +1,50 @@
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import BaseSnapshot
+from .settings import tools_settings
+
+
+def get_state_doc_models():
+    """ Snapshot models keeping `state_doc` """
+
+    return [
+        model for model in apps.get_models()
+        if issubclass(model, BaseSnapshot) and model._state_doc]  # noqa: protected-access
+
+
+def backfill_state_docs(snapshot_model, batch_size=None,
+                        using=DEFAULT_DB_ALIAS):
+    """ Writes `state_doc` of live snapshots which differ from their state
+
+        Snapshots are read in order of the documented object and the date,
+        states are folded on the way and written by `bulk_update` in
+        batches. Returns the number of updated snapshots.
+    """
+
+    batch_size = batch_size or tools_settings.STATE_DOC_BACKFILL_BATCH_SIZE
+    change_model = snapshot_model.changes.field.model
+    documented_field = change_model._documented_model_field  # noqa: protected-access
+    attname = f'{documented_field}_id'
+    snapshots = snapshot_model.objects.using(using).filter(
+        deleted__isnull=True).order_by(documented_field, 'history_date')
+
+    updated, pending = 0, []
+    documented_pk, state = None, {}
+    for snapshot in snapshots.iterator(chunk_size=batch_size):
+        if getattr(snapshot, attname) != documented_pk:
+            documented_pk, state = getattr(snapshot, attname), {}
+        own_state = snapshot.get_own_state(raw=True)
+        state = {**state, **own_state} if snapshot.is_delta else own_state
+        state_doc = snapshot.get_state_doc(state)
+        if snapshot.state_doc != state_doc:
+            snapshot.state_doc = state_doc
+            pending.append(snapshot)
+        if len(pending) >= batch_size:
+            updated += snapshot_model.objects.using(using).bulk_update(
+                pending, ['state_doc'])
+            pending = []
+    if pending:
+        updated += snapshot_model.objects.using(using).bulk_update(
+            pending, ['state_doc'])
+    return updated
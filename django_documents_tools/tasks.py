@@ -4,6 +4,9 @@ from typing import Iterable
 from celery import app, Task
 from django.apps import apps
 
+from .compaction import compact_snapshots
+from .deletion import soft_delete_history
+
 
 class StartTimeTask(Task):  # noqa: abstract-method
     def apply_async(self, args=None, kwargs=None, *_args, **_kwargs):  # noqa: pylint=arguments-differ
@@ -26,3 +29,23 @@ def apply_postponed_documents(
         for document in documents_qs:
             if document.building.changes.apply_to_object():
                 document.building.save()
+
+
+@app.shared_task(base=StartTimeTask)
+def compact_documented_snapshots(
+        model_names: Iterable[str], start_time: str):
+    today = datetime.fromisoformat(start_time).date()
+    for model_str in model_names:
+        app_label, model_name = model_str.split('.')
+        model = apps.get_model(app_label=app_label, model_name=model_name)
+        compact_snapshots(model, today=today)
+
+
+@app.shared_task
+def soft_delete_documented_history(
+        model_str: str, documented_pk, deletion_time: str, using: str):
+    app_label, model_name = model_str.split('.')
+    model = apps.get_model(app_label=app_label, model_name=model_name)
+    soft_delete_history(
+        model, documented_pk, datetime.fromisoformat(deletion_time),
+        using=using)
@@ -1,7 +1,11 @@
+import copy
+import functools
 import os
-from collections import Counter
+import time
+from collections import Counter, defaultdict
 
 from django.core.exceptions import ValidationError
+from django.db.models import UniqueConstraint
 from django.utils import timezone
 from django.utils.deconstruct import deconstructible
 
@@ -17,12 +21,107 @@ def get_change_attachment_file_path(instance, file_name):
     return os.path.join(app_label, model_name, file_name)
 
 
+_FACTORY_CACHE = {}
+_FACTORY_STATS = defaultdict(lambda: {'calls': 0, 'builds': 0, 'seconds': 0})
+
+
+def memoize_factory(func):
+    """ Shares generated classes between the calls with the same arguments
+
+        Factories have to receive already resolved base classes, so that
+        overridden bases produce new classes.
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        stats = _FACTORY_STATS[func.__name__.lstrip('_')]
+        stats['calls'] += 1
+        key = (func, args, tuple(sorted(kwargs.items())))
+        try:
+            return _FACTORY_CACHE[key]
+        except KeyError:
+            pass
+        except TypeError:  # unhashable arguments
+            key = None
+
+        started = time.perf_counter()
+        result = func(*args, **kwargs)
+        stats['builds'] += 1
+        stats['seconds'] += time.perf_counter() - started
+        if key is not None:
+            _FACTORY_CACHE[key] = result
+        return result
+
+    return wrapper
+
+
+def get_factories_report():
+    """ Returns calls, builds and build time (including nested factories)
+        per generated class factory """
+
+    return {name: dict(stats) for name, stats in _FACTORY_STATS.items()}
+
+
+def clear_factories_cache():
+    _FACTORY_CACHE.clear()
+    _FACTORY_STATS.clear()
+
+
 def check_subclass(base, original):
     if not issubclass(base, original):
         raise Exception(
             f'{base.__name__} must be subclass of {original.__name__}')
 
 
+def _get_unique_check_fields(instance, changed):
+    """ Changed fields and the fields of unique checks including them """
+
+    unique_checks, date_checks = instance._get_unique_checks()  # noqa: protected-access
+    groups = [set(check) for _, check in unique_checks]
+    groups += [{field, unique_for} for _, _, field, unique_for in date_checks]
+    groups += [
+        set(constraint.fields)
+        for _, constraints in instance.get_constraints()
+        for constraint in constraints
+        if isinstance(constraint, UniqueConstraint)]
+    fields = set(changed)
+    for group in groups:
+        if group & set(changed):
+            fields |= group
+    return fields
+
+
+def _validate_documented_copy(documented_instance, kwargs, fields):
+    """ Validates changes against an in-memory copy of documented instance
+
+        Only field level validators of `fields` are run, unique checks and
+        constraints are done only for the ones including a field which
+        value is actually changed.
+    """
+
+    instance = copy.copy(documented_instance)
+    instance._state = copy.copy(documented_instance._state)  # noqa: protected-access
+    instance._state.fields_cache = dict(  # noqa: protected-access
+        documented_instance._state.fields_cache)  # noqa: protected-access
+    changed = setattrs(instance, **kwargs)
+    all_fields = [field.name for field in instance._meta.fields]  # noqa: protected-access
+    instance.clean_fields(
+        exclude=[name for name in all_fields if name not in fields])
+    unique_fields = _get_unique_check_fields(instance, changed)
+    exclude = [name for name in all_fields if name not in unique_fields]
+    instance.validate_unique(exclude=exclude)
+    instance.validate_constraints(exclude=exclude)
+
+
+def _validate_documented(documented_instance, kwargs, fields):
+    if tools_settings.LIGHTWEIGHT_CHANGE_VALIDATION:
+        _validate_documented_copy(documented_instance, kwargs, fields)
+    else:
+        setattrs(documented_instance, **kwargs)
+        documented_instance.full_clean()
+        documented_instance.refresh_from_db()
+
+
 def validate_change_attrs(model, change, attrs):
     documented_model_field = model._documented_model_field  # noqa: protected-access
     documented_model = model._meta.get_field(  # noqa: protected-access
@@ -31,6 +130,7 @@ def validate_change_attrs(model, change, attrs):
     if change and getattr(change, documented_model_field):
         documented_instance = getattr(change, documented_model_field)
         kwargs = change.get_changes()
+        fields = kwargs.keys()
         document_fields = attrs.get('document_fields')
         if change.snapshot and document_fields:
             changes = {}
@@ -38,18 +138,15 @@ def validate_change_attrs(model, change, attrs):
                 if field_name in attrs.keys():
                     changes[field_name] = attrs[field_name]
             kwargs = {**change.snapshot.state, **changes}
+            fields = document_fields
 
-        setattrs(documented_instance, **kwargs)
-        documented_instance.full_clean()
-        documented_instance.refresh_from_db()
+        _validate_documented(documented_instance, kwargs, fields)
     else:
         change = model(**attrs)
         documented_instance = getattr(change, documented_model_field)
         kwargs = change.get_changes()
         if documented_instance:
-            setattrs(documented_instance, **kwargs)
-            documented_instance.full_clean()
-            documented_instance.refresh_from_db()
+            _validate_documented(documented_instance, kwargs, kwargs.keys())
         elif tools_settings.CREATE_BUSINESS_ENTITY_AFTER_CHANGE_CREATED:
             new_documented = documented_model(**kwargs)
             new_documented.full_clean()
@@ -88,6 +185,7 @@ def apply_change_receiver(sender, **kwargs):
             raise BusinessEntityCreationIsNotAllowedError()
 
         applicable_date = timezone.now().date()
-        new_documented.changes.apply_to_object(date=applicable_date)
-        new_documented.save(apply_documents=False)
+        new_documented.changes.apply_to_object(
+            date=applicable_date, using=kwargs['using'])
+        new_documented.save(using=kwargs['using'], apply_documents=False)
         change.refresh_from_db()
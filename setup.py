@@ -28,7 +28,8 @@ setup(
     classifiers=[
         'Intended Audience :: Developers',
         'License :: OSI Approved :: BSD License',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Framework :: Django :: 4.2',
         'Programming Language :: Python :: Implementation :: CPython'
     ],
     zip_safe=False,
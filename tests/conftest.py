@@ -15,7 +15,15 @@ def pytest_configure(config):
                 'PASSWORD': 'postgres',
                 'HOST': '127.0.0.1',
                 'PORT': '5432'
-            }
+            },
+            'replica': {
+                'ENGINE': 'django.contrib.gis.db.backends.postgis',
+                'NAME': 'repo_replica',
+                'USER': 'postgres',
+                'PASSWORD': 'postgres',
+                'HOST': '127.0.0.1',
+                'PORT': '5432'
+            },
         },
         SITE_ID=1,
         SECRET_KEY='not very secret in tests',
@@ -69,3 +77,21 @@ def book_snapshot_model(book_change_model):
 @pytest.fixture
 def book_change_attachment_model(book_change_model):
     return book_change_model.attachment.field.related_model
+
+
+@pytest.fixture
+def pk_serializers(settings):
+    """ Serializers using `pk`, test models have no `guid` and `version` """
+
+    settings.DOCUMENTS_TOOLS = {
+        'BASE_CHANGE_SERIALIZER': 'tests.serializers.PkChangeSerializer',
+        'BASE_SNAPSHOT_SERIALIZER': 'tests.serializers.PkSnapshotSerializer',
+        'BASE_DOCUMENTED_MODEL_LINK_SERIALIZER': (
+            'tests.serializers.PkDocumentedModelLinkSerializer'),
+        'BASE_SNAPSHOT_LINK_SERIALIZER': (
+            'tests.serializers.PkSnapshotLinkSerializer'),
+        'BASE_CHANGE_ATTACHMENT_LINK_SERIALIZER': (
+            'tests.serializers.PkChangeAttachmentLinkSerializer'),
+        'BASE_CHANGE_ATTACHMENT_SERIALIZER': (
+            'tests.serializers.PkChangeAttachmentSerializer'),
+    }
@@ -1,11 +1,23 @@
 import rest_framework_filters as filters
 
-from .models import Book
+from .models import Author, Book
+
+
+class AuthorFilter(filters.FilterSet):
+    class Meta:
+        model = Author
+        fields = {
+            'last_name': ['exact'],
+        }
 
 
 class BookFilter(filters.FilterSet):
+    author = filters.RelatedFilter(
+        AuthorFilter, queryset=Author.objects.all())
+
     class Meta:
         model = Book
         fields = {
             'uid': ['exact'],
+            'title': ['exact'],
         }
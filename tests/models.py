@@ -76,3 +76,24 @@ class Book(Documented):
 
     def __str__(self):  # noqa: invalid-str-returned
         return self.title
+
+
+class Article(BaseDocumented):
+
+    uid = models.UUIDField(default=uuid4, primary_key=True)
+    title = models.CharField(max_length=200)
+    rating = models.IntegerField(null=True, blank=True)
+
+    changes = Changes(
+        excluded_fields=('deleted', 'created', 'updated'),
+        change_opts={
+            'bases': (BaseChangeModel,),
+            'partitioning': {'interval': 'month'},
+            'archive': True},
+        snapshot_opts={
+            'bases': (BaseBaseSnapshotModel,),
+            'unit_size_in_days': 1,
+            'keyframe_interval': 3,
+            'last_changes': ('rating',),
+            'state_doc': True,
+            'archive': True})
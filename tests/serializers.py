@@ -1,7 +1,8 @@
 from rest_framework import serializers
 from django_documents_tools.api.serializers import (
     BaseChangeSerializer, BaseSnapshotSerializer,
-    BaseDocumentedModelLinkSerializer, BaseChangeAttachmentSerializer)
+    BaseDocumentedModelLinkSerializer, BaseChangeAttachmentSerializer,
+    BaseSnapshotLinkSerializer, BaseChangeAttachmentLinkSerializer)
 
 from .test_models import Book, Author
 
@@ -70,3 +71,35 @@ class UnknownBookSerializer(serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ('uid', 'title', 'author', 'summary', 'isbn', 'is_published')
+
+
+class PkChangeSerializer(BaseChangeSerializer):
+    class Meta:
+        fields = (
+            'pk', 'document_name', 'document_date', 'document_link',
+            'document_is_draft', 'document_fields', 'attachment', 'snapshot')
+
+
+class PkSnapshotSerializer(BaseSnapshotSerializer):
+    class Meta:
+        fields = ('pk', 'document_fields', 'history_date', 'updated')
+
+
+class PkDocumentedModelLinkSerializer(BaseDocumentedModelLinkSerializer):
+    class Meta:
+        fields = ('pk', )
+
+
+class PkSnapshotLinkSerializer(BaseSnapshotLinkSerializer):
+    class Meta:
+        fields = ('pk', )
+
+
+class PkChangeAttachmentLinkSerializer(BaseChangeAttachmentLinkSerializer):
+    class Meta:
+        fields = ('pk', )
+
+
+class PkChangeAttachmentSerializer(BaseChangeAttachmentSerializer):
+    class Meta:
+        fields = ('pk', 'file')
@@ -0,0 +1,107 @@
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from django_documents_tools.archive import (
+    archive_deleted_history, get_archived_models, restore_archived_history)
+from .models import Article
+
+
+ArticleChange = Article.changes.model
+ArticleSnapshot = ArticleChange.snapshot.field.related_model
+
+
+def _create_article():
+    article = Article.objects.create(title='initial')
+    for days, title in ((3, 'a'), (2, 'b'), (1, 'c')):
+        ArticleChange.objects.create(
+            article=article, document_is_draft=False, title=title,
+            document_date=timezone.now() - timedelta(days=days),
+            document_fields=['title'])
+    return article
+
+
+def _delete(article):
+    article.deleted = timezone.now() - timedelta(days=1)
+    article.save()
+
+
+def _archive(before):
+    for model in get_archived_models():
+        archive_deleted_history(model, before, batch_size=2)
+
+
+@pytest.mark.django_db
+class TestArchive:
+
+    @staticmethod
+    def test_archive_models():
+        assert get_archived_models() == [ArticleChange, ArticleSnapshot]
+        assert ArticleChange._archive_model._meta.db_table == (  # noqa: protected-access
+            f'{ArticleChange._meta.db_table}_archive')  # noqa: protected-access
+
+    @staticmethod
+    def test_archive_deleted():
+        deleted, kept = _create_article(), _create_article()
+        _delete(deleted)
+
+        _archive(timezone.now())
+
+        assert not ArticleChange.objects.filter(article=deleted).exists()
+        assert not ArticleSnapshot.objects.filter(article=deleted).exists()
+        assert ArticleChange._archive_model.objects.filter(  # noqa: protected-access
+            article=deleted.pk).count() == 3
+        assert ArticleSnapshot._archive_model.objects.filter(  # noqa: protected-access
+            article=deleted.pk, archived__isnull=False).count() == 3
+        assert ArticleChange.objects.filter(article=kept).count() == 3
+        assert ArticleSnapshot.objects.filter(article=kept).count() == 3
+
+    @staticmethod
+    def test_recently_deleted_are_kept():
+        article = _create_article()
+        _delete(article)
+
+        _archive(timezone.now() - timedelta(days=2))
+
+        assert ArticleChange.objects.filter(article=article).count() == 3
+        assert not ArticleChange._archive_model.objects.exists()  # noqa: protected-access
+
+    @staticmethod
+    def test_restore():
+        article = _create_article()
+        _delete(article)
+        _archive(timezone.now())
+
+        for model in reversed(get_archived_models()):
+            restore_archived_history(model, documented_pks=[article.pk])
+
+        assert ArticleChange.objects.filter(article=article).count() == 3
+        assert ArticleSnapshot.objects.filter(article=article).count() == 3
+        assert not ArticleSnapshot._archive_model.objects.exists()  # noqa: protected-access
+
+    @staticmethod
+    def test_command():
+        article = _create_article()
+        _delete(article)
+
+        call_command('archive_deleted_history', older_than_days=0)
+        assert not ArticleChange.objects.filter(article=article).exists()
+
+        call_command('archive_deleted_history', restore=True)
+        assert ArticleChange.objects.filter(article=article).count() == 3
+
+    @staticmethod
+    def test_command_restore_documented_id():
+        article, other = _create_article(), _create_article()
+        _delete(article)
+        _delete(other)
+        call_command('archive_deleted_history', older_than_days=0)
+
+        call_command(
+            'archive_deleted_history', restore=True,
+            documented_ids=[str(article.pk)])
+
+        assert ArticleChange.objects.filter(article=article).count() == 3
+        assert not ArticleChange.objects.filter(article=other).exists()
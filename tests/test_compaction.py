@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+
+import pytest
+from django.utils import timezone
+
+from django_documents_tools.compaction import EPOCH, compact_snapshots
+from .models import Article, Book
+from .test_models import _create_book, _create_book_change
+
+
+def _get_bucket_start(days_ago, unit_size):
+    start = timezone.now().date() - timedelta(days=days_ago)
+    start -= timedelta(days=(start - EPOCH).days % unit_size)
+    return datetime.combine(start, datetime.min.time()) + timedelta(hours=12)
+
+
+def _get_snapshots(documented):
+    return list(documented.snapshots.model.objects.filter(
+        **{documented._meta.model_name: documented}).order_by(  # noqa: protected-access
+            'history_date'))
+
+
+@pytest.mark.django_db
+class TestCompactSnapshots:
+
+    @staticmethod
+    def test_merge_old_buckets():
+        book = _create_book()
+        start = _get_bucket_start(60, 7)
+        old_changes = [
+            _create_book_change(
+                document_is_draft=False, book=book, title=f'title {day}',
+                document_fields=['title'],
+                document_date=start + timedelta(days=day))
+            for day in range(3)]
+        _create_book_change(
+            document_is_draft=False, book=book, title='recent',
+            document_fields=['title'],
+            document_date=timezone.now() - timedelta(days=1))
+        latest_state = _get_snapshots(book)[-1].state
+
+        removed = compact_snapshots(Book, retention=((30, 7),))
+
+        snapshots = _get_snapshots(book)
+        assert removed == 2
+        assert len(snapshots) == 2
+        assert snapshots[0].title == 'title 2'
+        assert snapshots[-1].state == latest_state
+        assert {
+            change.snapshot_id for change in
+            Book.changes.model.objects.filter(
+                pk__in=[change.pk for change in old_changes])} == {
+                    snapshots[0].pk}
+        book.refresh_from_db()
+        assert book.title == 'recent'
+
+    @staticmethod
+    def test_save_keeps_compacted_snapshots():
+        book = _create_book()
+        start = _get_bucket_start(60, 7)
+        for day in range(3):
+            _create_book_change(
+                document_is_draft=False, book=book, title=f'title {day}',
+                document_fields=['title'],
+                document_date=start + timedelta(days=day))
+        compact_snapshots(Book, retention=((30, 7),))
+        snapshots = _get_snapshots(book)
+
+        book.save()
+
+        assert _get_snapshots(book) == snapshots
+        assert len(snapshots) == 1
+
+    @staticmethod
+    def test_change_in_compacted_range():
+        book = _create_book()
+        start = _get_bucket_start(60, 7)
+        for day in (0, 2):
+            _create_book_change(
+                document_is_draft=False, book=book, title=f'title {day}',
+                document_fields=['title'],
+                document_date=start + timedelta(days=day))
+        compact_snapshots(Book, retention=((30, 7),))
+
+        _create_book_change(
+            document_is_draft=False, book=book, title='backdated',
+            document_fields=['title'],
+            document_date=start + timedelta(days=1))
+
+        snapshots = _get_snapshots(book)
+        assert len(snapshots) == 1
+        assert snapshots[0].title == 'title 2'
+        assert snapshots[0].changes.count() == 3
+
+    @staticmethod
+    def test_recent_snapshots_are_kept():
+        book = _create_book()
+        for days in range(1, 4):
+            _create_book_change(
+                document_is_draft=False, book=book,
+                document_date=timezone.now() - timedelta(days=days))
+
+        assert compact_snapshots(Book, retention=((30, 7),)) == 0
+        assert len(_get_snapshots(book)) == 3
+
+    @staticmethod
+    def test_delta_snapshots():
+        article = Article.objects.create(title='initial')
+        change_model = Article.changes.model
+        start = _get_bucket_start(400, 30)
+        for day, fields in enumerate((
+                {'title': 'a', 'rating': 1}, {'rating': 2}, {'rating': 3},
+                {'title': 'b'})):
+            change_model.objects.create(
+                article=article, document_is_draft=False,
+                document_date=start + timedelta(days=day),
+                document_fields=list(fields), **fields)
+        change_model.objects.create(
+            article=article, document_is_draft=False,
+            document_date=start + timedelta(days=40),
+            document_fields=['rating'], rating=4)
+
+        removed = compact_snapshots(Article, retention=((30, 7), (365, 30)))
+
+        snapshots = _get_snapshots(article)
+        assert removed == 3
+        assert snapshots[0].is_keyframe
+        assert snapshots[0].state == {'title': 'b', 'rating': 3}
+        assert snapshots[-1].state == {'title': 'b', 'rating': 4}
@@ -0,0 +1,69 @@
+import pytest
+
+from django_documents_tools.api.filters import (
+    get_change_filter, get_change_attachment_filter)
+from tests.models import Book, BookChange, BookChangeAttachment
+from tests.test_models import _create_author, _create_book, _create_book_change
+from tests.viewsets import BookViewSet
+
+
+def _filter(filterset_class, **data):
+    model = filterset_class._meta.model  # noqa: protected-access
+    return filterset_class(data=data, queryset=model.objects.all()).qs
+
+
+@pytest.mark.django_db
+class TestRelatedFilters:
+
+    @staticmethod
+    def test_nested_documented_filter_sql():
+        change_filter = get_change_filter(BookChange, BookViewSet)
+
+        sql = str(_filter(
+            change_filter, book__author__last_name='Tolstoy').query)
+
+        assert sql.count('EXISTS') == 2
+        assert ' IN (SELECT' not in sql
+        assert 'DISTINCT' not in sql
+
+    @staticmethod
+    def test_nested_documented_filter():
+        book = _create_book()
+        book.author = _create_author(last_name='Tolstoy')
+        book.save()
+        change = _create_book_change(book=book)
+        _create_book_change(book=_create_book())
+        change_filter = get_change_filter(BookChange, BookViewSet)
+
+        queryset = _filter(change_filter, book__author__last_name='Tolstoy')
+
+        assert list(queryset) == [change]
+
+    @staticmethod
+    def test_attachment_filter_sql():
+        change_filter = get_change_filter(BookChange, BookViewSet)
+        attachment_filter = get_change_attachment_filter(
+            BookChangeAttachment, change_filter)
+
+        sql = str(_filter(attachment_filter, change__book__title='t').query)
+
+        assert sql.count('EXISTS') == 2
+        assert ' IN (SELECT' not in sql
+
+
+@pytest.mark.django_db
+class TestIsDeletedFilter:
+
+    @staticmethod
+    def test_deferred_history_deletion(settings):
+        settings.DOCUMENTS_TOOLS = {'DELETE_CASCADE_DEFERRED': True}
+        deleted_book, book = _create_book(), _create_book()
+        deleted_change = _create_book_change(book=deleted_book)
+        change = _create_book_change(book=book)
+        Book.objects.filter(pk=deleted_book.pk).update(
+            deleted=deleted_change.document_date)
+        change_filter = get_change_filter(BookChange, BookViewSet)
+
+        assert list(_filter(change_filter, is_deleted=True)) == [
+            deleted_change]
+        assert list(_filter(change_filter, is_deleted=False)) == [change]
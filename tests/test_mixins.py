@@ -0,0 +1,438 @@
+import csv
+import json
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory
+from rest_framework.viewsets import ReadOnlyModelViewSet
+from rest_framework_filters import FilterSet
+from rest_framework_filters.backends import RestFrameworkFilterBackend
+
+from django_documents_tools.api.mixins import AsOfMixin
+from django_documents_tools.api.viewsets import (
+    get_change_viewset, get_snapshot_viewset, get_as_of_viewset)
+from .models import Article, Book
+from .test_models import (
+    _create_article_history, _create_book, _create_book_change, _days_ago)
+from .viewsets import BookViewSet
+
+
+def _export(viewset, **params):
+    view = viewset.as_view(
+        {'get': 'export'}, filter_backends=[RestFrameworkFilterBackend])
+    response = view(APIRequestFactory().get('/', params))
+    assert response.status_code == 200
+    return response, b''.join(response.streaming_content).decode()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('pk_serializers')
+class TestExport:
+
+    @staticmethod
+    def test_ndjson():
+        book = _create_book()
+        change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'])
+
+        response, content = _export(get_change_viewset(BookViewSet))
+
+        rows = [json.loads(line) for line in content.splitlines()]
+        assert response['Content-Type'] == 'application/x-ndjson'
+        assert len(rows) == 1
+        assert rows[0]['pk'] == str(change.pk)
+        assert rows[0]['book'] == str(book.pk)
+        assert rows[0]['author'] == str(change.author.pk)
+        assert rows[0]['document_fields'] == ['title']
+        assert 'attachment' in rows[0]
+
+    @staticmethod
+    def test_csv():
+        book = _create_book()
+        _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'])
+        viewset = get_snapshot_viewset(
+            get_change_viewset(BookViewSet), BookViewSet)
+
+        response, content = _export(viewset, export_format='csv')
+
+        rows = list(csv.DictReader(content.splitlines()))
+        assert response['Content-Type'] == 'text/csv'
+        assert len(rows) == 1
+        assert rows[0]['title'] == 'title'
+        assert rows[0]['book'] == str(book.pk)
+        assert json.loads(rows[0]['document_fields']) == ['title']
+
+    @staticmethod
+    def test_all_fields():
+        book = _create_book()
+        change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'])
+        viewset = get_change_viewset(BookViewSet)
+        base_serializer = viewset.serializer_class
+
+        class Serializer(base_serializer):
+            class Meta(base_serializer.Meta):
+                fields = '__all__'
+
+        _, content = _export(type(
+            'AllFieldsViewSet', (viewset, ), {'serializer_class': Serializer}))
+
+        row = json.loads(content)
+        assert row['title'] == change.title
+        assert row['book'] == str(book.pk)
+
+    @staticmethod
+    def test_filter():
+        book = _create_book()
+        _create_book_change(document_is_draft=False, book=book)
+        _create_book_change(book=book)
+
+        _, content = _export(
+            get_change_viewset(BookViewSet), document_is_draft='false')
+
+        assert len(content.splitlines()) == 1
+
+    @staticmethod
+    def test_unknown_format():
+        view = get_change_viewset(BookViewSet).as_view({'get': 'export'})
+        response = view(APIRequestFactory().get('/', {'export_format': 'xml'}))
+
+        assert response.status_code == 400
+
+
+def _get(viewset, action, headers=None, **kwargs):
+    view = viewset.as_view({'get': action})
+    request = APIRequestFactory().get('/', **(headers or {}))
+    return view(request, **kwargs)
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('pk_serializers')
+class TestConditionalGet:
+
+    @staticmethod
+    def test_list():
+        book = _create_book()
+        _create_book_change(document_is_draft=False, book=book)
+        viewset = get_change_viewset(BookViewSet)
+
+        response = _get(viewset, 'list')
+        etag = response['ETag']
+        not_modified = _get(viewset, 'list', {'HTTP_IF_NONE_MATCH': etag})
+        _create_book_change(document_is_draft=False, book=book)
+        modified = _get(viewset, 'list', {'HTTP_IF_NONE_MATCH': etag})
+
+        assert response.status_code == 200
+        assert etag.startswith('W/"')
+        assert not_modified.status_code == 304
+        assert not hasattr(not_modified, 'data')
+        assert modified.status_code == 200
+        assert modified['ETag'] != etag
+
+    @staticmethod
+    def test_list_row_removed():
+        book = _create_book()
+        first = _create_book_change(document_is_draft=False, book=book)
+        _create_book_change(document_is_draft=False, book=book)
+        viewset = get_change_viewset(BookViewSet)
+        etag = _get(viewset, 'list')['ETag']
+
+        # max(updated) stays the same
+        type(first).objects.filter(pk=first.pk).delete()
+        response = _get(viewset, 'list', {'HTTP_IF_NONE_MATCH': etag})
+
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    @staticmethod
+    def test_list_reads_page_only():
+        book = _create_book()
+        _create_book_change(document_is_draft=False, book=book)
+        viewset = get_change_viewset(BookViewSet)
+        etag = _get(viewset, 'list')['ETag']
+
+        with CaptureQueriesContext(connection) as context:
+            response = _get(viewset, 'list', {'HTTP_IF_NONE_MATCH': etag})
+
+        assert response.status_code == 304
+        assert len(context.captured_queries) == 1
+        assert 'MAX(' not in context.captured_queries[0]['sql']
+
+    @staticmethod
+    def test_last_modified():
+        book = _create_book()
+        change = _create_book_change(document_is_draft=False, book=book)
+        viewset = get_change_viewset(BookViewSet)
+
+        current = _get(viewset, 'list')
+        type(change).objects.update(
+            updated=timezone.now() - timedelta(minutes=1))
+        response = _get(viewset, 'list')
+        not_modified = _get(viewset, 'list', {
+            'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']})
+
+        # The second of the last modification is not over yet
+        assert not current.has_header('Last-Modified')
+        assert not_modified.status_code == 304
+
+    @staticmethod
+    def test_detail():
+        book = _create_book()
+        change = _create_book_change(document_is_draft=False, book=book)
+        viewset = get_snapshot_viewset(
+            get_change_viewset(BookViewSet), BookViewSet)
+        guid = change.snapshot.pk
+
+        response = _get(viewset, 'retrieve', guid=guid)
+        not_modified = _get(
+            viewset, 'retrieve', {'HTTP_IF_NONE_MATCH': response['ETag']},
+            guid=guid)
+
+        assert response.status_code == 200
+        assert not_modified.status_code == 304
+
+    @staticmethod
+    def test_detail_not_found():
+        viewset = get_change_viewset(BookViewSet)
+
+        response = _get(
+            viewset, 'retrieve', guid='00000000-0000-0000-0000-000000000000')
+
+        assert response.status_code == 404
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('pk_serializers')
+class TestTimeline:
+
+    @staticmethod
+    def _create_history():
+        book = _create_book()
+        now = timezone.now()
+        _create_book_change(
+            document_is_draft=False, book=book, title='first',
+            document_date=now - timedelta(days=4))
+        _create_book_change(
+            document_is_draft=False, book=book, title='second',
+            document_fields=['title'], document_date=now - timedelta(days=2))
+        change = _create_book_change(
+            document_is_draft=False, book=book, title='third',
+            document_fields=['author'], document_date=now - timedelta(days=1))
+        return book, change, now
+
+    @staticmethod
+    def _timeline(**params):
+        viewset = get_snapshot_viewset(
+            get_change_viewset(BookViewSet), BookViewSet)
+        view = viewset.as_view({'get': 'timeline'})
+        return view(APIRequestFactory().get('/', params))
+
+    def test_timeline(self):
+        book, change, now = self._create_history()
+
+        response = self._timeline(
+            book=book.pk, date_from=(now - timedelta(days=3)).isoformat())
+
+        assert response.status_code == 200
+        initial = response.data['initial']
+        assert initial['state']['title'] == 'first'
+        assert set(initial['state']) == {
+            'title', 'author', 'isbn', 'is_published', 'summary'}
+        assert [item['changes'] for item in response.data['timeline']] == [
+            {'title': 'second'}, {'author': change.author.pk}]
+
+    def test_date_to(self):
+        book, _, now = self._create_history()
+
+        response = self._timeline(
+            book=book.pk, date_to=(now - timedelta(days=2)).isoformat())
+
+        assert response.data['initial']['state']['title'] == 'first'
+        assert [item['changes'] for item in response.data['timeline']] == [
+            {'title': 'second'}]
+
+    def test_queryset_scoping(self):
+        book, _, now = self._create_history()
+        viewset = get_snapshot_viewset(
+            get_change_viewset(BookViewSet), BookViewSet)
+        scoped_viewset = type('ScopedViewSet', (viewset, ), {
+            'get_queryset': lambda self: viewset.get_queryset(self).none()})
+        view = scoped_viewset.as_view({'get': 'timeline'})
+
+        response = view(APIRequestFactory().get('/', {
+            'book': book.pk, 'date_from': now.isoformat()}))
+
+        assert response.data == {'initial': None, 'timeline': []}
+
+    def test_object_required(self):
+        assert self._timeline().status_code == 400
+        assert self._timeline(book='foo').status_code == 400
+
+
+@pytest.mark.django_db
+class TestAsOf:
+
+    @staticmethod
+    def _create_history():
+        book = _create_book()
+        now = timezone.now()
+        _create_book_change(
+            document_is_draft=False, book=book, title='first',
+            document_date=now - timedelta(days=4))
+        _create_book_change(
+            document_is_draft=False, book=book, title='second',
+            document_fields=['title'], document_date=now - timedelta(days=2))
+        return book, now
+
+    @staticmethod
+    def _request(actions, params, **kwargs):
+        view = get_as_of_viewset(BookViewSet).as_view(
+            actions, filter_backends=[RestFrameworkFilterBackend])
+        return view(APIRequestFactory().get('/', params), **kwargs)
+
+    def test_list(self):
+        book, now = self._create_history()
+        _create_book()
+        as_of = (now - timedelta(days=3)).date().isoformat()
+
+        response = self._request({'get': 'list'}, {'as_of': as_of})
+
+        assert response.status_code == 200
+        assert [(item['uid'], item['title']) for item in response.data] == [
+            (str(book.pk), 'first')]
+
+    def test_filter_historical_values(self):
+        book, now = self._create_history()
+        as_of = (now - timedelta(days=3)).date().isoformat()
+
+        response = self._request(
+            {'get': 'list'}, {'as_of': as_of, 'title': 'first'})
+        assert [item['uid'] for item in response.data] == [str(book.pk)]
+
+        response = self._request(
+            {'get': 'list'}, {'as_of': as_of, 'title': 'second'})
+        assert response.data == []
+
+    def test_retrieve(self):
+        book, now = self._create_history()
+
+        response = self._request(
+            {'get': 'retrieve'}, {'as_of': now.date().isoformat()},
+            _uid=book.pk)
+
+        assert response.status_code == 200
+        assert response.data['title'] == 'second'
+        assert response.data['author']['uid'] == str(book.author.pk)
+
+    def test_queryset_scoping(self):
+        book, now = self._create_history()
+        hidden, _ = self._create_history()
+        scoped_viewset = type('ScopedViewSet', (BookViewSet, ), {
+            'get_queryset': lambda self: BookViewSet.get_queryset(
+                self).exclude(pk=hidden.pk)})
+        view = get_as_of_viewset(scoped_viewset).as_view({'get': 'list'})
+
+        response = view(APIRequestFactory().get(
+            '/', {'as_of': now.date().isoformat()}))
+
+        assert [item['uid'] for item in response.data] == [str(book.pk)]
+
+    def test_retrieve_by_other_lookup_field(self):
+        book, now = self._create_history()
+        viewset = type('IsbnViewSet', (BookViewSet, ), {
+            'lookup_field': 'isbn', 'lookup_url_kwarg': None})
+        view = get_as_of_viewset(viewset).as_view({'get': 'retrieve'})
+        Book.objects.filter(pk=book.pk).update(isbn='isbn-1')
+
+        response = view(
+            APIRequestFactory().get('/', {'as_of': now.date().isoformat()}),
+            isbn='isbn-1')
+
+        assert response.status_code == 200
+        assert response.data['uid'] == str(book.pk)
+
+    def test_without_as_of(self):
+        book, _ = self._create_history()
+
+        response = self._request({'get': 'list'}, {})
+
+        assert [item['title'] for item in response.data] == [book.title]
+
+    def test_unsafe_method(self):
+        book, now = self._create_history()
+        view = get_as_of_viewset(BookViewSet).as_view({'patch': 'update'})
+        request = APIRequestFactory().patch(
+            f'/?as_of={now.date().isoformat()}', {'title': 'patched'})
+
+        response = view(request, _uid=book.pk)
+
+        book.refresh_from_db()
+        assert response.status_code == 400
+        assert 'as_of' in response.data
+        assert book.title == 'second'
+
+    def test_invalid_as_of(self):
+        response = self._request({'get': 'list'}, {'as_of': 'yesterday'})
+
+        assert response.status_code == 400
+        assert 'as_of' in response.data
+
+
+class ArticleFilter(FilterSet):
+    class Meta:
+        model = Article
+        fields = ['title']
+
+
+class ArticleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Article
+        fields = ['uid', 'title', 'rating']
+
+
+class ArticleAsOfViewSet(AsOfMixin, ReadOnlyModelViewSet):
+    snapshot_model = Article.changes.model.snapshot.field.related_model
+    serializer_class = ArticleSerializer
+    filterset_class = ArticleFilter
+    queryset = Article.objects.all()
+    lookup_field = 'uid'
+
+
+@pytest.mark.django_db
+class TestAsOfDeltaSnapshots:
+
+    @staticmethod
+    def test_states_of_deltas():
+        articles = [_create_article_history() for _ in range(2)]
+
+        with CaptureQueriesContext(connection) as context:
+            instances = list(
+                ArticleAsOfViewSet().get_as_of_queryset(_days_ago(3)))
+
+        # Snapshots and one query folding all delta states
+        assert len(context.captured_queries) == 2
+        assert sorted(instance.pk for instance in instances) == sorted(
+            article.pk for article in articles)
+        assert {
+            (instance.title, instance.rating) for instance in instances} == {
+                ('a', 3)}
+
+    @staticmethod
+    def test_filters_refused():
+        _create_article_history()
+        view = ArticleAsOfViewSet.as_view(
+            {'get': 'list'}, filter_backends=[RestFrameworkFilterBackend])
+        as_of = _days_ago(3).isoformat()
+
+        response = view(APIRequestFactory().get('/', {'as_of': as_of}))
+        refused = view(APIRequestFactory().get(
+            '/', {'as_of': as_of, 'title': 'a'}))
+
+        assert [item['rating'] for item in response.data] == [3]
+        assert refused.status_code == 400
+        assert 'title' in str(refused.data['as_of'])
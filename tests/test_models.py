@@ -1,14 +1,22 @@
-from datetime import timedelta, datetime
+from datetime import date, timedelta, datetime
 
 import freezegun
 import pytest
+from asgiref.sync import async_to_sync
 from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models.signals import post_init
+from django.db.models.fields.json import KT
 from django.utils import timezone
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django_documents_tools import manager
 from django_documents_tools.exceptions import (
     BusinessEntityCreationIsNotAllowedError)
+from django_documents_tools.manager import arecalculate, get_change_records
+from django_documents_tools.models import BaseSnapshot
 
-from .models import Book, Address, Author
+from .models import Article, Book, Address, Author
 
 
 BookChange = Book.changes.model # noqa: invalid-name
@@ -53,6 +61,33 @@ def _create_book_change(
     return change
 
 
+def _create_article_change(article, days, **fields):
+    return Article.changes.model.objects.create(
+        article=article, document_is_draft=False,
+        document_date=timezone.now() - timedelta(days=days),
+        document_fields=list(fields), **fields)
+
+
+def _create_article_history():
+    """ Keyframe every third snapshot of `keyframe_interval=3` """
+
+    article = Article.objects.create(title='initial')
+    for days, fields in ((5, {'title': 'a', 'rating': 1}),
+                         (4, {'rating': 2}), (3, {'rating': 3}),
+                         (2, {'title': 'b'}), (1, {'rating': 5})):
+        _create_article_change(article, days, **fields)
+    return article
+
+
+def _get_article_snapshots(article):
+    return list(article.snapshots.model.objects.filter(
+        article=article).order_by('history_date'))
+
+
+def _days_ago(days):
+    return timezone.now().date() - timedelta(days=days)
+
+
 @pytest.mark.django_db
 def test_create_draft_changes():
     change = _create_book_change()
@@ -197,6 +232,37 @@ def test_delete_doc_object():
     assert Book.objects.filter(deleted__isnull=False).count() == 1
 
 
+@pytest.mark.django_db
+@override_settings(DOCUMENTS_TOOLS={
+    'CREATE_BUSINESS_ENTITY_AFTER_CHANGE_CREATED': True,
+    'DELETE_CASCADE_DEFERRED': True,
+    'DELETE_CASCADE_BATCH_SIZE': 1})
+def test_delete_doc_object_in_chunks(django_capture_on_commit_callbacks):
+    change = _create_book_change(document_is_draft=False)
+    book = change.book
+    _create_book_change(
+        document_is_draft=False, book=book, title='new',
+        document_date=timezone.now() + timedelta(days=1))
+
+    with django_capture_on_commit_callbacks() as callbacks:
+        book.deleted = timezone.now()
+        book.save()
+
+        assert BookChange.objects.filter(deleted__isnull=True).count() == 2
+        assert Book.objects.get().title == 'title'
+
+        assert not BookSnapshot.objects.as_of_many(
+            [book.pk], timezone.now().date())
+        assert book.changes.apply_to_object(
+            timezone.now().date() + timedelta(days=1)) is book
+        assert BookSnapshot.objects.filter(deleted__isnull=True).count() == 1
+
+    assert len(callbacks) == 1
+    callbacks[0]()
+    assert not BookChange.objects.filter(deleted__isnull=True).exists()
+    assert not BookSnapshot.objects.filter(deleted__isnull=True).exists()
+
+
 @pytest.mark.django_db
 @override_settings(DOCUMENTS_TOOLS={
     'CREATE_BUSINESS_ENTITY_AFTER_CHANGE_CREATED': True})
@@ -477,3 +543,423 @@ class TestChangeDocumentDate:
         book.refresh_from_db()
 
         assert book.title == 'bar'
+
+
+@pytest.mark.django_db
+class TestDeltaSnapshots:
+
+    @staticmethod
+    def test_keyframes():
+        article = _create_article_history()
+
+        snapshots = _get_article_snapshots(article)
+
+        assert [snapshot.is_keyframe for snapshot in snapshots] == [
+            True, False, False, True, False]
+        assert snapshots[1].document_fields == ['rating']
+        assert snapshots[1].title is None
+        assert snapshots[3].own_state == {'title': 'b', 'rating': 3}
+
+    @staticmethod
+    def test_state():
+        article = _create_article_history()
+
+        snapshots = _get_article_snapshots(article)
+
+        assert [snapshot.state for snapshot in snapshots] == [
+            {'title': 'a', 'rating': 1},
+            {'title': 'a', 'rating': 2},
+            {'title': 'a', 'rating': 3},
+            {'title': 'b', 'rating': 3},
+            {'title': 'b', 'rating': 5}]
+        article.refresh_from_db()
+        assert (article.title, article.rating) == ('b', 5)
+
+    @staticmethod
+    def test_backdated_change():
+        article = _create_article_history()
+
+        _create_article_change(article, 4, title='c')
+
+        snapshots = _get_article_snapshots(article)
+        assert snapshots[2].state == {'title': 'c', 'rating': 3}
+        assert snapshots[4].state == {'title': 'b', 'rating': 5}
+
+    @staticmethod
+    def test_documented_instance():
+        article = _create_article_history()
+
+        snapshot = _get_article_snapshots(article)[2]
+        instance = snapshot.get_documented_instance()
+
+        assert (instance.pk, instance.title, instance.rating) == (
+            article.pk, 'a', 3)
+        # Not the values of the snapshot or the current object
+        assert (instance.created, instance.updated, instance.deleted) == (
+            None, None, None)
+
+
+@pytest.mark.django_db(databases=['default', 'replica'])
+class TestDatabaseAlias:
+    using = 'replica'
+
+    def _create_change(self, article, days, **fields):
+        change = Article.changes.model(
+            article=article, document_is_draft=False,
+            document_date=timezone.now() - timedelta(days=days),
+            document_fields=list(fields), **fields)
+        change.save(using=self.using)
+        return change
+
+    def test_recalculation(self):
+        article = Article.objects.using(self.using).create(title='initial')
+        self._create_change(article, 3, title='a', rating=1)
+        self._create_change(article, 2, rating=2)
+        self._create_change(article, 1, title='b')
+
+        snapshot_model = article.snapshots.model
+        snapshots = list(snapshot_model.objects.using(self.using).filter(
+            article=article).order_by('history_date'))
+        article.refresh_from_db()
+        assert not snapshot_model.objects.exists()
+        assert len(snapshots) == 3
+        assert snapshots[-1].state == {'title': 'b', 'rating': 2}
+        assert (article.title, article.rating) == ('b', 2)
+        assert Article.changes.model.objects.using(self.using).filter(
+            snapshot__isnull=True).count() == 0
+
+    def test_delete(self):
+        article = Article.objects.using(self.using).create(title='initial')
+        self._create_change(article, 1, title='a')
+
+        article.deleted = timezone.now()
+        article.save()
+
+        assert not Article.changes.model.objects.using(self.using).filter(
+            deleted__isnull=True).exists()
+        assert not article.snapshots.model.objects.using(self.using).filter(
+            deleted__isnull=True).exists()
+
+
+class TestPointInTimeReads:
+
+    @staticmethod
+    @pytest.mark.django_db
+    def test_as_of_many():
+        article, other = _create_article_history(), _create_article_history()
+        snapshots = article.snapshots.model.objects
+
+        states = snapshots.as_of_many(
+            [article.pk, other.pk], _days_ago(3))
+
+        assert states == {
+            article.pk: {'title': 'a', 'rating': 3},
+            other.pk: {'title': 'a', 'rating': 3}}
+        assert async_to_sync(snapshots.all().aas_of_many)(
+            [article.pk], _days_ago(2)) == {
+                article.pk: {'title': 'b', 'rating': 3}}
+        assert snapshots.as_of_many([article.pk], _days_ago(6)) == {}
+
+    @staticmethod
+    @pytest.mark.django_db
+    def test_history():
+        article = _create_article_history()
+
+        history = list(article.snapshots.history(date_from=_days_ago(3)))
+
+        async def collect():
+            return [item async for item in article.snapshots.ahistory(
+                date_to=_days_ago(4))]
+
+        assert [state for _, state in history] == [
+            {'title': 'a', 'rating': 3},
+            {'title': 'b', 'rating': 3},
+            {'title': 'b', 'rating': 5}]
+        assert [state for _, state in async_to_sync(collect)()] == [
+            {'title': 'a', 'rating': 1}, {'title': 'a', 'rating': 2}]
+
+    @staticmethod
+    @pytest.mark.django_db
+    def test_aapply_to_object():
+        article = _create_article_history()
+        article.title = 'stale'
+
+        async_to_sync(article.changes.aapply_to_object)(
+            _days_ago(3))
+
+        assert article.title == 'a'
+
+    @staticmethod
+    @pytest.mark.django_db(transaction=True)
+    def test_arecalculate():
+        articles = [_create_article_history() for _ in range(3)]
+        Article.objects.update(title='stale')
+
+        async_to_sync(arecalculate)(articles, concurrency=2)
+
+        assert set(Article.objects.values_list('title', flat=True)) == {'b'}
+
+    @staticmethod
+    @pytest.mark.django_db
+    def test_diff():
+        article, other = _create_article_history(), _create_article_history()
+        created = Article.objects.create(title='initial')
+        _create_article_change(created, 2, title='new')
+        unchanged = _create_article_history()
+        snapshots = article.snapshots.model.objects
+
+        diff = snapshots.diff(
+            [article.pk, other.pk, created.pk],
+            _days_ago(4), _days_ago(2))
+
+        assert diff == {
+            article.pk: {'title': ('a', 'b'), 'rating': (2, 3)},
+            other.pk: {'title': ('a', 'b'), 'rating': (2, 3)},
+            created.pk: {'title': (None, 'new')}}
+        assert async_to_sync(snapshots.all().adiff)(
+            [unchanged.pk], _days_ago(1), _days_ago(0)) == {}
+
+    @staticmethod
+    @pytest.mark.django_db
+    def test_diff_of_documented_model_manager():
+        article, other = _create_article_history(), _create_article_history()
+        expected = {'title': ('a', 'b'), 'rating': (2, 3)}
+
+        diff = Article.snapshots.diff(
+            [article.pk, other.pk], _days_ago(4), _days_ago(2))
+        related_diff = async_to_sync(article.snapshots.all().adiff)(
+            [article.pk, other.pk], _days_ago(4), _days_ago(2))
+
+        assert diff == {article.pk: expected, other.pk: expected}
+        assert related_diff == {article.pk: expected}
+
+    @staticmethod
+    @pytest.mark.django_db
+    def test_diff_full_snapshots():
+        book = _create_book()
+        for days, title in ((3, 'a'), (2, 'b'), (1, 'c')):
+            _create_book_change(
+                document_is_draft=False, book=book, title=title,
+                document_fields=['title'],
+                document_date=timezone.now() - timedelta(days=days))
+
+        diff = BookSnapshot.objects.diff(
+            [book.pk], _days_ago(3), _days_ago(1))
+
+        assert diff == {book.pk: {'title': ('a', 'c')}}
+
+
+@pytest.mark.django_db
+class TestLastChanges:
+
+    @staticmethod
+    def test_last_changes():
+        article = _create_article_history()
+        changes = list(Article.changes.model.objects.filter(
+            article=article).order_by('document_date'))
+        snapshots = _get_article_snapshots(article)
+
+        assert snapshots[0].last_changes == {
+            'title': {
+                'date': changes[0].document_date.isoformat(),
+                'change': str(changes[0].pk)},
+            'rating': {
+                'date': changes[0].document_date.isoformat(),
+                'change': str(changes[0].pk)}}
+        assert snapshots[-1].last_changes['title']['change'] == str(
+            changes[3].pk)
+        assert snapshots[-1].last_changes['rating']['change'] == str(
+            changes[4].pk)
+
+    @staticmethod
+    def test_changed_since():
+        article = _create_article_history()
+        snapshot_model = article.snapshots.model
+        since = (timezone.now() - timedelta(days=2, hours=1)).isoformat()
+
+        snapshots = snapshot_model.objects.filter(
+            article=article, last_changes__rating__date__gte=since)
+
+        assert snapshots.get().rating == 5
+
+    @staticmethod
+    def test_changed_since_uses_index():
+        article = _create_article_history()
+        snapshot_model = article.snapshots.model
+        since = (timezone.now() - timedelta(days=2, hours=1)).isoformat()
+        index_name = next(
+            index.name for index in snapshot_model._meta.indexes  # noqa: protected-access
+            if '_lc_' in index.name)
+
+        snapshots = snapshot_model.objects.alias(
+            rating_date=KT('last_changes__rating__date')).filter(
+                rating_date__gte=since).order_by()
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            plan = snapshots.explain()
+
+        assert index_name in plan
+        assert snapshots.get().rating == 5
+
+    @staticmethod
+    def test_propagation_does_not_read_changes(monkeypatch):
+        article = _create_article_history()
+        changes = list(Article.changes.model.objects.filter(
+            article=article).order_by('document_date'))
+        calls = []
+        monkeypatch.setattr(
+            manager, 'get_change_records',
+            lambda changes_qs: calls.append(changes_qs)
+            or get_change_records(changes_qs))
+
+        changes[1].title = 'x'
+        changes[1].document_fields = ['rating', 'title']
+        changes[1].save()
+
+        last_changes = _get_article_snapshots(article)[2].last_changes
+        assert len(calls) == 1
+        assert last_changes['title']['change'] == str(changes[1].pk)
+        assert last_changes['rating']['change'] == str(changes[2].pk)
+
+    @staticmethod
+    def test_indexes():
+        snapshot_model = Article.changes.model.snapshot.field.related_model
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, snapshot_model._meta.db_table)  # noqa: protected-access
+
+        assert constraints['article_snap_lc']['type'] == 'gin'
+        assert any(
+            name.startswith('article_lc_') for name in constraints)
+
+
+@pytest.mark.django_db
+class TestStateDoc:
+
+    @staticmethod
+    def test_state_doc():
+        article = _create_article_history()
+
+        snapshots = _get_article_snapshots(article)
+
+        assert [snapshot.state_doc for snapshot in snapshots] == [
+            {'title': 'a', 'rating': 1},
+            {'title': 'a', 'rating': 2},
+            {'title': 'a', 'rating': 3},
+            {'title': 'b', 'rating': 3},
+            {'title': 'b', 'rating': 5}]
+
+    @staticmethod
+    def test_state_doc_of_updated_delta():
+        article = _create_article_history()
+        _create_article_change(article, 3, title='c')
+
+        snapshots = _get_article_snapshots(article)
+
+        assert [snapshot.state_doc for snapshot in snapshots] == [
+            snapshot.get_state_doc(snapshot.state) for snapshot in snapshots]
+        assert snapshots[2].state_doc == {'title': 'c', 'rating': 3}
+
+    @staticmethod
+    def test_get_state_doc():
+        book = _create_book()
+
+        assert BaseSnapshot.get_state_doc({
+            'book': book, 'date': date(2020, 1, 2), 'title': 'a'}) == {
+                'book': str(book.pk), 'date': '2020-01-02', 'title': 'a'}
+
+    @staticmethod
+    def test_contains_lookup():
+        article = _create_article_history()
+        snapshot_model = article.snapshots.model
+
+        snapshots = snapshot_model.objects.filter(
+            article=article, state_doc__contains={'title': 'b'})
+
+        assert snapshots.count() == 2
+
+    @staticmethod
+    def test_index():
+        snapshot_model = Article.changes.model.snapshot.field.related_model
+        with connection.cursor() as cursor:
+            constraints = connection.introspection.get_constraints(
+                cursor, snapshot_model._meta.db_table)  # noqa: protected-access
+
+        assert constraints['article_snap_sd']['type'] == 'gin'
+
+
+@pytest.mark.django_db
+class TestSnapshotEngine:
+
+    @staticmethod
+    def test_changes_are_read_as_records():
+        book = _create_book()
+        for days in (3, 2, 1):
+            _create_book_change(
+                document_is_draft=False, book=book, title=f'title {days}',
+                document_date=timezone.now() - timedelta(days=days))
+        instantiated = []
+
+        def receiver(sender, instance, **kwargs):
+            instantiated.append(instance)
+
+        post_init.connect(receiver, sender=BookChange)
+        try:
+            book.changes.apply_to_object()
+        finally:
+            post_init.disconnect(receiver, sender=BookChange)
+
+        # Only the change sent with `change_applied`
+        assert len(instantiated) == 1
+        assert book.title == 'title 1'
+        assert book.snapshots.count() == 3
+
+    @staticmethod
+    def test_raw_state():
+        book = _create_book()
+        change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['author'])
+
+        change.refresh_from_db()
+        snapshot = change.snapshot
+
+        assert snapshot.get_state(raw=True) == {'author': change.author.pk}
+        assert snapshot.state == {'author': change.author}
+
+    @staticmethod
+    def test_change_records_read_referenced_columns():
+        book = _create_book()
+        for fields in (['title'], ['title', 'isbn']):
+            _create_book_change(
+                document_is_draft=False, book=book, document_fields=fields)
+        summary_column = BookChange._meta.get_field('summary').column  # noqa: protected-access
+
+        with CaptureQueriesContext(connection) as queries:
+            records = list(get_change_records(
+                BookChange.objects.filter(book=book).order_by('created')))
+
+        assert len(queries) == 2
+        assert all(summary_column not in query['sql'] for query in queries)
+        assert all(' IN (' not in query['sql'] for query in queries)
+        assert [record.get_snapshot_changes() for record in records] == [
+            {'title': 'title'}, {'title': 'title', 'isbn': 'isbn'}]
+
+    @staticmethod
+    def test_linked_changes_keep_updated():
+        book = _create_book()
+        document_date = timezone.now() - timedelta(minutes=50)
+        first = _create_book_change(
+            document_is_draft=False, book=book, document_date=document_date)
+        first.refresh_from_db()
+
+        second = _create_book_change(
+            document_is_draft=False, book=book,
+            document_date=document_date + timedelta(minutes=5))
+        second.refresh_from_db()
+        updated = BookChange.objects.get(pk=first.pk).updated
+
+        # Only the newly linked change is bumped to the snapshot
+        assert updated == first.updated
+        assert second.snapshot == first.snapshot
+        assert second.updated == second.snapshot.updated
+        assert second.snapshot.updated > updated
@@ -0,0 +1,154 @@
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+
+from django_documents_tools.api.viewsets import (
+    get_change_viewset, get_snapshot_viewset)
+from .test_models import _create_book_change, _create_book
+from .viewsets import BookViewSet
+
+
+def _get_pages(viewset, **params):
+    view = viewset.as_view({'get': 'list'})
+    pages = []
+    while True:
+        request = APIRequestFactory().get('/', params)
+        response = view(request)
+        assert response.status_code == 200
+        pages.append([item['pk'] for item in response.data['results']])
+        if not response.data['next']:
+            return pages
+        next_params = parse_qs(urlparse(response.data['next']).query)
+        params['cursor'] = next_params['cursor'][0]
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('pk_serializers')
+class TestKeysetPagination:
+
+    @staticmethod
+    def test_changes_pages():
+        book = _create_book()
+        document_date = timezone.now()
+        changes = [
+            _create_book_change(
+                document_is_draft=False, book=book,
+                document_date=document_date)
+            for _ in range(5)]
+        viewset = get_change_viewset(BookViewSet)
+
+        pages = _get_pages(viewset, page_size=2)
+
+        assert [len(page) for page in pages] == [2, 2, 1]
+        assert [pk for page in pages for pk in page] == sorted(
+            str(change.pk) for change in changes)
+
+    @staticmethod
+    def test_snapshots_pages():
+        book = _create_book()
+        for days in range(3):
+            _create_book_change(
+                document_is_draft=False, book=book,
+                document_date=timezone.now() - timezone.timedelta(days=days))
+        viewset = get_snapshot_viewset(
+            get_change_viewset(BookViewSet), BookViewSet)
+
+        pages = _get_pages(viewset, page_size=2)
+
+        assert [len(page) for page in pages] == [2, 1]
+
+    @staticmethod
+    def test_no_count():
+        book = _create_book()
+        _create_book_change(document_is_draft=False, book=book)
+        view = get_change_viewset(BookViewSet).as_view({'get': 'list'})
+        request = APIRequestFactory().get('/', {'page_size': 1})
+
+        with CaptureQueriesContext(connection) as context:
+            view(request)
+
+        assert not any(
+            'COUNT(' in query['sql'] for query in context.captured_queries)
+
+    @staticmethod
+    def test_keyset_indexes():
+        change_model = get_change_viewset(
+            BookViewSet).serializer_class.Meta.model
+        snapshot_model = change_model.snapshot.field.related_model
+        for model, name, field in (
+                (change_model, 'book_chg_dp', 'document_date'),
+                (snapshot_model, 'book_snap_hp', 'history_date')):
+            opts = model._meta  # noqa: protected-access
+            with connection.cursor() as cursor:
+                constraints = connection.introspection.get_constraints(
+                    cursor, opts.db_table)
+
+            assert constraints[name]['columns'] == [field, opts.pk.column]
+
+    @staticmethod
+    def test_html_controls():
+        book = _create_book()
+        for _ in range(2):
+            _create_book_change(document_is_draft=False, book=book)
+        view = get_change_viewset(BookViewSet).as_view({'get': 'list'})
+        request = APIRequestFactory().get('/', {'page_size': 1})
+
+        paginator = view(request).renderer_context['view'].paginator
+
+        assert paginator.display_page_controls
+        assert 'cursor=' in paginator.get_html_context()['next_url']
+
+    @staticmethod
+    def test_invalid_cursor():
+        view = get_change_viewset(BookViewSet).as_view({'get': 'list'})
+        request = APIRequestFactory().get(
+            '/', {'page_size': 1, 'cursor': 'foo'})
+
+        assert view(request).status_code == 404
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('pk_serializers')
+class TestPaginationCount:
+
+    @staticmethod
+    def _get_page(settings, **tools_settings):
+        settings.DOCUMENTS_TOOLS = {
+            **settings.DOCUMENTS_TOOLS, **tools_settings}
+        book = _create_book()
+        for _ in range(3):
+            _create_book_change(document_is_draft=False, book=book)
+        view = get_change_viewset(BookViewSet).as_view({'get': 'list'})
+        with CaptureQueriesContext(connection) as context:
+            response = view(APIRequestFactory().get('/', {'page_size': 1}))
+        assert response.status_code == 200
+        return response.data, [
+            query['sql'] for query in context.captured_queries]
+
+    def test_exact(self, settings):
+        data, _ = self._get_page(settings, PAGINATION_COUNT='exact')
+
+        assert data['count'] == 3
+        assert data['count_is_estimated'] is False
+
+    def test_estimated(self, settings):
+        data, queries = self._get_page(
+            settings, PAGINATION_COUNT='estimated',
+            ESTIMATED_COUNT_THRESHOLD=0)
+
+        assert isinstance(data['count'], int)
+        assert data['count_is_estimated'] is True
+        assert any(query.startswith('EXPLAIN') for query in queries)
+        assert not any('COUNT(' in query for query in queries)
+
+    def test_estimated_below_threshold(self, settings):
+        data, _ = self._get_page(
+            settings, PAGINATION_COUNT='estimated',
+            ESTIMATED_COUNT_THRESHOLD=10 ** 9)
+
+        assert data['count'] == 3
+        assert data['count_is_estimated'] is False
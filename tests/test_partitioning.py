@@ -0,0 +1,148 @@
+from datetime import date, datetime
+from unittest import mock
+
+import pytest
+from django.db import connection
+from django.db.migrations import Migration
+from django.db.migrations.writer import MigrationWriter
+
+from django_documents_tools.exceptions import TableIsReferencedError
+from django_documents_tools import partitioning
+from django_documents_tools.partitioning import (
+    PartitionTable, create_partitions, get_partitioning, is_partitioned)
+from .models import Article
+
+ArticleChange = Article.changes.model  # noqa: invalid-name
+
+
+def _create_change(article, document_date):
+    return ArticleChange.objects.create(
+        article=article, document_is_draft=False,
+        document_date=document_date, document_fields=['rating'], rating=1)
+
+
+class _State:
+    apps = Article._meta.apps  # noqa: protected-access
+
+
+def _partition(backwards=False):
+    with connection.cursor() as cursor:
+        # Pending foreign key checks forbid altering the table
+        cursor.execute('SET CONSTRAINTS ALL IMMEDIATE')
+    operation = PartitionTable('articlechange', 'document_date')
+    with connection.schema_editor() as schema_editor:
+        if backwards:
+            operation.database_backwards(
+                'tests', schema_editor, _State(), None)
+        else:
+            operation.database_forwards(
+                'tests', schema_editor, None, _State())
+
+
+def test_get_partitioning():
+    assert ArticleChange._partitioning == {  # noqa: protected-access
+        'field': 'document_date', 'interval': 'month'}
+    assert get_partitioning({'partitioning': None}, 'history_date') is None
+    with pytest.raises(ValueError):
+        get_partitioning({'partitioning': {'interval': 'week'}}, 'a')
+
+
+def test_write_migration():
+    migration = Migration('0002_partition_tables', 'tests')
+    migration.operations = [PartitionTable('articlechange', 'document_date')]
+
+    content = MigrationWriter(migration).as_string()
+
+    assert 'import django_documents_tools.partitioning' in content
+    assert 'django_documents_tools.partitioning.PartitionTable(' in content
+    assert "model_name='articlechange'" in content
+    assert "field_name='document_date'" in content
+
+
+@pytest.mark.django_db
+class TestPartitioning:
+
+    @staticmethod
+    def test_partition_table():
+        article = Article.objects.create(title='title')
+        change = _create_change(article, datetime(2026, 8, 15, 12))
+
+        _partition()
+
+        assert is_partitioned(connection, ArticleChange._meta.db_table)  # noqa: protected-access
+        assert ArticleChange.objects.get(pk=change.pk).rating == 1
+
+    @staticmethod
+    def test_unpartition_table():
+        article = Article.objects.create(title='title')
+        change = _create_change(article, datetime(2026, 8, 15, 12))
+        _partition()
+        create_partitions(ArticleChange, ahead=1, today=date(2026, 10, 19))
+
+        _partition(backwards=True)
+
+        assert PartitionTable.reversible
+        assert not is_partitioned(connection, ArticleChange._meta.db_table)  # noqa: protected-access
+        assert ArticleChange.objects.get(pk=change.pk).rating == 1
+
+    @staticmethod
+    def test_referenced_table():
+        table = ArticleChange._meta.db_table  # noqa: protected-access
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE change_ref (change_id uuid '
+                f'REFERENCES {connection.ops.quote_name(table)})')
+
+        with pytest.raises(TableIsReferencedError, match='change_ref'):
+            _partition()
+
+    @staticmethod
+    def test_create_partitions():
+        article = Article.objects.create(title='title')
+        _create_change(article, datetime(2026, 8, 15, 12))
+        _partition()
+
+        created = create_partitions(
+            ArticleChange, ahead=1, today=date(2026, 10, 19))
+
+        table = ArticleChange._meta.db_table  # noqa: protected-access
+        assert created == [
+            f'{table}_p202608', f'{table}_p202609', f'{table}_p202610',
+            f'{table}_p202611']
+        assert create_partitions(
+            ArticleChange, ahead=1, today=date(2026, 10, 19)) == []
+
+        _create_change(article, datetime(2026, 10, 2, 12))
+        queryset = ArticleChange.objects.filter(
+            document_date__gte=date(2026, 10, 1),
+            document_date__lt=date(2026, 10, 3))
+        plan = queryset.explain()
+        assert f'{table}_p202610' in plan
+        assert f'{table}_p202608' not in plan
+        assert f'{table}_default' not in plan
+        assert queryset.count() == 1
+
+    @staticmethod
+    def test_partitions_are_committed_one_by_one():
+        _partition()
+        create_partition = partitioning._create_partition  # noqa: protected-access
+
+        def fail_second(cursor, quote, table, column, name, start, end):
+            if start.month == 11:
+                raise RuntimeError(name)
+            create_partition(cursor, quote, table, column, name, start, end)
+
+        with mock.patch.object(
+                partitioning, '_create_partition', fail_second):
+            with pytest.raises(RuntimeError):
+                create_partitions(
+                    ArticleChange, ahead=1, today=date(2026, 10, 19))
+
+        table = ArticleChange._meta.db_table  # noqa: protected-access
+        assert create_partitions(
+            ArticleChange, ahead=1, today=date(2026, 10, 19)) == [
+                f'{table}_p202611']
+
+    @staticmethod
+    def test_not_partitioned_table():
+        assert create_partitions(ArticleChange) == []
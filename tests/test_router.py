@@ -0,0 +1,62 @@
+import pytest
+from rest_framework.test import APIRequestFactory
+
+from django_documents_tools.api.router import DocumentedRouter
+from django_documents_tools.api.mixins import AsOfMixin
+from django_documents_tools.api.viewsets import get_change_viewset
+from tests.viewsets import BookViewSet
+
+
+def _get_urls(lazy):
+    router = DocumentedRouter(lazy=lazy)
+    router.register('book-list', BookViewSet, 'book')
+    return router.urls
+
+
+def _get_callback(urls, name):
+    return next(url.callback for url in urls if url.name == name)
+
+
+class TestLazyRouter:
+
+    @staticmethod
+    def test_same_routes():
+        eager_urls = _get_urls(lazy=False)
+        lazy_urls = _get_urls(lazy=True)
+
+        assert [(str(url.pattern), url.name) for url in lazy_urls] == [
+            (str(url.pattern), url.name) for url in eager_urls]
+
+    @staticmethod
+    def test_resolve_viewset_on_access():
+        callback = _get_callback(_get_urls(lazy=True), 'bookchange-list')
+
+        assert callback.actions == {'get': 'list', 'post': 'create'}
+        assert callback.cls is get_change_viewset(BookViewSet)
+
+    @staticmethod
+    @pytest.mark.django_db
+    def test_dispatch():
+        callback = _get_callback(_get_urls(lazy=True), 'bookchange-list')
+        request = APIRequestFactory().get('/bookchange-list/')
+
+        response = callback(request)
+
+        assert response.status_code == 200
+
+
+class TestAsOfRouting:
+
+    @staticmethod
+    def _get_book_viewset(viewset):
+        router = DocumentedRouter()
+        router.register('book-list', viewset, 'book')
+        return _get_callback(router.urls, 'book-list').cls
+
+    def test_opt_in(self):
+        as_of_viewset = type(
+            'AsOfBookViewSet', (BookViewSet, ), {'allow_as_of': True})
+
+        assert not issubclass(
+            self._get_book_viewset(BookViewSet), AsOfMixin)
+        assert issubclass(self._get_book_viewset(as_of_viewset), AsOfMixin)
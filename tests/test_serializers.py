@@ -2,6 +2,7 @@ from unittest import mock
 
 import pytest
 from django.core.exceptions import ValidationError
+from django.db.models import UniqueConstraint
 from django.test import override_settings
 from rest_framework.fields import CharField
 
@@ -11,12 +12,13 @@ from django_documents_tools.api.serializers import (
     get_change_attachment_serializer, BaseChangeSerializer,
     BaseSnapshotSerializer, BaseDocumentedModelLinkSerializer,
     BaseChangeAttachmentSerializer)
-from django_documents_tools.utils import validate_change_attrs
+from django_documents_tools.utils import (
+    _validate_documented_copy, validate_change_attrs)
 from .serializers import (
     BookSerializer, CustomChangeSerializer, CustomSnapshotSerializer,
     CustomDocumentedModelLinkSerializer, CustomChangeAttachmentSerializer)
 from .models import Book
-from .test_models import _create_book_change, _create_book
+from .test_models import _create_author, _create_book_change, _create_book
 
 UNKNOWN_SERIALIZER_PATH = 'tests.serializers.UnknownBookSerializer'
 
@@ -365,3 +367,44 @@ class TestValidateChangeSerializer:
         with pytest.raises(ValidationError) as exc_info:
             self.validate(book_change, kwargs)
         assert exc_info.value.message_dict == self.ERROR_MESSAGE
+
+
+@pytest.mark.django_db
+class TestLightweightValidateChangeSerializer(TestValidateChangeSerializer):
+
+    def validate(self, change, attrs):
+        with override_settings(DOCUMENTS_TOOLS={
+                'CREATE_BUSINESS_ENTITY_AFTER_CHANGE_CREATED': True,
+                'LIGHTWEIGHT_CHANGE_VALIDATION': True}):
+            super().validate(change, attrs)
+
+    def test_documented_instance_is_not_touched(
+            self, django_assert_num_queries):
+        book = _create_book()
+        book_change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'],
+            title='new_title')
+        book_change.book.title = 'old_title'
+        assert book_change.snapshot
+        kwargs = {'title': None, 'document_fields': ['title']}
+
+        with django_assert_num_queries(0):
+            with pytest.raises(ValidationError) as exc_info:
+                self.validate(book_change, kwargs)
+        assert exc_info.value.message_dict == self.ERROR_MESSAGE
+        assert book_change.book.title == 'old_title'
+
+    @staticmethod
+    @pytest.mark.parametrize('option, value', [
+        ('unique_together', (('title', 'isbn'),)),
+        ('constraints', [UniqueConstraint(
+            fields=('title', 'isbn'), name='book_title_isbn')]),
+    ])
+    def test_unique_check_of_partly_changed_fields(option, value):
+        author = _create_author()
+        Book.objects.create(title='title', isbn='1', author=author)
+        book = Book.objects.create(title='title', isbn='2', author=author)
+
+        with mock.patch.object(Book._meta, option, value):  # noqa: protected-access
+            with pytest.raises(ValidationError):
+                _validate_documented_copy(book, {'isbn': '1'}, ['isbn'])
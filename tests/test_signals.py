@@ -0,0 +1,203 @@
+from unittest import mock
+
+import pytest
+from django.apps import apps
+from django.db import migrations, models
+from django.db.models.signals import post_migrate
+from django.utils import timezone
+
+from django_documents_tools.signals import _process_operation
+from .models import Article, Book
+from .test_models import _create_book_change, _create_book
+
+
+BookChange = Book.changes.model  # noqa: invalid-name
+BookSnapshot = (                 # noqa: invalid-name
+    BookChange.snapshot.field.remote_field.model)
+ArticleChange = Article.changes.model  # noqa: invalid-name
+ArticleSnapshot = ArticleChange.snapshot.field.related_model  # noqa: invalid-name
+
+
+def _add_summary_field():
+    operation = migrations.AddField(
+        model_name='book', name='summary', field=models.TextField())
+    _process_operation(apps, 'tests', operation)
+
+
+def _forget_summary():
+    BookSnapshot.objects.update(summary=None, document_fields=['title'])
+
+
+@pytest.mark.django_db
+class TestAddFieldBackfill:
+
+    @staticmethod
+    def test_copy_current_value_to_latest_snapshot():
+        book = _create_book()
+        change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'])
+        _forget_summary()
+        Book.objects.filter(pk=book.pk).update(summary='current')
+
+        _add_summary_field()
+
+        snapshot = BookSnapshot.objects.get(pk=change.snapshot.pk)
+        assert snapshot.summary == 'current'
+        assert snapshot.state['summary'] == 'current'
+        assert 'summary' in snapshot.document_fields
+
+    @staticmethod
+    def test_is_idempotent():
+        book = _create_book()
+        change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'])
+        _forget_summary()
+
+        _add_summary_field()
+        _add_summary_field()
+
+        snapshot = BookSnapshot.objects.get(pk=change.snapshot.pk)
+        assert snapshot.document_fields.count('summary') == 1
+
+    @staticmethod
+    def test_default_strategy():
+        book = _create_book()
+        change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'])
+        _forget_summary()
+
+        with mock.patch.object(
+                BookSnapshot, '_add_field_backfill', {'summary': 'default'}):
+            _add_summary_field()
+
+        snapshot = BookSnapshot.objects.get(pk=change.snapshot.pk)
+        assert snapshot.summary == ''
+        assert 'summary' in snapshot.document_fields
+
+    @staticmethod
+    def test_default_strategy_skips_deleted_snapshots():
+        book = _create_book()
+        change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'])
+        _forget_summary()
+        BookSnapshot.objects.update(deleted=timezone.now())
+
+        with mock.patch.object(
+                BookSnapshot, '_add_field_backfill', {'summary': 'default'}):
+            _add_summary_field()
+
+        snapshot = BookSnapshot.objects.get(pk=change.snapshot.pk)
+        assert snapshot.summary is None
+        assert snapshot.document_fields == ['title']
+
+    @staticmethod
+    def test_skip_not_documented_field():
+        book = _create_book()
+        change = _create_book_change(
+            document_is_draft=False, book=book, document_fields=['title'])
+        _forget_summary()
+
+        operation = migrations.AddField(
+            model_name='book', name='updated', field=models.DateTimeField())
+        _process_operation(apps, 'tests', operation)
+
+        snapshot = BookSnapshot.objects.get(pk=change.snapshot.pk)
+        assert snapshot.document_fields == ['title']
+
+
+def _create_article_snapshot():
+    article = Article.objects.create(title='initial')
+    change = ArticleChange.objects.create(
+        article=article, document_is_draft=False, title='a', rating=1,
+        document_date=timezone.now(), document_fields=['title', 'rating'])
+    return article, ArticleSnapshot.objects.get(pk=change.snapshot_id)
+
+
+@pytest.mark.django_db
+class TestStateDocSync:
+
+    @staticmethod
+    def test_add_field():
+        article, snapshot = _create_article_snapshot()
+        ArticleSnapshot.objects.update(
+            rating=None, document_fields=['title'], state_doc={'title': 'a'})
+        Article.objects.filter(pk=article.pk).update(rating=7)
+
+        _process_operation(apps, 'tests', migrations.AddField(
+            model_name='article', name='rating',
+            field=models.IntegerField(null=True)))
+
+        snapshot.refresh_from_db()
+        assert snapshot.state_doc == {'title': 'a', 'rating': 7}
+
+    @staticmethod
+    def test_add_field_encoded_as_state_doc():
+        article, snapshot = _create_article_snapshot()
+        ArticleSnapshot.objects.update(
+            rating=None, document_fields=['title'], state_doc={'title': 'a'})
+        Article.objects.filter(pk=article.pk).update(rating=7)
+
+        def get_state_doc(state):
+            return {name: str(value) for name, value in state.items()}
+
+        with mock.patch.object(
+                ArticleSnapshot, 'get_state_doc', staticmethod(get_state_doc)):
+            _process_operation(apps, 'tests', migrations.AddField(
+                model_name='article', name='rating',
+                field=models.IntegerField(null=True)))
+
+        snapshot.refresh_from_db()
+        assert snapshot.state_doc == {'title': 'a', 'rating': '7'}
+
+    @staticmethod
+    def test_add_field_default_strategy():
+        _, snapshot = _create_article_snapshot()
+        ArticleSnapshot.objects.update(
+            rating=None, document_fields=['title'], state_doc={'title': 'a'})
+
+        with mock.patch.object(
+                ArticleSnapshot, '_add_field_backfill',
+                {'rating': 'default'}):
+            _process_operation(apps, 'tests', migrations.AddField(
+                model_name='article', name='rating',
+                field=models.IntegerField(null=True)))
+
+        snapshot.refresh_from_db()
+        assert snapshot.state_doc == {'title': 'a', 'rating': None}
+
+    @staticmethod
+    def test_rename_field():
+        _, snapshot = _create_article_snapshot()
+
+        _process_operation(apps, 'tests', migrations.RenameField(
+            model_name='article', old_name='rating', new_name='score'))
+
+        snapshot.refresh_from_db()
+        assert snapshot.state_doc == {'title': 'a', 'score': 1}
+
+    @staticmethod
+    def test_remove_field():
+        _, snapshot = _create_article_snapshot()
+
+        _process_operation(apps, 'tests', migrations.RemoveField(
+            model_name='article', name='rating'))
+
+        snapshot.refresh_from_db()
+        assert snapshot.state_doc == {'title': 'a'}
+
+
+@pytest.mark.django_db
+def test_migrate_plan_is_processed_once():
+    migration = migrations.Migration('0002_book_summary', 'tests')
+    migration.operations = [migrations.AddField(
+        model_name='book', name='summary', field=models.TextField())]
+
+    with mock.patch(
+            'django_documents_tools.signals._process_operation') as process:
+        for app_config in apps.get_app_configs():
+            post_migrate.send(
+                sender=app_config, app_config=app_config, apps=apps,
+                plan=[(migration, False)], using='default')
+
+    process.assert_called_once_with(
+        apps, 'tests', migration.operations[0], using='default')
@@ -0,0 +1,74 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+
+from django_documents_tools.state_docs import (
+    backfill_state_docs, get_state_doc_models)
+from .models import Article
+from .test_models import (
+    _create_article_history, _days_ago, _get_article_snapshots)
+
+
+ArticleSnapshot = Article.changes.model.snapshot.field.related_model  # noqa: invalid-name
+
+
+@pytest.mark.django_db
+class TestStateDocs:
+
+    @staticmethod
+    def test_state_doc_models():
+        assert get_state_doc_models() == [ArticleSnapshot]
+
+    @staticmethod
+    def test_backfill():
+        article = _create_article_history()
+        expected = [
+            snapshot.state_doc for snapshot in _get_article_snapshots(article)]
+        ArticleSnapshot.objects.update(state_doc={})
+
+        assert backfill_state_docs(ArticleSnapshot, batch_size=2) == 5
+        assert [
+            snapshot.state_doc for snapshot in
+            _get_article_snapshots(article)] == expected
+        assert backfill_state_docs(ArticleSnapshot) == 0
+
+    @staticmethod
+    def test_command():
+        article = _create_article_history()
+        ArticleSnapshot.objects.update(state_doc={})
+
+        call_command('backfill_state_docs')
+
+        assert _get_article_snapshots(article)[-1].state_doc == {
+            'title': 'b', 'rating': 5}
+
+    @staticmethod
+    def test_as_of_docs():
+        article, empty = (
+            _create_article_history(), _create_article_history())
+        ArticleSnapshot.objects.filter(article=empty).update(state_doc={})
+        snapshots = ArticleSnapshot.objects
+
+        docs = snapshots.as_of_docs([article.pk, empty.pk], _days_ago(3))
+
+        assert docs == snapshots.as_of_many(
+            [article.pk, empty.pk], _days_ago(3))
+        assert docs[empty.pk] == {'title': 'a', 'rating': 3}
+        assert async_to_sync(snapshots.all().aas_of_docs)(
+            [empty.pk], _days_ago(2)) == {
+                empty.pk: {'title': 'b', 'rating': 3}}
+
+    @staticmethod
+    def test_diff_docs():
+        article, empty = (
+            _create_article_history(), _create_article_history())
+        ArticleSnapshot.objects.filter(article=empty).update(state_doc={})
+        snapshots = ArticleSnapshot.objects
+        expected = {'title': ('a', 'b'), 'rating': (2, 3)}
+
+        diff = snapshots.diff_docs(
+            [article.pk, empty.pk], _days_ago(4), _days_ago(2))
+
+        assert diff == {article.pk: expected, empty.pk: expected}
+        assert async_to_sync(snapshots.all().adiff_docs)(
+            [empty.pk], _days_ago(4), _days_ago(2)) == {empty.pk: expected}
@@ -1,17 +1,31 @@
 from unittest import mock
 
 import pytest
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
 
+from django_documents_tools.api.mixins import ReadReplicaMixin
 from django_documents_tools.api.viewsets import (
     get_change_viewset, get_snapshot_viewset, get_change_attachment_viewset,
     BaseChangeViewSet, BaseSnapshotViewSet, BaseChangeAttachmentViewSet)
+from django_documents_tools.routing import (
+    get_read_db, get_write_db, request_scope, unpin_from_primary)
+from django_documents_tools.utils import (
+    clear_factories_cache, get_factories_report)
+from tests.models import Book
+from tests.test_models import _create_book_change, _create_book
 from tests.viewsets import (
     BookViewSet, CustomBookChangeViewSet, CustomBookSnapshotViewSet,
     CustomBookChangeAttachmentViewSet)
 
 
 UNKNOWN_VIEWSET_PATH = 'tests.viewsets.UnknownBookViewSet'
+BookChange = Book.changes.model  # noqa: invalid-name
+BookSnapshot = BookChange.snapshot.field.related_model  # noqa: invalid-name
+BookChangeAttachment = (  # noqa: invalid-name
+    BookChange.attachment.field.related_model)
 
 
 class TestGetChangeViewSet:
@@ -42,7 +56,8 @@ class TestGetChangeViewSet:
         assert book_change_viewset.select_related_fields == ('book', 'author')
         assert book_change_viewset.lookup_field == 'uid'
         assert book_change_viewset.lookup_url_kwarg == 'guid'
-        assert book_change_viewset.prefetch_related_fields == ['test']
+        assert book_change_viewset.prefetch_related_fields == [
+            'attachment']
 
     def test_get_unknown(self):
         custom_settings = {
@@ -64,7 +79,8 @@ class TestGetChangeViewSet:
         assert book_change_viewset.select_related_fields == ('book', 'author')
         assert book_change_viewset.lookup_field == 'uid'
         assert book_change_viewset.lookup_url_kwarg == 'guid'
-        assert book_change_viewset.prefetch_related_fields == ['test']
+        assert book_change_viewset.prefetch_related_fields == [
+            'attachment']
 
 
 class TestGetSnapshotViewSet:
@@ -101,7 +117,7 @@ class TestGetSnapshotViewSet:
             'book', 'author')
         assert book_snapshot_viewset.lookup_field == 'uid'
         assert book_snapshot_viewset.lookup_url_kwarg == 'guid'
-        assert book_snapshot_viewset.prefetch_related_fields == ['test']
+        assert book_snapshot_viewset.prefetch_related_fields == ['changes']
 
     def test_get_unknown(self):
         custom_settings = {
@@ -128,7 +144,7 @@ class TestGetSnapshotViewSet:
             'book', 'author')
         assert book_snapshot_viewset.lookup_field == 'uid'
         assert book_snapshot_viewset.lookup_url_kwarg == 'guid'
-        assert book_snapshot_viewset.prefetch_related_fields == ['test']
+        assert book_snapshot_viewset.prefetch_related_fields == ['changes']
 
 
 class TestGetChangeAttachmentViewSet:
@@ -168,7 +184,7 @@ class TestGetChangeAttachmentViewSet:
         assert book_change_attachment_viewset.lookup_field == 'uid'
         assert book_change_attachment_viewset.lookup_url_kwarg == 'guid'
         assert book_change_attachment_viewset.prefetch_related_fields == [
-            'test']
+            'change']
 
     def test_get_unknown(self):
         custom_settings = {
@@ -197,4 +213,156 @@ class TestGetChangeAttachmentViewSet:
         assert book_change_attachment_viewset.lookup_field == 'uid'
         assert book_change_attachment_viewset.lookup_url_kwarg == 'guid'
         assert book_change_attachment_viewset.prefetch_related_fields == [
-            'test']
+            'change']
+
+
+class TestViewSetsMemoization:
+
+    @staticmethod
+    def test_shared_classes():
+        change_viewset = get_change_viewset(BookViewSet)
+
+        assert get_change_viewset(BookViewSet) is change_viewset
+        assert get_snapshot_viewset(
+            change_viewset, BookViewSet) is get_snapshot_viewset(
+                change_viewset, BookViewSet)
+        assert get_change_attachment_viewset(
+            change_viewset) is get_change_attachment_viewset(change_viewset)
+
+    @staticmethod
+    def test_report():
+        clear_factories_cache()
+
+        get_change_viewset(BookViewSet)
+        get_change_viewset(BookViewSet)
+
+        report = get_factories_report()
+        assert report['create_change_viewset']['calls'] == 2
+        assert report['create_change_viewset']['builds'] == 1
+        assert report['create_change_serializer_class']['builds'] == 1
+        assert report['create_change_filter']['builds'] == 1
+
+
+def _create_book_changes(count):
+    for _ in range(count):
+        attachment = BookChangeAttachment.objects.create(file='test.pdf')
+        change = _create_book_change(
+            document_is_draft=False, book=_create_book())
+        change.attachment = attachment
+        change.save()
+
+
+def _list(viewset, **params):
+    request = APIRequestFactory().get('/', params)
+    return viewset.as_view({'get': 'list'})(request)
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('pk_serializers')
+class TestQueriesCount:
+
+    @staticmethod
+    def _get_queries_count(viewset, count):
+        _create_book_changes(count)
+        with CaptureQueriesContext(connection) as context:
+            response = _list(viewset)
+        assert response.status_code == 200
+        return len(context.captured_queries)
+
+    def test_change_list(self):
+        viewset = get_change_viewset(BookViewSet)
+        assert self._get_queries_count(viewset, 1) == (
+            self._get_queries_count(viewset, 5))
+
+    def test_snapshot_list(self):
+        viewset = get_snapshot_viewset(
+            get_change_viewset(BookViewSet), BookViewSet)
+        assert self._get_queries_count(viewset, 1) == (
+            self._get_queries_count(viewset, 5))
+
+    @staticmethod
+    def test_related_fields():
+        viewset = get_change_viewset(BookViewSet)
+
+        assert viewset().get_related_fields() == (
+            ('book', 'author', 'attachment', 'snapshot'), ())
+
+
+@pytest.mark.django_db(databases=['default', 'replica'])
+@pytest.mark.usefixtures('pk_serializers')
+class TestReadReplica:
+
+    @staticmethod
+    @pytest.fixture(autouse=True)
+    def replica(monkeypatch):
+        for model in (BookChange, BookSnapshot):
+            monkeypatch.setattr(model, '_read_db', 'replica')
+        yield
+        unpin_from_primary()
+
+    @staticmethod
+    def test_history_reads():
+        change = _create_book_change(
+            document_is_draft=False, book=_create_book())
+
+        assert change.snapshot_or_none
+        assert change.book.changes.count() == 0
+        assert change.book.changes.primary().count() == 1
+        assert Book.changes.filter(pk=change.pk).db == 'replica'
+
+    @staticmethod
+    def test_list_reads_replica():
+        _create_book_changes(1)
+
+        response = _list(get_change_viewset(BookViewSet))
+
+        assert response.status_code == 200
+        assert response.data == []
+
+    @staticmethod
+    def test_sticky_after_write(monkeypatch):
+        monkeypatch.setattr(BookChange, '_sticky_after_write', True)
+        change = _create_book_change(
+            document_is_draft=False, book=_create_book())
+        assert change.book.changes.count() == 1
+        unpin_from_primary()
+        assert change.book.changes.count() == 0
+
+        change.book.changes.update(document_name='name')
+
+        assert change.book.changes.count() == 1
+
+    @staticmethod
+    def test_pin_is_released_on_commit(
+            monkeypatch, django_capture_on_commit_callbacks):
+        monkeypatch.setattr(BookChange, '_sticky_after_write', True)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            get_write_db(BookChange)
+            assert get_read_db(BookChange) is None
+
+        assert get_read_db(BookChange) == 'replica'
+
+    @staticmethod
+    def test_pin_lasts_to_end_of_request(
+            monkeypatch, django_capture_on_commit_callbacks):
+        monkeypatch.setattr(BookChange, '_sticky_after_write', True)
+
+        with django_capture_on_commit_callbacks() as callbacks:
+            with request_scope():
+                get_write_db(BookChange)
+                assert get_read_db(BookChange) is None
+
+        assert not callbacks
+        assert get_read_db(BookChange) == 'replica'
+
+    @staticmethod
+    def test_sticky_cookie():
+        _create_book_changes(1)
+        request = APIRequestFactory().get('/')
+        request.COOKIES[ReadReplicaMixin.sticky_cookie_name] = '1'
+
+        response = get_change_viewset(BookViewSet).as_view(
+            {'get': 'list'})(request)
+
+        assert len(response.data) == 1
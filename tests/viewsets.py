@@ -21,17 +21,17 @@ class BookViewSet(ModelViewSet):
 
 class CustomBookChangeViewSet(BaseChangeViewSet):
     # Custom viewset attribute
-    prefetch_related_fields = ['test']
+    prefetch_related_fields = ['attachment']
 
 
 class CustomBookSnapshotViewSet(BaseSnapshotViewSet):
     # Custom viewset attribute
-    prefetch_related_fields = ['test']
+    prefetch_related_fields = ['changes']
 
 
 class CustomBookChangeAttachmentViewSet(BaseChangeAttachmentViewSet):
     # Custom viewset attribute
-    prefetch_related_fields = ['test']
+    prefetch_related_fields = ['change']
 
 
 class UnknownBookViewSet(ModelViewSet):